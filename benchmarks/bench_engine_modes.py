@@ -0,0 +1,101 @@
+"""
+Transcreation エンジンのモード比較ベンチマーク (per_item vs multilang, 任意で batched)
+
+同じメニュー・同じ言語セットで各モードを実行し、呼び出し回数・入出力トークン・コスト・所要時間を比較する。
+実際に Gemini を呼ぶので GEMINI_API_KEY が必要。
+
+Usage:
+    GEMINI_API_KEY=... python benchmarks/bench_engine_modes.py \
+        --csv resources/ぴえろっと_short.csv --limit 5 --modes per_item multilang
+"""
+import argparse
+import asyncio
+import csv
+import os
+import sys
+import time
+
+# Rootのモジュールを読み込めるようにする
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.csv_utils import extract_menu_rows
+from src.langchain_utils import ENGINE_MODES, translate_english_to_many_async
+from src.models import MenuItem
+from src.observability import get_usage_totals, reset_usage_totals
+from src.personas import PERSONA_DEFINITIONS
+from src.qc_rules import get_qc_gate_stats, reset_qc_gate_stats
+
+
+def load_items(csv_path: str, limit: int):
+    with open(csv_path, encoding="utf-8-sig") as f:
+        pairs = extract_menu_rows(list(csv.reader(f)), ["キーワードは無し(メニューのみ翻訳)"])
+    return [MenuItem(menu_title=title, menu_content=content) for title, content in pairs[:limit]]
+
+
+def run_mode(mode: str, items, languages, api_key: str, max_concurrency: int) -> dict:
+    reset_usage_totals()
+    reset_qc_gate_stats()
+    started = time.perf_counter()
+    results = asyncio.run(translate_english_to_many_async(
+        menu_items=items,
+        target_languages={lang: [] for lang in languages},
+        api_key=api_key,
+        max_concurrency=max_concurrency,
+        engine_mode=mode,
+    ))
+    elapsed = time.perf_counter() - started
+
+    totals = get_usage_totals()
+    pending = sum(
+        1 for lang_items in results.values() for it in lang_items
+        if not it.is_translated
+    )
+    return {
+        "mode": mode,
+        "calls": sum(v["calls"] for v in totals.values()),
+        "tokens_in": sum(v["tokens_in"] for v in totals.values()),
+        "tokens_out": sum(v["tokens_out"] for v in totals.values()),
+        "cost_jpy": sum(v["cost_jpy"] for v in totals.values()),
+        "seconds": elapsed,
+        "pending": pending,
+        "qc_avoided": get_qc_gate_stats()["audits_avoided_ratio"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default="resources/ぴえろっと_short.csv")
+    parser.add_argument("--limit", type=int, default=5, help="対象メニュー数の上限")
+    parser.add_argument("--languages", nargs="*", default=list(PERSONA_DEFINITIONS.keys()))
+    parser.add_argument("--modes", nargs="*", default=["per_item", "multilang"], choices=list(ENGINE_MODES))
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        sys.exit("GEMINI_API_KEY not set")
+
+    items = load_items(args.csv, args.limit)
+    print(f"{len(items)} items x {len(args.languages)} languages ({args.csv})")
+
+    rows = [run_mode(mode, items, args.languages, api_key, args.max_concurrency) for mode in args.modes]
+
+    header = f"{'mode':<10} {'calls':>6} {'tok_in':>9} {'tok_out':>9} {'cost_jpy':>9} {'seconds':>8} {'pending':>8} {'qc_avoid':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(f"{r['mode']:<10} {r['calls']:>6} {r['tokens_in']:>9} {r['tokens_out']:>9} {r['cost_jpy']:>9.2f} {r['seconds']:>8.1f} {r['pending']:>8} {r['qc_avoided']:>8.0%}")
+
+    base = rows[0]
+    for r in rows[1:]:
+        if base["tokens_in"] and base["seconds"]:
+            print(
+                f"{r['mode']} vs {base['mode']}: "
+                f"tokens_in x{r['tokens_in'] / base['tokens_in']:.2f}, "
+                f"calls x{r['calls'] / max(base['calls'], 1):.2f}, "
+                f"latency x{r['seconds'] / base['seconds']:.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+"""
+パイプライン全体のスループット・ベンチマーク (オフライン / fake Gemini)
+
+LLM_PROVIDER=fake で llm_pool が FakeChatModel を返すようにし、API キーもネットワークも使わずに
+各ステージ (校正 / 英訳 / Transcreation の各エンジンモード / 画像抽出 / Phase 1 API) を
+並列度ごとに実行して、スループットと遅延分布を比較する。
+遅延・エラー率・429 率・壊れた JSON の割合はオプション (または FAKE_LLM_* 環境変数) で変えられる。
+
+集計項目:
+    units/s     : 1秒あたりの完了単位数 (メニュー item、画像ステージはページ)
+    unit p50-99 : 開始から各単位が完了するまでの時間の分位点 (秒)
+    call p50-99 : fake API 1呼び出しの遅延の分位点 (秒)
+    calls/unit  : 1単位あたりの API 呼び出し数 (リトライ・QC 監査・ヘッジを含む)
+    errors/429  : fake が返した 5xx・429 の数
+    tmo         : 呼び出し期限 (--call-timeout) 切れの数
+    hedged/won  : ヘッジで出した複製リクエスト数 / そのうち先に返った数
+    fixed       : 壊れた JSON を llm_json が修復して読めた応答数 (= 再生成せずに済んだ呼び出し)
+    in/call     : 1呼び出しあたりの入力トークン (JSON スキーマ経路はスキーマぶんを含む)
+    pfail       : 期待した形で読めなかった応答の割合 (出力形式ごとの集計, structured_output)
+
+end_to_end は 校正 → 英訳 → 多言語 を、段ごとに全件を待つ従来の実行 (barrier) と
+item ごとに次の段へ流すパイプライン実行 (pipelined, translation_pipeline) で並べる。
+
+--hedge off on で同じ条件のヘッジ無し / 有りを並べ、unit p95/p99 の差でテール削減効果を見る。
+--structured off on で出力形式の説明をプロンプトに埋め込む従来経路と JSON スキーマ経路を並べ、
+in/call と pfail の差を見る (壊れ方は --malformed-rate / --schema-malformed-rate で別々に与える)。
+
+Usage:
+    python benchmarks/bench_pipeline.py --csv resources/ぴえろっと_long.csv --limit 40 \
+        --concurrency 1 4 8 16 --latency-ms 800 --rate-limit-rate 0.02
+    python benchmarks/bench_pipeline.py --stages transcreation --modes per_item --latency-sigma 1.2 --hedge off on
+    python benchmarks/bench_pipeline.py --stages transcreation --modes per_item batched multilang
+    python benchmarks/bench_pipeline.py --stages cleanup vision --structured off on --malformed-rate 0.05
+    python benchmarks/bench_pipeline.py --stages end_to_end --modes per_item --concurrency 8 --limit 40
+"""
+import argparse
+import asyncio
+import csv
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Rootのモジュールを読み込めるようにする
+sys.path.append(ROOT)
+
+STAGES = ("cleanup", "ja_to_en", "transcreation", "end_to_end", "vision", "phase1_full_page", "api_intake", "api_demo")
+# 1x1 の PNG (fake は画像の中身を見ないので何でもよい)
+DUMMY_IMAGE = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000100e221bc330000000049454e44ae426082"
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default="resources/ぴえろっと_short.csv")
+    parser.add_argument("--limit", type=int, default=20, help="対象メニュー数の上限")
+    # main.py と同じ日本語名を混ぜる (QC・ペルソナ・辞書が両方の名前で引けることも確かめる)
+    parser.add_argument("--languages", nargs="*", default=["English", "中国語", "韓国語", "タイ語"])
+    parser.add_argument("--stages", nargs="*", default=list(STAGES), choices=STAGES)
+    parser.add_argument("--modes", nargs="*", default=["per_item", "batched", "multilang"])
+    parser.add_argument("--concurrency", nargs="*", type=int, default=[1, 4, 8, 16])
+    parser.add_argument("--pages", type=int, default=8, help="画像ステージのページ数")
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="1呼び出しの遅延の中央値")
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--ms-per-output-token", type=float, default=4.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--schema-malformed-rate", type=float, default=0.0, help="JSON スキーマ経路で壊れた JSON を返す割合")
+    parser.add_argument("--qc-fail-rate", type=float, default=0.0)
+    parser.add_argument("--vision-items", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--rpm", type=int, default=100000, help="レートリミッタの RPM (既定は実質無制限)")
+    parser.add_argument("--tpm", type=int, default=100000000)
+    parser.add_argument("--retry-base-delay", type=float, default=0.05)
+    parser.add_argument("--use-dictionary", action="store_true", help="メニュー辞書のヒットを有効にする")
+    parser.add_argument("--call-timeout", type=float, default=60.0, help="1呼び出しの期限 (秒, 0 で無効)")
+    parser.add_argument("--hedge", nargs="*", default=["off"], choices=["off", "on"], help="ヘッジ無し / 有りを計測する")
+    parser.add_argument("--hedge-ratio", type=float, default=0.05, help="ヘッジの追加呼び出し上限 (通常呼び出しに対する比率)")
+    parser.add_argument("--hedge-min-delay", type=float, default=0.2)
+    parser.add_argument("--structured", nargs="*", default=["off"], choices=["off", "on"], help="出力形式の説明 / JSON スキーマ経路を計測する")
+    parser.add_argument("--log-dir", default=None, help="API ログの出力先 (既定は一時ディレクトリ)")
+    return parser.parse_args()
+
+
+def configure_env(args):
+    """src を import する前に環境変数を決める (各モジュールは import 時に読む)"""
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ["LLM_CACHE_ENABLED"] = "0"
+    os.environ.setdefault("GEMINI_API_KEY", "fake-key")
+    os.environ["GEMINI_RPM"] = str(args.rpm)
+    os.environ["GEMINI_TPM"] = str(args.tpm)
+    os.environ["GEMINI_RETRY_BASE_DELAY"] = str(args.retry_base_delay)
+    top = max(args.concurrency)
+    os.environ["GEMINI_INITIAL_CONCURRENCY"] = str(top)
+    os.environ["GEMINI_MAX_CONCURRENCY"] = str(top)
+    os.environ["MENU_DICT_ENABLED"] = "1" if args.use_dictionary else "0"
+    os.environ["GEMINI_CALL_TIMEOUT"] = str(args.call_timeout)
+    os.environ["LLM_HEDGE_MAX_RATIO"] = str(args.hedge_ratio)
+    os.environ["LLM_HEDGE_MIN_DELAY"] = str(args.hedge_min_delay)
+
+
+def fake_settings(args) -> dict:
+    return {
+        "latency_median_ms": args.latency_ms,
+        "latency_sigma": args.latency_sigma,
+        "ms_per_output_token": args.ms_per_output_token,
+        "error_rate": args.error_rate,
+        "rate_limit_rate": args.rate_limit_rate,
+        "malformed_rate": args.malformed_rate,
+        "schema_malformed_rate": args.schema_malformed_rate,
+        "qc_fail_rate": args.qc_fail_rate,
+        "vision_items": args.vision_items,
+        "seed": args.seed,
+    }
+
+
+def percentiles(values):
+    """(p50, p95, p99) 最近順位法。空なら 0"""
+    if not values:
+        return 0.0, 0.0, 0.0
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered) + 0.5)) - 1))]
+    return pick(0.50), pick(0.95), pick(0.99)
+
+
+def load_items(csv_path: str, limit: int):
+    from src.csv_utils import extract_menu_rows
+    from src.models import MenuItem
+
+    with open(csv_path, encoding="utf-8-sig") as f:
+        pairs = extract_menu_rows(list(csv.reader(f)), ["キーワードは無し(メニューのみ翻訳)"])
+    return [MenuItem(menu_title=title, menu_content=content) for title, content in pairs[:limit]]
+
+
+class Stage:
+    """1回の計測。reset() で各種統計を消してから run() し、row() で集計する"""
+
+    def __init__(self, name: str, fake, limiter_module, hedging, llm_json, structured_output, resets=()):
+        self.name = name
+        self.fake = fake
+        self.limiter_module = limiter_module
+        self.hedging = hedging
+        self.llm_json = llm_json
+        self.structured_output = structured_output
+        self.resets = resets
+
+    def reset(self, hedge: bool = False, structured: bool = False):
+        self.fake.reset_fake_stats()
+        self.limiter_module.reset_limiters()
+        self.hedging.reset_hedgers()
+        self.llm_json.reset_json_stats()
+        self.structured_output.reset_structured_stats()
+        # with_hedging / use_schema は呼び出し時にこのフラグを見る
+        self.hedging.HEDGE_ENABLED = hedge
+        self.structured_output.STRUCTURED_OUTPUT = structured
+        for reset in self.resets:
+            reset()
+
+    def row(self, label: str, concurrency: int, units: int, elapsed: float, done_at) -> dict:
+        stats = self.fake.get_fake_stats().values()
+        latencies = [lat for s in stats for lat in s["latencies"]]
+        calls = sum(s["calls"] for s in stats)
+        hedge_stats = self.hedging.get_hedge_stats().values()
+        json_stats = self.llm_json.get_json_stats()
+        formats = [
+            s for modes in self.structured_output.get_structured_stats().values()
+            for mode, s in modes.items() if mode in (self.structured_output.INSTRUCTIONS, self.structured_output.SCHEMA)
+        ]
+        responses = sum(s["calls"] for s in formats)
+        u50, u95, u99 = percentiles(done_at)
+        c50, c95, c99 = percentiles(latencies)
+        return {
+            "stage": label,
+            "concurrency": concurrency,
+            "units": units,
+            "seconds": elapsed,
+            "units_per_sec": units / elapsed if elapsed else 0.0,
+            "unit_p50": u50, "unit_p95": u95, "unit_p99": u99,
+            "call_p50": c50, "call_p95": c95, "call_p99": c99,
+            "calls": calls,
+            "calls_per_unit": calls / units if units else 0.0,
+            "errors": sum(s["errors"] + s["malformed"] for s in stats),
+            "rate_limited": sum(s["rate_limited"] for s in stats),
+            "timeouts": sum(s["timeouts"] for s in stats),
+            "hedged": sum(h["hedged"] for h in hedge_stats),
+            "hedge_wins": sum(h["hedge_wins"] for h in hedge_stats),
+            "json_repaired": json_stats["repaired"],
+            "parse_failure_rate": sum(s["parse_failures"] for s in formats) / responses if responses else 0.0,
+            "tokens_in": sum(s["tokens_in"] for s in stats),
+            "tokens_out": sum(s["tokens_out"] for s in stats),
+        }
+
+
+async def run_items(func, items, concurrency: int, **kwargs):
+    """on_progress(done, total) を持つ item 単位のステージ。各 item の完了時刻を返す"""
+    started = time.perf_counter()
+    done_at = []
+    await func(items, "fake-key", max_concurrency=concurrency, on_progress=lambda done, total: done_at.append(time.perf_counter() - started), **kwargs)
+    return time.perf_counter() - started, done_at
+
+
+async def run_transcreation(items, languages, concurrency: int, mode: str):
+    """item 単位の完了時刻 = その item の全言語が揃った時刻"""
+    from src.langchain_utils import translate_english_to_many_stream
+
+    started = time.perf_counter()
+    remaining = {i: len(languages) for i in range(len(items))}
+    done_at = []
+    async for event in translate_english_to_many_stream(
+        menu_items=items,
+        target_languages={lang: [] for lang in languages},
+        api_key="fake-key",
+        max_concurrency=concurrency,
+        engine_mode=mode,
+    ):
+        remaining[event.item_index] -= 1
+        if remaining[event.item_index] == 0:
+            done_at.append(time.perf_counter() - started)
+    return time.perf_counter() - started, done_at
+
+
+async def run_end_to_end(items, languages, concurrency: int, mode: str, pipelined: bool):
+    """校正 → 英訳 → 多言語。item 単位の完了時刻 = その item の全言語が揃った時刻"""
+    from src.langchain_utils import (
+        remove_unnecessary_parts_async,
+        translate_english_to_many_stream,
+        translate_japanese_to_english_async,
+    )
+    from src.rate_limiter import AdaptiveRateLimiter, set_limiter
+    from src.translation_pipeline import translate_pipeline_stream
+
+    # pipelined は全段の合計を共有 limiter が抑える (barrier は scheduler のワーカー数) ので、limiter の枠も concurrency に揃える
+    set_limiter(AdaptiveRateLimiter(initial_concurrency=concurrency, max_concurrency=concurrency))
+
+    started = time.perf_counter()
+    remaining = {i: len(languages) for i in range(len(items))}
+    done_at = []
+    targets = {lang: [] for lang in languages}
+    if pipelined:
+        # 段ごとの同時 item 数は既定どおり共有 limiter の枠から決める (stage_limits)
+        stream = translate_pipeline_stream(items, targets, "fake-key", engine_mode=mode, max_concurrency=concurrency)
+    else:
+        cleaned = await remove_unnecessary_parts_async(items, "fake-key", max_concurrency=concurrency)
+        english = await translate_japanese_to_english_async(cleaned, "fake-key", max_concurrency=concurrency)
+        stream = translate_english_to_many_stream(english, targets, "fake-key", max_concurrency=concurrency, engine_mode=mode)
+    async for event in stream:
+        if event.stage != "transcreation":
+            continue
+        remaining[event.item_index] -= 1
+        if remaining[event.item_index] == 0:
+            done_at.append(time.perf_counter() - started)
+    return time.perf_counter() - started, done_at
+
+
+async def run_pages(call, pages: int, concurrency: int):
+    """ページ単位のステージ (call(page_no) は awaitable)。各ページの完了時刻を返す"""
+    started = time.perf_counter()
+    semaphore = asyncio.Semaphore(concurrency)
+    done_at = []
+
+    async def one(page_no: int):
+        async with semaphore:
+            try:
+                await call(page_no)
+            except Exception as e:
+                print(f"  page {page_no} failed: {e}")
+        done_at.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one(p) for p in range(1, pages + 1)))
+    return time.perf_counter() - started, done_at
+
+
+def load_phase1(log_dir: str, settings: dict):
+    """Phase 1 API (FastAPI) を読み込む。依存が無ければ None"""
+    sys.path.insert(0, os.path.join(ROOT, "tonosama-phase1"))
+    try:
+        import httpx  # noqa: F401  (API ステージで使う)
+        from apps.api.main import app
+        from apps.api.core import gemini, observability
+        from src import fake_llm, hedging, llm_json, rate_limiter, structured_output
+    except ImportError as e:
+        print(f"(phase 1 stages skipped: {e})")
+        return None
+    observability.LOG_DIR = type(observability.LOG_DIR)(log_dir)
+    observability.LOG_FILE = observability.LOG_DIR / "api_usage_log.jsonl"
+    fake_llm.configure_fake_llm(**settings)
+    return app, fake_llm, gemini, rate_limiter, hedging, llm_json, structured_output
+
+
+def variant_label(label: str, hedge: str, structured: str) -> str:
+    if structured == "on":
+        label += "+schema"
+    return f"{label}+hedge" if hedge == "on" else label
+
+
+def print_rows(rows):
+    header = (
+        f"{'stage':<24} {'conc':>4} {'units':>5} {'sec':>7} {'units/s':>8} "
+        f"{'unit p50':>8} {'p95':>7} {'p99':>7} {'call p50':>8} {'p95':>6} {'p99':>6} "
+        f"{'calls/u':>7} {'err':>4} {'429':>4} {'tmo':>4} {'hedged':>6} {'won':>4} {'fixed':>5} {'in/call':>7} {'pfail':>5}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(
+            f"{r['stage']:<24} {r['concurrency']:>4} {r['units']:>5} {r['seconds']:>7.2f} {r['units_per_sec']:>8.2f} "
+            f"{r['unit_p50']:>8.2f} {r['unit_p95']:>7.2f} {r['unit_p99']:>7.2f} "
+            f"{r['call_p50']:>8.2f} {r['call_p95']:>6.2f} {r['call_p99']:>6.2f} "
+            f"{r['calls_per_unit']:>7.2f} {r['errors']:>4} {r['rate_limited']:>4} "
+            f"{r['timeouts']:>4} {r['hedged']:>6} {r['hedge_wins']:>4} {r['json_repaired']:>5} "
+            f"{r['tokens_in'] / r['calls'] if r['calls'] else 0.0:>7.0f} {r['parse_failure_rate']:>5.0%}"
+        )
+
+
+def main():
+    args = parse_args()
+    configure_env(args)
+    log_dir = args.log_dir or tempfile.mkdtemp(prefix="bench_pipeline_")
+
+    from src import dedup, fake_llm, hedging, llm_json, model_routing, observability, qc_rules, rate_limiter, structured_output
+    from src.langchain_utils import ENGINE_MODES, remove_unnecessary_parts_async, translate_japanese_to_english_async
+    from src.menu_dictionary import reset_dictionary_stats
+
+    # API ログをリポジトリの logs/ に書かないようにする
+    observability.LOG_DIR = log_dir
+    observability.API_LOG_FILE = os.path.join(log_dir, "api_usage_log.csv")
+    observability.PROMPT_LOG_FILE = os.path.join(log_dir, "prompt_usage_log.csv")
+    settings = fake_settings(args)
+    fake_llm.configure_fake_llm(**settings)
+
+    for mode in args.modes:
+        if mode not in ENGINE_MODES:
+            sys.exit(f"Unknown engine mode: {mode} (expected one of {ENGINE_MODES})")
+
+    items = load_items(os.path.join(ROOT, args.csv) if not os.path.isabs(args.csv) else args.csv, args.limit)
+    print(f"{len(items)} items x {len(args.languages)} languages ({args.csv}), {args.pages} pages, logs -> {log_dir}")
+    print(f"fake: {fake_llm.get_fake_config()}")
+
+    src_stage = Stage("src", fake_llm, rate_limiter, hedging, llm_json, structured_output, resets=(
+        observability.reset_usage_totals, qc_rules.reset_qc_gate_stats, dedup.reset_dedup_stats, reset_dictionary_stats,
+        model_routing.reset_routing_stats,
+    ))
+
+    plans = []
+    if "cleanup" in args.stages:
+        plans.append(("cleanup", lambda c: run_items(remove_unnecessary_parts_async, items, c), len(items)))
+    if "ja_to_en" in args.stages:
+        plans.append(("ja_to_en", lambda c: run_items(translate_japanese_to_english_async, items, c), len(items)))
+    if "transcreation" in args.stages:
+        for mode in args.modes:
+            plans.append((f"transcreation[{mode}]", lambda c, m=mode: run_transcreation(items, args.languages, c, m), len(items)))
+    if "end_to_end" in args.stages:
+        for mode in args.modes:
+            for variant in ("barrier", "pipelined"):
+                plans.append((
+                    f"e2e[{mode},{variant}]",
+                    lambda c, m=mode, p=(variant == "pipelined"): run_end_to_end(items, args.languages, c, m, p),
+                    len(items),
+                ))
+    if "vision" in args.stages:
+        from src.multimodal_utils import parse_menu_image
+
+        vision = lambda page_no: asyncio.to_thread(parse_menu_image, DUMMY_IMAGE, "fake-key", store_id="bench")
+        plans.append(("vision", lambda c: run_pages(vision, args.pages, c), args.pages))
+
+    rows = []
+    variants = [(hedge, structured) for structured in args.structured for hedge in args.hedge]
+    for label, run, units in plans:
+        for hedge, structured in variants:
+            for concurrency in args.concurrency:
+                src_stage.reset(hedge == "on", structured == "on")
+                elapsed, done_at = asyncio.run(run(concurrency))
+                rows.append(src_stage.row(variant_label(label, hedge, structured), concurrency, units, elapsed, done_at))
+
+    phase1_stages = [s for s in ("phase1_full_page", "api_intake", "api_demo") if s in args.stages]
+    phase1 = load_phase1(log_dir, settings) if phase1_stages else None
+    if phase1:
+        app, p1_fake, gemini, p1_limiter, p1_hedging, p1_json, p1_structured = phase1
+        p1_stage = Stage("phase1", p1_fake, p1_limiter, p1_hedging, p1_json, p1_structured)
+        for label in phase1_stages:
+            for hedge, structured in variants:
+                for concurrency in args.concurrency:
+                    p1_stage.reset(hedge == "on", structured == "on")
+                    elapsed, done_at = asyncio.run(run_phase1(label, app, gemini, args.pages, concurrency))
+                    rows.append(p1_stage.row(variant_label(label, hedge, structured), concurrency, args.pages, elapsed, done_at))
+
+    print()
+    print_rows(rows)
+
+
+async def run_phase1(label: str, app, gemini, pages: int, concurrency: int):
+    if label == "phase1_full_page":
+        return await run_pages(lambda page_no: gemini.extract_full_page(DUMMY_IMAGE, "image/png", page_no), pages, concurrency)
+
+    import base64
+
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        if label == "api_intake":
+            async def call(page_no: int):
+                response = await client.post(
+                    "/api/intake/extract_page",
+                    files={"file": ("page.png", DUMMY_IMAGE, "image/png")},
+                    data={"session_id": "bench", "page_no": str(page_no)},
+                )
+                response.raise_for_status()
+        else:
+            payload = {"mime_type": "image/png", "base64": base64.b64encode(DUMMY_IMAGE).decode("ascii")}
+
+            async def call(page_no: int):
+                response = await client.post(
+                    "/api/demo/extract_items",
+                    json={"demo_session_id": f"bench-{page_no}", "image": payload},
+                )
+                response.raise_for_status()
+        return await run_pages(call, pages, concurrency)
+
+
+if __name__ == "__main__":
+    main()
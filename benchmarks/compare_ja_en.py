@@ -0,0 +1,176 @@
+"""
+校正 + 英訳の実行方式の比較 (two_step vs fused)
+
+two_step: remove_unnecessary_parts_async → translate_japanese_to_english_async (1 item 2リクエスト、2回の並列ループ)
+fused   : clean_and_translate_async (1 item 1リクエストで校正済み日本語と英訳を両方返す)
+
+resources/ のサンプル CSV (既定は全部) ごとに両方を実行し、API 呼び出し数・入出力トークン・費用・
+所要時間・item ごとの完了時刻 (p50/p95) と、fused で減った呼び出し数・時間を表示する。
+既定は fake Gemini (LLM_PROVIDER=fake, オフライン)。--live で実際の Gemini を呼ぶ (GEMINI_API_KEY が必要)。
+
+Usage:
+    python benchmarks/compare_ja_en.py
+    python benchmarks/compare_ja_en.py --csv resources/ぴえろっと_long.csv --limit 40 --concurrency 8 --latency-ms 800
+    GEMINI_API_KEY=... python benchmarks/compare_ja_en.py --live --limit 5
+"""
+import argparse
+import asyncio
+import glob
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Rootのモジュールを読み込めるようにする
+sys.path.append(ROOT)
+
+from bench_pipeline import load_items, percentiles  # noqa: E402  (同じディレクトリ)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", nargs="*", default=None, help="既定は resources/*.csv")
+    parser.add_argument("--limit", type=int, default=20, help="CSV ごとの対象メニュー数の上限")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--persona", default="標準 (丁寧)")
+    parser.add_argument("--live", action="store_true", help="fake ではなく実際の Gemini を呼ぶ")
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="fake: 1呼び出しの遅延の中央値")
+    parser.add_argument("--ms-per-output-token", type=float, default=4.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+def configure_env(args):
+    """src を import する前に環境変数を決める (各モジュールは import 時に読む)"""
+    # 2回目の方式がキャッシュに当たらないよう、比較中はキャッシュを切る
+    os.environ["LLM_CACHE_ENABLED"] = "0"
+    os.environ["GEMINI_INITIAL_CONCURRENCY"] = str(args.concurrency)
+    os.environ["GEMINI_MAX_CONCURRENCY"] = str(args.concurrency)
+    if args.live:
+        if not os.getenv("GEMINI_API_KEY"):
+            sys.exit("GEMINI_API_KEY not set")
+        return
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ.setdefault("GEMINI_API_KEY", "fake-key")
+    os.environ["GEMINI_RPM"] = "100000"
+    os.environ["GEMINI_TPM"] = "100000000"
+    os.environ["MENU_DICT_ENABLED"] = "0"
+
+
+async def run_two_step(items, api_key: str, concurrency: int, persona: str, on_progress):
+    from src.langchain_utils import remove_unnecessary_parts_async, translate_japanese_to_english_async
+
+    # 英訳は校正が全件終わってから始まる (main.py のタブ2 → タブ3 と同じ)
+    cleaned = await remove_unnecessary_parts_async(items, api_key, max_concurrency=concurrency)
+    english = await translate_japanese_to_english_async(cleaned, api_key, persona, max_concurrency=concurrency, on_progress=on_progress)
+    return cleaned, english
+
+
+async def run_fused(items, api_key: str, concurrency: int, persona: str, on_progress):
+    from src.langchain_utils import clean_and_translate_async
+
+    return await clean_and_translate_async(items, api_key, persona, max_concurrency=concurrency, on_progress=on_progress)
+
+
+def run_mode(mode: str, run, items, api_key: str, args) -> dict:
+    from src import observability
+
+    observability.reset_usage_totals()
+    started = time.perf_counter()
+    done_at = []
+    cleaned, english = asyncio.run(run(
+        items, api_key, args.concurrency, args.persona,
+        lambda done, total: done_at.append(time.perf_counter() - started),
+    ))
+    elapsed = time.perf_counter() - started
+
+    totals = observability.get_usage_totals().values()
+    p50, p95, _ = percentiles(done_at)
+    return {
+        "mode": mode,
+        "calls": sum(v["calls"] for v in totals),
+        "tokens_in": sum(v["tokens_in"] for v in totals),
+        "tokens_out": sum(v["tokens_out"] for v in totals),
+        "cost_jpy": sum(v["cost_jpy"] for v in totals),
+        "seconds": elapsed,
+        "item_p50": p50,
+        "item_p95": p95,
+        "errors": sum(1 for it in list(cleaned) + list(english) if it.status == "error"),
+    }
+
+
+def print_rows(csv_name: str, n_items: int, rows):
+    print(f"\n{csv_name} ({n_items} items)")
+    header = (
+        f"{'mode':<9} {'calls':>6} {'tok_in':>8} {'tok_out':>8} {'cost_jpy':>8} "
+        f"{'sec':>7} {'item p50':>8} {'p95':>7} {'errors':>6}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(
+            f"{r['mode']:<9} {r['calls']:>6} {r['tokens_in']:>8} {r['tokens_out']:>8} {r['cost_jpy']:>8.2f} "
+            f"{r['seconds']:>7.2f} {r['item_p50']:>8.2f} {r['item_p95']:>7.2f} {r['errors']:>6}"
+        )
+    base, fused = rows
+    print(
+        f"fused vs two_step: calls -{base['calls'] - fused['calls']} "
+        f"({1 - fused['calls'] / base['calls'] if base['calls'] else 0.0:.0%}), "
+        f"latency -{base['seconds'] - fused['seconds']:.2f}s "
+        f"({1 - fused['seconds'] / base['seconds'] if base['seconds'] else 0.0:.0%}), "
+        f"tokens_in x{fused['tokens_in'] / base['tokens_in'] if base['tokens_in'] else 0.0:.2f}, "
+        f"tokens_out x{fused['tokens_out'] / base['tokens_out'] if base['tokens_out'] else 0.0:.2f}"
+    )
+
+
+def main():
+    args = parse_args()
+    configure_env(args)
+    log_dir = tempfile.mkdtemp(prefix="compare_ja_en_")
+
+    from src import observability
+
+    # API ログをリポジトリの logs/ に書かないようにする
+    observability.LOG_DIR = log_dir
+    observability.API_LOG_FILE = os.path.join(log_dir, "api_usage_log.csv")
+    observability.PROMPT_LOG_FILE = os.path.join(log_dir, "prompt_usage_log.csv")
+    if not args.live:
+        from src import fake_llm
+
+        fake_llm.configure_fake_llm(
+            latency_median_ms=args.latency_ms,
+            ms_per_output_token=args.ms_per_output_token,
+            malformed_rate=args.malformed_rate,
+            seed=args.seed,
+        )
+
+    api_key = os.environ["GEMINI_API_KEY"]
+    csv_paths = args.csv or sorted(glob.glob(os.path.join(ROOT, "resources", "*.csv")))
+    print(f"{'live Gemini' if args.live else 'fake Gemini'}, concurrency {args.concurrency}, logs -> {log_dir}")
+
+    summary = []
+    for path in csv_paths:
+        items = load_items(path if os.path.isabs(path) else os.path.join(ROOT, path), args.limit)
+        if not items:
+            print(f"\n{os.path.basename(path)}: no menu rows, skipped")
+            continue
+        rows = [
+            run_mode("two_step", run_two_step, items, api_key, args),
+            run_mode("fused", run_fused, items, api_key, args),
+        ]
+        print_rows(os.path.basename(path), len(items), rows)
+        summary.append(rows)
+
+    if len(summary) > 1:
+        calls = [sum(rows[i]["calls"] for rows in summary) for i in (0, 1)]
+        seconds = [sum(rows[i]["seconds"] for rows in summary) for i in (0, 1)]
+        print(
+            f"\nall CSVs: calls {calls[0]} -> {calls[1]} (-{calls[0] - calls[1]}), "
+            f"latency {seconds[0]:.2f}s -> {seconds[1]:.2f}s (-{seconds[0] - seconds[1]:.2f}s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+複数店舗の一括翻訳 (ヘッドレス CLI)
+
+ヒアリングシート CSV (resources/example01.csv 形式) のディレクトリを読み、店舗 (CSV) ごとに
+校正 → 英訳 → 多言語 のパイプライン (translation_pipeline) を実行して、main.py の「csvファイルを作成」と
+同じレイアウトの CSV を店舗ごとに書き出す。
+
+- 店舗はワーカープロセス (--workers) に1件ずつ配る (item 数の多い店舗から)。各プロセスは自分の
+  イベントループで translation_jobs.TranslationJob を動かす
+- API のレート枠 (GEMINI_RPM / GEMINI_TPM / GEMINI_MAX_CONCURRENCY) は全体の予算とみなし、
+  ワーカー数で等分して各プロセスの limiter に渡す (全ワーカー合計で予算を超えない)
+- ジョブのジャーナルは <out>/jobs に残る。途中で止まっても同じコマンドで再実行すれば、
+  CSV の内容が同じ店舗は完了済みの (item × 言語) を飛ばして続きから再開する
+- 店舗ごとの所要時間・最初の言語が公開可能になるまでの時間・API 呼び出し数・トークン・費用と、
+  QC を通らず原文のまま残った (item × 言語) の数 (pending) を <out>/summary.csv と標準出力にまとめる
+
+Usage:
+    GEMINI_API_KEY=... python bulk_translate.py resources/ --out bulk_out --workers 4
+    python bulk_translate.py resources/ --out /tmp/bulk --workers 2 --fake   # オフライン (fake Gemini) で通しを確認
+    GEMINI_RPM=600 python bulk_translate.py stores/ --languages 韓国語 中国語 台湾語 --ja-en-mode fused
+"""
+import argparse
+import asyncio
+import csv
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Rootのモジュールを読み込めるようにする
+sys.path.append(ROOT)
+
+# main.py のタブ4と同じ対象言語
+TARGET_LANGUAGES = [
+    "韓国語", "中国語", "台湾語", "広東語", "タイ語", "フィリピン語", "ベトナム語",
+    "インドネシア語", "スペイン語", "ドイツ語", "フランス語", "イタリア語", "ポルトガル語",
+]
+IGNORE_KEYWORDS = ["キーワードは無し(メニューのみ翻訳)"]
+
+SUMMARY_FIELDS = [
+    "store", "csv", "items", "status", "done", "total", "errors", "pending", "qc_reject", "reused", "seconds",
+    "first_publish_sec", "calls", "tokens_in", "tokens_out", "cost_jpy", "output", "worker",
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input_dir", help="ヒアリングシート CSV のディレクトリ")
+    parser.add_argument("--out", default="bulk_out", help="出力ディレクトリ (店舗ごとの CSV, summary.csv, jobs/)")
+    parser.add_argument("--workers", type=int, default=max(1, min(4, os.cpu_count() or 1)))
+    parser.add_argument("--languages", nargs="*", default=TARGET_LANGUAGES)
+    parser.add_argument("--engine-mode", default="per_item", choices=["per_item", "batched", "multilang"])
+    parser.add_argument("--ja-en-mode", default=os.getenv("JA_EN_MODE", "two_step"), choices=["two_step", "fused"])
+    parser.add_argument("--persona", default="標準 (丁寧)")
+    parser.add_argument("--limit", type=int, default=0, help="店舗ごとの対象メニュー数の上限 (0 で全件)")
+    parser.add_argument("--rpm", type=int, default=None, help="全ワーカー合計の RPM (既定は GEMINI_RPM)")
+    parser.add_argument("--tpm", type=int, default=None, help="全ワーカー合計の TPM (既定は GEMINI_TPM)")
+    parser.add_argument("--max-concurrency", type=int, default=None, help="全ワーカー合計の同時実行数 (既定は GEMINI_MAX_CONCURRENCY)")
+    parser.add_argument("--fake", action="store_true", help="実際の Gemini ではなく fake を呼ぶ (オフライン)")
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="fake: 1呼び出しの遅延の中央値")
+    return parser.parse_args()
+
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^\w\-]+", "_", name).strip("_") or "store"
+
+
+def load_stores(input_dir: str, limit: int = 0) -> list:
+    """ディレクトリ内の CSV を店舗ごとのタスク {store, csv, slug, pairs} にする (メニューの無い CSV は除く)"""
+    from src.csv_utils import extract_menu_rows, extract_store_name
+
+    stores = []
+    slugs = set()
+    for path in sorted(glob.glob(os.path.join(input_dir, "*.csv"))):
+        with open(path, encoding="utf-8-sig") as f:
+            rows = list(csv.reader(f))
+        pairs = extract_menu_rows(rows, IGNORE_KEYWORDS)
+        if limit:
+            pairs = pairs[:limit]
+        if not pairs:
+            print(f"{os.path.basename(path)}: no menu rows, skipped")
+            continue
+        # 同じ店舗名の CSV が複数あってもファイル名で区別する
+        slug = _slug(os.path.splitext(os.path.basename(path))[0])
+        while slug in slugs:
+            slug += "_"
+        slugs.add(slug)
+        stores.append({
+            "store": extract_store_name(rows) or os.path.splitext(os.path.basename(path))[0],
+            "csv": path,
+            "slug": slug,
+            "pairs": pairs,
+        })
+    return stores
+
+
+def worker_env(args, workers: int) -> dict:
+    """ワーカーに渡す環境変数 (全体のレート予算をワーカー数で等分する)。src は import 時に読むので先に決める"""
+    from src.rate_limiter import GEMINI_INITIAL_CONCURRENCY, GEMINI_MAX_CONCURRENCY, GEMINI_RPM, GEMINI_TPM
+
+    max_concurrency = max(1, (args.max_concurrency or GEMINI_MAX_CONCURRENCY) // workers)
+    env = {
+        "GEMINI_RPM": str(max(1, (args.rpm or GEMINI_RPM) // workers)),
+        "GEMINI_TPM": str(max(1, (args.tpm or GEMINI_TPM) // workers)),
+        "GEMINI_MAX_CONCURRENCY": str(max_concurrency),
+        "GEMINI_INITIAL_CONCURRENCY": str(min(GEMINI_INITIAL_CONCURRENCY, max_concurrency)),
+        "JA_EN_MODE": args.ja_en_mode,
+    }
+    # キープール (GEMINI_API_KEYS) のキーごとの枠も同じく等分する (各ワーカーが全キーを使うため)
+    for name in ("GEMINI_KEY_RPM", "GEMINI_KEY_TPM", "GEMINI_KEY_RPD"):
+        if os.getenv(name):
+            env[name] = str(max(1, int(os.getenv(name)) // workers))
+    if args.fake:
+        # fake の応答を本番の LLM キャッシュに残さない
+        env.update({"LLM_PROVIDER": "fake", "LLM_CACHE_ENABLED": "0", "GEMINI_API_KEY": os.getenv("GEMINI_API_KEY") or "fake-key"})
+    return env
+
+
+def init_worker(env: dict, fake_latency_ms: float):
+    os.environ.update(env)
+    if env.get("LLM_PROVIDER") == "fake":
+        from src import fake_llm
+
+        fake_llm.configure_fake_llm(latency_median_ms=fake_latency_ms, seed=os.getpid())
+
+
+def translate_store(task: dict, options: dict) -> dict:
+    """
+    ワーカープロセスで1店舗を翻訳し、店舗の CSV を書いて集計 (SUMMARY_FIELDS) を返す。
+    同じ内容の CSV のジョブが jobs/ にあれば続きから再開する。
+    """
+    from src import observability
+    from src.csv_utils import export_rows
+    from src.qc_rules import get_qc_gate_stats, reset_qc_gate_stats
+    from src.models import MenuItem
+    from src.source_hash import source_hashes
+    from src.translation_jobs import TranslationJob
+
+    items = [MenuItem(menu_title=title, menu_content=content) for title, content in task["pairs"]]
+    hashes = source_hashes(items, options["persona"])
+    # 区切りの無い連結だと ["ab", "c"] と ["a", "bc"] が同じ digest になるので、JSON の配列にしてからハッシュする
+    key = json.dumps([hashes, options["languages"], options["engine_mode"], options["ja_en_mode"]], ensure_ascii=False)
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:8]
+    job_id = f"bulk-{task['slug']}-{digest}"
+    jobs_dir = os.path.join(options["out"], "jobs")
+    stages = ("cleanup_en",) if options["ja_en_mode"] == "fused" else ("cleanup", "ja_to_en")
+    try:
+        job = TranslationJob.load(job_id, jobs_dir)
+    except FileNotFoundError:
+        job = TranslationJob.create(
+            items,
+            options["languages"],
+            engine_mode=options["engine_mode"],
+            extra={"source": "bulk", "store_name": task["store"], "csv": task["csv"]},
+            job_id=job_id,
+            jobs_dir=jobs_dir,
+            stages=stages,
+            source_hashes=hashes,
+        )
+
+    observability.reset_usage_totals()
+    reset_qc_gate_stats()
+    started = time.perf_counter()
+    first_publish = None
+
+    async def _consume():
+        nonlocal first_publish
+        async for event in job.run(os.environ["GEMINI_API_KEY"], options["persona"]):
+            if event.lang_done and first_publish is None and job.published_languages():
+                first_publish = time.perf_counter() - started
+
+    try:
+        asyncio.run(_consume())
+    except Exception as e:
+        # 1店舗の失敗で他の店舗を止めない (ジャーナルは残るので再実行で続きから)
+        print(f"[Bulk] {task['store']} failed: {e}")
+    elapsed = time.perf_counter() - started
+
+    output = os.path.join(options["out"], f"{task['slug']}.csv")
+    with open(output, "w", encoding="utf-8-sig", newline="") as f:
+        csv.writer(f, lineterminator="\n").writerows(export_rows(
+            job.menu_items, job.stage_results("cleanup"), job.stage_results("ja_to_en"), job.results(),
+        ))
+
+    status = job.status()
+    totals = observability.get_usage_totals().values()
+    return {
+        "store": task["store"],
+        "csv": os.path.basename(task["csv"]),
+        "items": len(items),
+        "status": status["status"],
+        "done": status["done"],
+        "total": status["total"],
+        "errors": status["errors"],
+        # QC を一度も通らず原文のまま残った (item, 言語)。言語名の取り違えなどで全件落ちているとここに出る
+        "pending": status["pending"],
+        "qc_reject": get_qc_gate_stats()["local_reject"],
+        "reused": status["reused"],
+        "seconds": round(elapsed, 2),
+        "first_publish_sec": round(first_publish, 2) if first_publish is not None else "",
+        "calls": sum(v["calls"] for v in totals),
+        "tokens_in": sum(v["tokens_in"] for v in totals),
+        "tokens_out": sum(v["tokens_out"] for v in totals),
+        "cost_jpy": round(sum(v["cost_jpy"] for v in totals), 4),
+        "output": output,
+        "worker": os.getpid(),
+    }
+
+
+def print_summary(rows: list, elapsed: float):
+    header = (
+        f"{'store':<24} {'items':>5} {'status':<10} {'done':>9} {'err':>4} {'pend':>4} {'sec':>8} "
+        f"{'1st pub':>8} {'calls':>6} {'tok_in':>9} {'tok_out':>9} {'cost_jpy':>9}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        done = f"{r['done']}/{r['total']}"
+        print(
+            f"{r['store'][:24]:<24} {r['items']:>5} {r['status']:<10} {done:>9} {r['errors']:>4} {r['pending']:>4} "
+            f"{r['seconds']:>8.2f} {str(r['first_publish_sec']):>8} {r['calls']:>6} {r['tokens_in']:>9} {r['tokens_out']:>9} {r['cost_jpy']:>9.2f}"
+        )
+    items = sum(r["items"] for r in rows)
+    print(
+        f"\n{len(rows)} stores / {items} items in {elapsed:.2f}s ({items / elapsed if elapsed else 0.0:.2f} items/s), "
+        f"{sum(r['calls'] for r in rows)} calls, {sum(r['cost_jpy'] for r in rows):.2f} JPY"
+    )
+
+
+def main():
+    args = parse_args()
+    if not args.fake and not os.getenv("GEMINI_API_KEY"):
+        sys.exit("GEMINI_API_KEY not set (use --fake for an offline run)")
+    stores = load_stores(args.input_dir, args.limit)
+    if not stores:
+        sys.exit(f"No hearing-sheet CSVs with menu rows in {args.input_dir}")
+    os.makedirs(args.out, exist_ok=True)
+
+    workers = max(1, min(args.workers, len(stores)))
+    env = worker_env(args, workers)
+    options = {
+        "out": args.out,
+        "languages": list(args.languages),
+        "engine_mode": args.engine_mode,
+        "ja_en_mode": args.ja_en_mode,
+        "persona": args.persona,
+    }
+    print(
+        f"{len(stores)} stores, {workers} workers, per worker: RPM {env['GEMINI_RPM']} / TPM {env['GEMINI_TPM']} / "
+        f"concurrency {env['GEMINI_MAX_CONCURRENCY']} ({'fake' if args.fake else 'live'} Gemini)"
+    )
+
+    started = time.perf_counter()
+    rows = []
+    # spawn: 各ワーカーは init_worker で環境変数を決めてから src を import する
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(env, args.latency_ms),
+    ) as pool:
+        # 大きい店舗から配り、最後に1店舗だけ長く残らないようにする
+        futures = {
+            pool.submit(translate_store, task, options): task
+            for task in sorted(stores, key=lambda t: len(t["pairs"]), reverse=True)
+        }
+        for future in as_completed(futures):
+            task = futures[future]
+            try:
+                row = future.result()
+            except Exception as e:
+                print(f"[Bulk] {task['store']} failed in worker: {e}")
+                continue
+            rows.append(row)
+            print(f"done: {row['store']} ({row['done']}/{row['total']}, {row['seconds']:.1f}s, {row['cost_jpy']:.2f} JPY) -> {row['output']}")
+    elapsed = time.perf_counter() - started
+
+    rows.sort(key=lambda r: r["store"])
+    summary_path = os.path.join(args.out, "summary.csv")
+    with open(summary_path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS, lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(rows)
+    print()
+    print_summary(rows, elapsed)
+    print(f"summary -> {summary_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,25 @@
 import streamlit as st
 import csv
 import io
-from src.csv_utils import is_valid_row
+from src.csv_utils import is_valid_row, export_rows
 from src.supabase_client import get_supabase
 from src.st_auth import supabase_auth_widget
 import src.st_utils as st_utils
 import src.langchain_utils as langchain_utils
+from src.llm_cache import CACHE_ENABLED, get_default_cache
+from src.qc_rules import get_qc_gate_stats
+from src.llm_pool import get_pool_stats
+from src.key_pool import register_keys, get_key_pool_stats
+from src.hedging import get_hedge_stats
+from src.model_routing import get_routing_stats
+from src.llm_json import get_json_stats
+from src.structured_output import get_structured_stats, SCHEMA
+from src.prompt_registry import get_prompt_stats
+from src.dedup import get_dedup_stats
+from src.menu_dictionary import get_dictionary_stats
+from src.translation_jobs import TranslationJob, COMPLETED
+from src.source_hash import source_hashes, fresh_results, unchanged_items
+from src.language_priority import DEFAULT_WEIGHT, language_weight, language_weights, prioritize_languages
 from src.models import MenuItem
 from typing import Dict, List
 import json
@@ -59,6 +73,10 @@ with st.sidebar:
     # APIキーが未取得の場合のみSupabaseから取得
     if not st.session_state["gemini_api_key"]:
         st.session_state["gemini_api_key"] = st_utils.get_gemini_api_key()
+    # 追加キー (app_data.gemini_api_keys) があれば、このセッションの API キーのプールに登録する (2本以上で呼び出しを振り分け)
+    if "gemini_api_keys" not in st.session_state:
+        st.session_state["gemini_api_keys"] = st_utils.get_gemini_api_keys()
+    register_keys(st.session_state["gemini_api_key"], st.session_state["gemini_api_keys"])
     
     # APIキーの入力
     new_key = st.text_input(
@@ -117,10 +135,30 @@ if st.session_state["target_contents"]:
             st.divider()
     
     with tab2:
+        # ジョブごとに校正・英訳の実行方式を選択 (一括なら英語翻訳タブの結果も同時にできる)
+        ja_en_mode_labels = {
+            "two_step": "校正のみ (英訳は英語翻訳タブで別に実行)",
+            "fused": "校正 + 英訳を一括 (1件1リクエスト)",
+        }
+        ja_en_mode = st.radio(
+            "実行方式",
+            list(langchain_utils.JA_EN_MODES),
+            index=list(langchain_utils.JA_EN_MODES).index(langchain_utils.DEFAULT_JA_EN_MODE)
+            if langchain_utils.DEFAULT_JA_EN_MODE in langchain_utils.JA_EN_MODES else 0,
+            format_func=lambda m: ja_en_mode_labels[m],
+            horizontal=True,
+            key="ja_en_mode",
+        )
         if st.button("✒️日本語の修正実行"):
-            with st.spinner("日本語を修正中..."):
-                cleaned_contents = langchain_utils.remove_unnecessary_parts(st.session_state["target_contents"], st.session_state["gemini_api_key"])
-                st.session_state["cleaned_contents"] = cleaned_contents
+            if ja_en_mode == "fused":
+                with st.spinner("日本語を修正・英語に翻訳中..."):
+                    cleaned_contents, translated_contents = langchain_utils.clean_and_translate(st.session_state["target_contents"], st.session_state["gemini_api_key"])
+                    st.session_state["cleaned_contents"] = cleaned_contents
+                    st.session_state["translated_contents"] = translated_contents
+            else:
+                with st.spinner("日本語を修正中..."):
+                    cleaned_contents = langchain_utils.remove_unnecessary_parts(st.session_state["target_contents"], st.session_state["gemini_api_key"])
+                    st.session_state["cleaned_contents"] = cleaned_contents
 
         edited_contents = []
         if st.session_state["cleaned_contents"]:
@@ -211,30 +249,208 @@ if st.session_state["target_contents"]:
         # Decide Source Content (Allow skipping Cleanup/English)
         source_data = st.session_state["cleaned_contents"] if st.session_state["cleaned_contents"] else st.session_state["target_contents"]
         
+        # ジョブごとに生成方式を選択
+        engine_mode_labels = {
+            "per_item": "言語ごと (1件×1言語ずつ)",
+            "batched": "バッチ (1言語で複数件まとめて)",
+            "multilang": "全言語一括 (1件で全言語まとめて)",
+        }
+        engine_mode = st.radio(
+            "生成方式 (Engine Mode)",
+            list(engine_mode_labels.keys()),
+            format_func=lambda m: engine_mode_labels[m],
+            horizontal=True,
+            key="engine_mode",
+        )
+        # 校正・英訳を全件待たずに、item ごとに終わったものから多言語へ流す
+        # (既定は段ごとの実行。差は benchmarks/bench_pipeline.py --stages end_to_end で比べる)
+        pipelined = st.checkbox(
+            "校正・英訳から item ごとに連続実行 (パイプライン)",
+            value=False,
+            key="pipelined",
+            help="item が1件ずつ流れるので、バッチ方式は言語ごと (1件×1言語ずつ) で実行します",
+        )
+        pre_stages = ()
+        if pipelined:
+            source_data = st.session_state["target_contents"]
+            pre_stages = ("cleanup_en",) if st.session_state.get("ja_en_mode") == "fused" else ("cleanup", "ja_to_en")
+
+        # 翻訳元 (日本語・ペルソナ・プロンプト版) のハッシュが前回の結果と同じ (item × 言語) は作り直さない
+        target_langs = list(st.session_state["translated_contents_many"].keys())
+        hashes = source_hashes(source_data)
+        previous = dict(st.session_state["translated_contents_many"])
+        if pipelined:
+            previous.update({"cleanup": st.session_state["cleaned_contents"], "ja_to_en": st.session_state["translated_contents"]})
+        reuse = fresh_results(hashes, previous)
+        reuse_keys = target_langs + (["cleanup", "ja_to_en"] if pipelined else [])
+        unchanged = unchanged_items(reuse, reuse_keys, len(source_data))
+
+        # 優先言語から先に全件仕上げ、揃った言語から公開できるようにする (選んだ順に優先)
+        default_weights = language_weights()
+        priority_langs = st.multiselect(
+            "先に仕上げる言語 (上から優先)",
+            target_langs,
+            default=[lang for lang in prioritize_languages(target_langs, default_weights) if language_weight(default_weights, lang) > DEFAULT_WEIGHT],
+            key="priority_langs",
+        )
+        weights = {lang: DEFAULT_WEIGHT for lang in target_langs}
+        weights.update({lang: DEFAULT_WEIGHT + len(priority_langs) - i for i, lang in enumerate(priority_langs)})
+
+        # 中断されたジョブ (セッション再実行・プロセス停止) は完了済みの (item × 言語) を飛ばして再開できる
+        resume_job_id = None
+        unfinished_jobs = [j for j in st_utils.cached_list_jobs(source="main") if j["status"] != COMPLETED]
+        if unfinished_jobs:
+            with st.expander(f"⏸ 未完了のジョブ ({len(unfinished_jobs)}件)", expanded=True):
+                job_labels = {
+                    j["job_id"]: f"{j['job_id']} [{j['status']}] {j['done']}/{j['total']} ({j['engine_mode']})"
+                    for j in unfinished_jobs
+                }
+                selected_job_id = st.selectbox("ジョブ", list(job_labels.keys()), format_func=lambda j: job_labels[j], key="selected_job_id")
+                col_resume, col_cancel = st.columns(2)
+                if col_resume.button("▶️ 再開", key="resume_job_button"):
+                    resume_job_id = selected_job_id
+                if col_cancel.button("⏹ 停止", key="cancel_job_button"):
+                    TranslationJob.load(selected_job_id).cancel()
+                    st.info("停止しました。完了済みの結果はジャーナルに保存されています。")
+
+        # 実行前の見積もり (API 呼び出しなし。キャッシュ・辞書・重複まとめで LLM に行かない分は除外)
+        # 入力が変わらない再実行 (ウィジェット操作) ではキャッシュした見積もりを出す
+        if source_data:
+            cost_plan = st_utils.cached_plan_translation(
+                source_data,
+                list(st.session_state["translated_contents_many"].keys()),
+                api_key=st.session_state.get("gemini_api_key") or None,
+                engine_mode=engine_mode,
+                stages=pre_stages + ("transcreation",),
+                pipelined=pipelined,
+                skip={key for key in reuse if key[0] in target_langs},
+            )
+            stage_plan = cost_plan.stages[-1]
+            with st.expander(f"💴 事前見積もり: API呼び出し 約{cost_plan.calls:.0f}回 / 約{cost_plan.cost_jpy:.1f}円 / 約{cost_plan.wall_seconds / 60:.1f}分"):
+                st.caption(
+                    f"(item×言語) {stage_plan.tasks}タスク → 重複まとめ後 {stage_plan.unique_tasks} / 辞書 {stage_plan.dictionary_hits} / キャッシュ {stage_plan.cache_hits}リクエスト"
+                    f" | 入力 約{cost_plan.input_tokens:,.0f} / 出力 約{cost_plan.output_tokens:,.0f} tokens"
+                    f" | 同時実行 {cost_plan.max_concurrency} (律速: {stage_plan.bottleneck or '-'})"
+                )
+                if reuse:
+                    st.caption(f"♻️ 前回から変わっていない {len(unchanged)}件 / {len(reuse)}タスクは作り直しません")
+            admitted, reason = cost_plan.admit()
+            if not admitted:
+                st.warning(f"見積もりが上限を超えています: {reason}")
+
+        job = None
         if st.button("🚀 Transcreation (一括作成)"):
             if not source_data:
                 st.error("データがありません。CSVをアップロードしてください。")
             else:
-                with st.spinner("14言語のペルソナが執筆中... (Transcreation Engine S1-04)"):
-                    try:
-                        st.write("意訳生成を開始...")
-                        st.write(f"対象データ数: {len(source_data)}件")
-                        
-                        # Use updated langchain_utils ensuring JP source is handled
-                        results = asyncio.run(langchain_utils.translate_english_to_many_async(
-                            menu_items=source_data,
-                            target_languages=st.session_state["translated_contents_many"],
-                            api_key=st.session_state["gemini_api_key"]
-                            # persona arg removed as it's now handled inside the engine per language
-                        ))
-                        
-                        st.session_state["translated_contents_many"].update(results)
+                job = TranslationJob.create(
+                    source_data,
+                    target_langs,
+                    engine_mode=engine_mode,
+                    extra={"source": "main"},
+                    stages=pre_stages,
+                    # 段ごとの実行と同じく、多言語は校正済み日本語から作る (英訳は英語タブ用)
+                    transcreation_source="cleanup",
+                    source_hashes=hashes,
+                    reuse=reuse,
+                    language_weights=weights,
+                )
+        elif resume_job_id:
+            job = TranslationJob.load(resume_job_id)
+
+        if job is not None:
+            st.session_state["translation_job_id"] = job.job_id
+            with st.spinner("14言語のペルソナが執筆中... (Transcreation Engine S1-04)"):
+                try:
+                    st.write(f"意訳生成を開始... (ジョブ: {job.job_id})")
+                    st.write(f"対象データ数: {len(job.menu_items)}件")
+                    skipped = job.unchanged_items()
+                    if skipped:
+                        st.write(f"♻️ 翻訳元が変わっていないためスキップ: {len(skipped)}件 ({', '.join(job.menu_items[i].menu_title for i in skipped[:10])}{' ...' if len(skipped) > 10 else ''})")
+                    
+                    # 全 (item × 言語) タスクの完了ごとに進捗バーを更新
+                    trans_bar = st.progress(0, text="🌏 Transcreation")
+                    live_box = st.empty()
+                    publish_box = st.empty()
+
+                    # 完了したものから順に session_state に書き込む (ジャーナルにも追記されるので再開可能)
+                    many = {
+                        lang: [
+                            done_item or MenuItem(menu_title="(生成中)", menu_content="", id=item.id)
+                            for item, done_item in zip(job.menu_items, done_items)
+                        ]
+                        for lang, done_items in job.results().items()
+                    }
+                    st.session_state["translated_contents_many"] = many
+                    # パイプライン実行では校正済み日本語・英訳も item ごとに届く
+                    stage_keys = {"cleanup": "cleaned_contents", "ja_to_en": "translated_contents"}
+                    if job.stages:
+                        for stage, state_key in stage_keys.items():
+                            st.session_state[state_key] = [
+                                done_item or MenuItem(menu_title="(生成中)", menu_content="", id=item.id)
+                                for item, done_item in zip(job.menu_items, job.stage_results(stage))
+                            ]
+
+                    async def _consume_stream():
+                        async for event in job.run(api_key=st.session_state["gemini_api_key"]):
+                            if event.stage in stage_keys:
+                                st.session_state[stage_keys[event.stage]][event.item_index] = event.result
+                                live_box.markdown(f"✒️ **{event.stage} #{event.item_index + 1}** {event.result.menu_title} ({event.timings['run_sec']:.1f}s)")
+                                continue
+                            many[event.lang][event.item_index] = event.result
+                            trans_bar.progress(int(event.done / event.total * 100), text=f"🌏 Transcreation ({event.done}/{event.total}) - {event.lang} #{event.item_index + 1}")
+                            live_box.markdown(f"✅ **{event.lang} #{event.item_index + 1}** {event.result.menu_title} ({event.timings['run_sec']:.1f}s)")
+                            if event.lang_done:
+                                publish_box.markdown(f"🟢 公開可能: {', '.join(job.published_languages()) or '-'}")
+
+                    asyncio.run(_consume_stream())
+                    live_box.empty()
+                    
+                    job_status = job.status()
+                    if job_status["status"] == COMPLETED:
                         st.success("全言語の意訳 (Transcreation) が完了しました！")
-                        
-                    except Exception as e:
-                        st.error(f"処理中にエラーが発生しました: {e}")
-                        import traceback
-                        st.error(f"スタックトレース: {traceback.format_exc()}")
+                    else:
+                        if job.published_languages():
+                            st.info(f"🟢 公開可能な言語: {', '.join(job.published_languages())}")
+                        st.warning(f"ジョブ {job.job_id} は {job_status['done']}/{job_status['total']} 件で止まりました (エラー {job_status['errors']}件 / QC 未通過 {job_status['pending']}件)。「再開」で残りだけ実行できます。")
+                    qc_stats = get_qc_gate_stats()
+                    st.caption(f"🔎 ローカルQC: 不合格 {qc_stats['local_reject']} / 合格 {qc_stats['local_accept']} / LLM監査 {qc_stats['llm_audit']} (監査省略率 {qc_stats['audits_avoided_ratio']:.0%})")
+                    if CACHE_ENABLED:
+                        cache_stats = get_default_cache().stats()
+                        st.caption(f"♻️ LLMキャッシュ: ヒット {cache_stats['hits']} / ミス {cache_stats['misses']} (ヒット率 {cache_stats['hit_rate']:.0%}, {cache_stats['entries']}件保存)")
+                    pool_stats = get_pool_stats()
+                    st.caption(f"🔌 LLMクライアント: 新規 {pool_stats['created']} / 再利用 {pool_stats['reused']} (再利用率 {pool_stats['reuse_ratio']:.0%}, 保持 {pool_stats['active']})")
+                    for kid, key_stats in get_key_pool_stats(st.session_state["gemini_api_key"]).items():
+                        state = "利用中" if key_stats["available"] else f"休止中 あと{key_stats['available_in_sec']:.0f}s"
+                        st.caption(f"🗝️ APIキー {kid}: 成功 {key_stats['successes']} / 429 {key_stats['rate_limit']} ({key_stats['tokens']} tokens, RPM使用率 {key_stats['rpm_utilization']:.0%}, {state})")
+                    for model, hedge_stats in get_hedge_stats().items():
+                        if hedge_stats["hedged"]:
+                            st.caption(f"⏱️ ヘッジ ({model}): 複製送信 {hedge_stats['hedged']} / 先着 {hedge_stats['hedge_wins']} (送信率 {hedge_stats['hedge_rate']:.0%}, 遅延 p95 {hedge_stats['p95']:.1f}s / p99 {hedge_stats['p99']:.1f}s)")
+                    for model, route_stats in get_routing_stats().get("transcreation", {}).items():
+                        st.caption(f"🪜 モデル ({model}): 合格 {route_stats['passed']} / 不合格 {route_stats['failed']} (合格率 {route_stats['pass_rate']:.0%}, 繰り上げ分 {route_stats['escalated']}, 合格1件あたり {route_stats['cost_per_pass_jpy']:.3f}円)")
+                    json_stats = get_json_stats()
+                    if json_stats["repaired"]:
+                        st.caption(f"🩹 JSON修復: {json_stats['repaired']}件を再生成せずに読み取り (修復率 {json_stats['repair_rate']:.0%}, 読めず {json_stats['failed']}件)")
+                    for stage, format_stats in get_structured_stats().items():
+                        schema_stats = format_stats.get(SCHEMA)
+                        if schema_stats:
+                            st.caption(f"🧾 JSONスキーマ ({stage}): 入力 {schema_stats['avg_prompt_tokens']:.0f} tokens/回 (形式説明より {format_stats['token_reduction']:.0%} 削減), パース失敗率 {schema_stats['parse_failure_rate']:.0%}")
+                    dedup_stats = get_dedup_stats().get("transcreation")
+                    if dedup_stats and dedup_stats["tasks_saved"]:
+                        st.caption(f"🧬 重複まとめ: {dedup_stats['items']}件中 {dedup_stats['items'] - dedup_stats['unique']}件が重複 → {dedup_stats['tasks_saved']}タスク (item×言語) を省略")
+                    dict_stats = get_dictionary_stats()
+                    if dict_stats["skipped"]:
+                        st.caption(f"📖 メニュー辞書: 一致 {dict_stats['hits']} / 未登録 {dict_stats['misses']} → {sum(dict_stats['skipped'].values())}タスクを LLM なしで処理")
+                    prompt_stats = get_prompt_stats().values()
+                    prefix_tokens = sum(s["prefix_tokens"] for s in prompt_stats)
+                    suffix_tokens = sum(s["suffix_tokens"] for s in prompt_stats)
+                    if prefix_tokens + suffix_tokens:
+                        st.caption(f"🧩 プロンプト: 静的プレフィックス {prefix_tokens} / item部分 {suffix_tokens} tokens (プレフィックス比率 {prefix_tokens / (prefix_tokens + suffix_tokens):.0%}, プロバイダキャッシュ読込 {sum(s['cache_read_tokens'] for s in prompt_stats)} tokens)")
+                    
+                except Exception as e:
+                    st.error(f"処理中にエラーが発生しました: {e}")
+                    import traceback
+                    st.error(f"スタックトレース: {traceback.format_exc()}")
         
         # 翻訳結果の表示
         if any(st.session_state["translated_contents_many"].values()):
@@ -254,44 +470,13 @@ if st.session_state["target_contents"]:
                 output = io.StringIO()
                 writer = csv.writer(output, lineterminator='\n')
                 
-                # Header
-                headers = ["日本語メニュー名", "日本語説明", "英語メニュー名", "英語説明"]
-                for lang in st.session_state["translated_contents_many"].keys():
-                    headers.extend([f"{lang}メニュー名", f"{lang}説明", f"{lang}ペアリング"])
-                writer.writerow(headers)
-                
-                # Logic to handle missing intermediate data (Skip Flow support)
-                base_len = len(st.session_state["target_contents"])
-                
-                for i in range(base_len):
-                    row = []
-                    try:
-                        # 1. JP (Cleaned or Original)
-                        if i < len(st.session_state["cleaned_contents"]):
-                            jp_item = st.session_state["cleaned_contents"][i]
-                        else:
-                            jp_item = st.session_state["target_contents"][i]
-                        row.extend([jp_item.menu_title, jp_item.menu_content])
-                        
-                        # 2. EN (Optional - might not exist if skipped)
-                        if i < len(st.session_state["translated_contents"]):
-                            en_item = st.session_state["translated_contents"][i]
-                            row.extend([en_item.menu_title, en_item.menu_content])
-                        else:
-                            row.extend(["(Skipped)", "(Skipped)"])
-                        
-                        # 3. Multi-Lang
-                        for lang in st.session_state["translated_contents_many"].keys():
-                            if i < len(st.session_state["translated_contents_many"][lang]):
-                                m_item = st.session_state["translated_contents_many"][lang][i]
-                                row.extend([m_item.menu_title, m_item.menu_content, m_item.pairing])
-                            else:
-                                row.extend(["", "", ""])
-                            
-                    except Exception as e:
-                        row.extend(["Error", str(e)])
-                    
-                    writer.writerow(row)
+                # Header + rows (JP cleaned or original / EN or "(Skipped)" / each language)
+                writer.writerows(export_rows(
+                    st.session_state["target_contents"],
+                    st.session_state["cleaned_contents"],
+                    st.session_state["translated_contents"],
+                    st.session_state["translated_contents_many"],
+                ))
                 
                 csv_data = '\ufeff' + output.getvalue()
                 st.download_button(
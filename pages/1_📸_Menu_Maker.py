@@ -11,7 +11,7 @@ from typing import List, Dict, Any
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from langchain_google_genai import ChatGoogleGenerativeAI
+from src.llm_pool import get_chat_model
 from langchain_core.messages import HumanMessage
 from langchain_core.output_parsers import JsonOutputParser
 from pydantic import BaseModel, Field
@@ -49,11 +49,8 @@ if not api_key:
 MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
 
 def get_vision_model(api_key):
-    return ChatGoogleGenerativeAI(
-        model=MODEL_NAME,
-        google_api_key=api_key,
-        temperature=0.7,
-    )
+    # クリックごとに作り直さず、プール済みのクライアントを使い回す
+    return get_chat_model(api_key, MODEL_NAME, temperature=0.7)
 
 class MenuItemExtracted(BaseModel):
     menu_name_jp: str = Field(description="日本語のメニュー名")
@@ -126,6 +123,10 @@ def save_menu_to_db(store_id: str, items: List[dict], persona: str):
             "persona": persona,
             "is_recommended": False
         }
+        # Dictionary hits (annotate_with_dictionary) already carry the English name/description
+        if item.get("menu_name_en"):
+            row["menu_name_en"] = item["menu_name_en"]
+            row["description_en"] = item.get("description_en", "")
         db_rows.append(row)
     
     if db_rows:
@@ -58,19 +58,282 @@ with tab6:
     else:
         st.success("✅ All items are confirmed by owner.")
 
-    if st.button("🌏 Start Translation Engine (14 Languages)"):
-        import asyncio
-        from src.langchain_utils import translate_english_to_many_async, MenuItem
-        
-        # 1. API Key Check
+    engine_mode = st.selectbox("Engine Mode", ["per_item", "batched", "multilang"], help="per_item: 1件×1言語 / batched: 1言語で複数件 / multilang: 1件で全言語")
+    pipelined = st.checkbox(
+        "Pipelined (JA -> EN -> Multi per item)",
+        value=False,
+        help="Each item starts its languages as soon as its own English is done, instead of waiting for every item's English. batched behaves like per_item here.",
+    )
+
+    import asyncio
+    from src.langchain_utils import MenuItem
+    from src.translation_jobs import TranslationJob, COMPLETED
+    from src.st_utils import cached_list_jobs, cached_plan_translation
+    from src.source_hash import source_hash, fresh_results, stale_keys
+    from src.language_priority import language_weight, language_weights, prioritize_languages
+
+    # 14 languages is a lot for a demo, let's do top 5 including EN
+    TARGET_LANGUAGES = ["English", "Chinese", "Korean", "Thai", "French"]
+
+    # Per-store language priority: higher weights finish all of their rows first and are published
+    # as soon as they complete (stores.language_weights / stores.published_languages, JSON)
+    try:
+        store_settings = supabase.table("stores").select("language_weights").eq("id", store_id).execute().data or [{}]
+        store_weights = store_settings[0].get("language_weights") or {}
+    except Exception as e:
+        print(f"language_weights not available for {store_id}: {e}")
+        store_weights = {}
+    weights = language_weights(store_weights)
+    with st.expander(f"🌐 Language Priority: {' > '.join(prioritize_languages(TARGET_LANGUAGES, weights))}"):
+        edited_weights = {
+            lang: st.number_input(lang, min_value=0.0, value=float(language_weight(weights, lang)), step=1.0, key=f"weight_{lang}")
+            for lang in TARGET_LANGUAGES
+        }
+        if st.button("Save Priority", key="save_language_weights"):
+            try:
+                supabase.table("stores").update({"language_weights": {**store_weights, **edited_weights}}).eq("id", store_id).execute()
+                st.success("Saved.")
+            except Exception as e:
+                st.error(f"Could not save language weights: {e}")
+        weights.update(edited_weights)
+
+    # Incremental: each row records the source hash (JA text + persona + prompt version) its EN and
+    # each language were generated from. Only rows / languages whose hash is stale are regenerated.
+    store_rows = supabase.table("menu_master").select("*").eq("store_id", store_id).execute().data or []
+    rows_by_id = {row["id"]: row for row in store_rows}
+
+    def _source_item(row):
+        return MenuItem(menu_title=row.get("menu_name_ja", ""), menu_content=row.get("description_ja_18s", ""))
+
+    def _recorded_results(row):
+        """The EN columns and the translations JSON as MenuItems, each with the hash it was generated from"""
+        recorded = {}
+        if row.get("menu_name_en"):
+            recorded["ja_to_en"] = MenuItem(
+                menu_title=row["menu_name_en"], menu_content=row.get("description_en") or "",
+                status="confirmed", source_hash=row.get("source_hash") or "",
+                source_title=row.get("menu_name_ja", ""),
+            )
+        for lang, t in (row.get("translations") or {}).items():
+            recorded[lang] = MenuItem(
+                menu_title=t.get("name", ""), menu_content=t.get("description", ""), pairing=t.get("pairing", ""),
+                status="confirmed", source_hash=t.get("source_hash", ""),
+            )
+        return recorded
+
+    # Rows with anything to (re)generate, and what can be reused for them (keyed by position in stale_rows)
+    row_keys = TARGET_LANGUAGES + ["ja_to_en"]
+    stale_rows, reuse, skipped_rows = [], {}, []
+    for row in store_rows:
+        row_hash = source_hash(_source_item(row))
+        recorded = _recorded_results(row)
+        fresh = fresh_results([row_hash], {key: [item] for key, item in recorded.items()})
+        if not stale_keys(set(fresh), row_keys, 0):
+            skipped_rows.append(row)
+            continue
+        idx = len(stale_rows)
+        stale_rows.append(row)
+        reuse.update({(key, idx): item for (key, _), item in fresh.items()})
+    if skipped_rows:
+        st.info(f"♻️ {len(skipped_rows)} rows are up to date (source unchanged since their last translation) and will be skipped.")
+        with st.expander("Skipped rows"):
+            st.write([row.get("menu_name_ja", "") for row in skipped_rows])
+
+    def _get_api_key():
+        # Extra keys (comma-separated) join the pool of the deployment key only: calls are spread across keys by per-key quota.
+        # A session falling back to its own key keeps whatever main.py registered for that key.
+        from src.key_pool import register_keys
         try:
             api_key = st.secrets["GEMINI_API_KEY"]
         except:
             if "gemini_api_key" in st.session_state:
-                api_key = st.session_state["gemini_api_key"]
-            else:
-                st.error("API Key not found.")
-                st.stop()
+                return st.session_state["gemini_api_key"]
+            st.error("API Key not found.")
+            st.stop()
+        try:
+            register_keys(api_key, str(st.secrets.get("GEMINI_API_KEYS", "")).split(","))
+        except Exception:
+            pass
+        return api_key
+
+    def _run_translation_job(job, api_key):
+        # Step B: EN -> Multi (streamed + journaled)
+        # Each row is written to the DB as soon as all of its languages are done.
+        # A resumed job only runs the (item, language) pairs missing from its journal.
+        # Pipelined jobs start from JA and stream each item's EN before its languages.
+        en_items = job.stage_results("ja_to_en")
+        row_ids = job.extra["row_ids"]
+        results = job.results()
+        completed = job.completed_tasks()
+        remaining = [
+            sum(1 for lang in job.languages if (lang, idx) not in completed)
+            for idx in range(len(en_items))
+        ]
+
+        # 5. Save to DB
+        # This is tricky because we need to map back to original IDs.
+        # Since lists preserve order:
+        def _save_row(idx):
+            db_id = row_ids[idx]
+            updates = {
+                "description_ja_status": "confirmed", # Mark as processed
+                # Save EN
+                "menu_name_en": en_items[idx].menu_title,
+                "description_en": en_items[idx].menu_content,
+                "source_hash": en_items[idx].source_hash,
+            }
+            
+            # Save others as JSON (we don't have columns for all languages), each with the hash it was generated from
+            translations = dict(rows_by_id.get(db_id, {}).get("translations") or {})
+            for lang, translated_list in results.items():
+                item = translated_list[idx]
+                if item is not None and item.is_translated:
+                    translations[lang] = {
+                        "name": item.menu_title,
+                        "description": item.menu_content,
+                        "pairing": item.pairing,
+                        "source_hash": item.source_hash,
+                    }
+            updates["translations"] = translations
+            
+            try:
+                supabase.table("menu_master").update(updates).eq("id", db_id).execute()
+            except Exception as e:
+                # Tables without the translations / source_hash columns still get the EN columns
+                print(f"Update failed for {db_id}: {e}")
+                try:
+                    legacy = {k: v for k, v in updates.items() if k not in ("translations", "source_hash")}
+                    supabase.table("menu_master").update(legacy).eq("id", db_id).execute()
+                except Exception as e:
+                    print(f"Update failed for {db_id}: {e}")
+
+        # Rows finished before an interruption may not have reached the DB yet (updates are idempotent)
+        for idx, n in enumerate(remaining):
+            if n == 0 and en_items[idx] is not None:
+                _save_row(idx)
+
+        def _publish():
+            # A completed language goes live right away: write it to every row and mark it on the store
+            for idx in range(len(en_items)):
+                if en_items[idx] is not None:
+                    _save_row(idx)
+            try:
+                supabase.table("stores").update({"published_languages": job.published_languages()}).eq("id", job.extra.get("store_id", store_id)).execute()
+            except Exception as e:
+                print(f"Could not mark published languages for {store_id}: {e}")
+            publish_box.success(f"🟢 Publishable: {', '.join(job.published_languages())}")
+
+        trans_bar = st.progress(0, text="JA -> EN -> Multi" if job.stages else "EN -> Multi")
+        publish_box = st.empty()
+        if job.published_languages():
+            publish_box.success(f"🟢 Publishable: {', '.join(job.published_languages())}")
+
+        async def _consume_stream():
+            async for event in job.run(api_key):
+                if event.stage != "transcreation":
+                    if event.stage == "ja_to_en" and event.result.status != "error":
+                        en_items[event.item_index] = event.result
+                    continue
+                results[event.lang][event.item_index] = event.result
+                remaining[event.item_index] -= 1
+                if remaining[event.item_index] == 0 and en_items[event.item_index] is not None:
+                    _save_row(event.item_index)
+                trans_bar.progress(int(event.done / event.total * 100), text=f"EN -> Multi ({event.done}/{event.total})")
+                if event.lang_done and event.lang in job.published_languages():
+                    _publish()
+
+        asyncio.run(_consume_stream())
+
+        job_status = job.status()
+        if job_status["status"] == COMPLETED:
+            st.success(f"Translation Complete for {len(en_items)} items!")
+        else:
+            st.warning(f"Job {job.job_id} stopped at {job_status['done']}/{job_status['total']} ({job_status['errors']} errors, {job_status['pending']} pending QC). Resume it to run the rest.")
+        from src.llm_cache import CACHE_ENABLED, get_default_cache
+        from src.qc_rules import get_qc_gate_stats
+        qc_stats = get_qc_gate_stats()
+        st.caption(f"🔎 Local QC: {qc_stats['local_reject']} rejected / {qc_stats['local_accept']} accepted / {qc_stats['llm_audit']} sent to LLM audit ({qc_stats['audits_avoided_ratio']:.0%} of audits avoided)")
+        if CACHE_ENABLED:
+            cache_stats = get_default_cache().stats()
+            st.caption(f"♻️ LLM Cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses (hit rate {cache_stats['hit_rate']:.0%}, {cache_stats['entries']} entries)")
+        from src.llm_pool import get_pool_stats
+        pool_stats = get_pool_stats()
+        st.caption(f"🔌 LLM Clients: {pool_stats['created']} created / {pool_stats['reused']} reused (reuse {pool_stats['reuse_ratio']:.0%}, {pool_stats['active']} pooled)")
+        from src.key_pool import get_key_pool_stats
+        for kid, key_stats in get_key_pool_stats(api_key).items():
+            state = "active" if key_stats["available"] else f"benched for {key_stats['available_in_sec']:.0f}s"
+            st.caption(f"🗝️ API Key {kid}: {key_stats['successes']} ok / {key_stats['rate_limit']} rate-limited ({key_stats['tokens']} tokens, RPM utilization {key_stats['rpm_utilization']:.0%}, {state})")
+        from src.hedging import get_hedge_stats
+        for model, hedge_stats in get_hedge_stats().items():
+            if hedge_stats["hedged"]:
+                st.caption(f"⏱️ Hedging ({model}): {hedge_stats['hedged']} duplicates sent / {hedge_stats['hedge_wins']} won ({hedge_stats['hedge_rate']:.0%} of calls, latency p95 {hedge_stats['p95']:.1f}s / p99 {hedge_stats['p99']:.1f}s)")
+        from src.model_routing import get_routing_stats
+        for stage, models in get_routing_stats().items():
+            for model, route_stats in models.items():
+                st.caption(f"🪜 Routing {stage} → {model}: {route_stats['passed']} passed / {route_stats['failed']} failed ({route_stats['pass_rate']:.0%}, {route_stats['escalated']} escalated, {route_stats['cost_per_pass_jpy']:.3f} JPY per pass)")
+        from src.llm_json import get_json_stats
+        json_stats = get_json_stats()
+        if json_stats["repaired"]:
+            st.caption(f"🩹 JSON Repair: {json_stats['repaired']} responses repaired instead of regenerated ({json_stats['repair_rate']:.0%} of parses, {json_stats['failed']} unreadable)")
+        from src.structured_output import get_structured_stats
+        for stage, format_stats in get_structured_stats().items():
+            for mode in ("instructions", "schema"):
+                if mode in format_stats:
+                    mode_stats = format_stats[mode]
+                    st.caption(f"🧾 Output format {stage} ({mode}): {mode_stats['avg_prompt_tokens']:.0f} prompt tokens/call, {mode_stats['parse_failure_rate']:.0%} parse failures over {mode_stats['calls']} calls")
+            if format_stats["parse_failure_rate_delta"] is not None:
+                st.caption(f"🧾 {stage}: schema vs instructions {format_stats['token_reduction']:.0%} fewer prompt tokens, parse failure rate {format_stats['parse_failure_rate_delta']:+.0%}")
+        from src.menu_dictionary import get_dictionary_stats
+        dict_stats = get_dictionary_stats()
+        if dict_stats["skipped"]:
+            st.caption(f"📖 Menu Dictionary: {dict_stats['hits']} hits / {dict_stats['misses']} misses → {sum(dict_stats['skipped'].values())} tasks served without the LLM")
+        if job_status["status"] == COMPLETED:
+            st.balloons()
+
+    # Unfinished jobs for this store (session rerun / process restart)
+    store_jobs = [j for j in cached_list_jobs(source="admin", store_id=store_id) if j["status"] != COMPLETED]
+    if store_jobs:
+        st.subheader("⏸ Unfinished Jobs")
+        st.dataframe(store_jobs, use_container_width=True)
+        selected_job_id = st.selectbox("Job", [j["job_id"] for j in store_jobs], key="admin_selected_job_id")
+        col_resume, col_cancel = st.columns(2)
+        if col_resume.button("▶️ Resume Job", key="admin_resume_job"):
+            with st.spinner(f"Resuming {selected_job_id}..."):
+                _run_translation_job(TranslationJob.load(selected_job_id), _get_api_key())
+        if col_cancel.button("⏹ Cancel Job", key="admin_cancel_job"):
+            TranslationJob.load(selected_job_id).cancel()
+            st.info("Cancelled. Completed results are kept in the job journal.")
+
+    # Pre-flight estimate (no API calls): JA -> EN, then EN -> targets (stale rows / languages only)
+    if stale_rows:
+        estimate_items = [_source_item(row) for row in stale_rows]
+        try:
+            estimate_key = st.secrets["GEMINI_API_KEY"]
+        except:
+            estimate_key = st.session_state.get("gemini_api_key")  # None: cache hits are not counted
+        # Cached per input: widget reruns do not re-estimate
+        cost_plan = cached_plan_translation(
+            estimate_items,
+            TARGET_LANGUAGES,
+            api_key=estimate_key,
+            engine_mode=engine_mode,
+            stages=("ja_to_en", "transcreation"),
+            pipelined=pipelined,
+            skip={key for key in reuse if key[0] in TARGET_LANGUAGES},
+        )
+        st.info(
+            f"💴 Estimate: ~{cost_plan.calls:.0f} calls / ~{cost_plan.input_tokens:,.0f} in + ~{cost_plan.output_tokens:,.0f} out tokens"
+            f" / ~{cost_plan.cost_jpy:.1f} JPY / ~{cost_plan.wall_seconds / 60:.1f} min"
+        )
+        st.dataframe([stage.to_dict() for stage in cost_plan.stages], use_container_width=True)
+        admitted, reason = cost_plan.admit()
+        if not admitted:
+            st.warning(f"Estimate exceeds the configured limit: {reason}")
+
+    if st.button("🌏 Start Translation Engine (14 Languages)"):
+        
+        # 1. API Key Check
+        api_key = _get_api_key()
 
         with st.spinner("Processing Translations (with Cache & Gemini)..."):
             # 2. Prepare Data (Convert DB rows to MenuItem)
@@ -80,11 +343,11 @@ with tab6:
             # For this 'Suzuka' demo, let's assume we are doing EN -> Multi.
             # If EN doesn't exist, we might need JA -> EN first.
             
-            # Simple Logic: Only process items that have description_ja_18s
+            # Simple Logic: Only process rows whose source changed since their last translation (stale_rows)
             target_items = []
             row_map = {} # db_id -> MenuItem
             
-            for row in pending_trans.data:
+            for row in stale_rows:
                 # Use JA name/desc as source if EN is missing
                 # In a real app we would ensure EN exists first.
                 # Here we pass JA in as 'menu_title' so the pipeline sees it.
@@ -99,59 +362,43 @@ with tab6:
                 st.warning("No items to translate.")
             else:
                 # 3. Define Targets
-                # 14 languages is a lot for a demo, let's do top 5 including EN
-                targets = {
-                    "English": [], "Chinese": [], "Korean": [], "Thai": [], "French": [] 
-                }
+                targets = {lang: [] for lang in TARGET_LANGUAGES}
                 
                 # 4. Run Async Pipeline
                 # This function usually translates FROM English. 
                 # If our input is Japanese, it might be weird.
                 # Ideally we run JA->EN first.
                 # Let's assume the pipeline handles it or we trust the LLM to translate from JA if EN is missing.
-                # Actually, langchain_utils.translate_english_to_many_async takes 'menu_items'.
+                # Actually, langchain_utils.translate_english_to_many_stream takes 'menu_items'.
                 
                 # Let's run JA -> EN first for better quality
-                from src.langchain_utils import translate_japanese_to_english
-                
-                # Step A: JA -> EN (if needed) - cost logged as trans_en
-                en_items = translate_japanese_to_english(target_items, api_key) # Sync call
-                
-                # Step B: EN -> Multi
-                results = asyncio.run(translate_english_to_many_async(en_items, targets, api_key))
-                
-                # 5. Save to DB
-                # This is tricky because we need to map back to original IDs.
-                # Since lists preserve order:
-                for idx, row in enumerate(pending_trans.data):
-                    db_id = row["id"]
-                    updates = {
-                        "description_ja_status": "confirmed", # Mark as processed
-                        # Save EN
-                        "menu_name_en": en_items[idx].menu_title,
-                        "description_en": en_items[idx].menu_content,
-                    }
-                    
-                    # Save others
-                    for lang, translated_list in results.items():
-                        # Map lang to DB column
-                        col_prefix = "description_" + lang[:2].lower() # simple heuristic
-                        if lang == "Chinese": col_prefix = "description_zh"
-                        if lang == "Korean": col_prefix = "description_ko"
-                        if lang == "Thai": col_prefix = "description_th"
-                        if lang == "French": col_prefix = "description_fr"
-                        
-                        # We might not have columns for all, but try best effort
-                        # In this demo, we might just store JSON or confirm success
-                        pass
-                    
-                    try:
-                        supabase.table("menu_master").update(updates).eq("id", db_id).execute()
-                    except Exception as e:
-                        print(f"Update failed for {db_id}: {e}")
-                
-                st.success(f"Translation Complete for {len(target_items)} items!")
-                st.balloons()
+                extra = {"source": "admin", "store_id": store_id, "row_ids": [row["id"] for row in stale_rows]}
+                hashes = [source_hash(item) for item in target_items]
+                if pipelined:
+                    # Step A + B per item: each item's EN is journaled and feeds its languages right away
+                    job = TranslationJob.create(
+                        target_items, list(targets.keys()), engine_mode=engine_mode, extra=extra,
+                        stages=("ja_to_en",), source_hashes=hashes, reuse=reuse, language_weights=weights,
+                    )
+                else:
+                    from src.langchain_utils import translate_japanese_to_english
+
+                    # Step A: JA -> EN (if needed) - cost logged as trans_en. Rows with an up-to-date EN keep it.
+                    en_needed = [idx for idx in range(len(target_items)) if ("ja_to_en", idx) not in reuse]
+                    en_items = [reuse.get(("ja_to_en", idx)) for idx in range(len(target_items))]
+                    if en_needed:
+                        translated = translate_japanese_to_english([target_items[idx] for idx in en_needed], api_key) # Sync wrapper (parallel inside, drives st.progress)
+                        for idx, item in zip(en_needed, translated):
+                            item.source_hash = hashes[idx]
+                            en_items[idx] = item
+
+                    # The EN items are stored in the job journal, so a resume skips Step A as well
+                    job = TranslationJob.create(
+                        en_items, list(targets.keys()), engine_mode=engine_mode, extra=extra,
+                        source_hashes=hashes, reuse={key: item for key, item in reuse.items() if key[0] != "ja_to_en"},
+                        language_weights=weights,
+                    )
+                _run_translation_job(job, api_key)
 
 # --- Shared Asset Logic ---
 # --- Shared Asset Logic ---
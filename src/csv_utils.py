@@ -1,4 +1,4 @@
-from typing import List
+from typing import Dict, List, Tuple
 
 def is_valid_row(row: List[str], ignore_keywords: List[str]) -> bool:
     """
@@ -21,4 +21,89 @@ def is_valid_row(row: List[str], ignore_keywords: List[str]) -> bool:
     
     # S列(index 18) = メニュー名、T列(index 19) = 説明文
     # これらが存在する場合のみ有効
-    return row[18] and row[19]
\ No newline at end of file
+    return row[18] and row[19]
+
+def extract_menu_rows(rows: List[List[str]], ignore_keywords: List[str]) -> List[Tuple[str, str]]:
+    """
+    CSVの行リストから (メニュー名, 説明文) のペアを抜き出す
+
+    - ヒアリングシート形式 (S列=メニュー名, T列=説明文) は is_valid_row で判定
+    - resources/ のサンプル形式 (A列=番号, B列=メニュー名, C列=説明) は
+      番号が1以上の数字で、メニュー名・説明文が両方ある行のみ採用
+
+    Args:
+        rows (List[List[str]]): CSVの全行
+        ignore_keywords (List[str]): 無視するキーワードのリスト
+
+    Returns:
+        List[Tuple[str, str]]: (メニュー名, 説明文) のリスト
+    """
+    pairs = []
+    for row in rows:
+        if is_valid_row(row, ignore_keywords):
+            pairs.append((row[18], row[19]))
+        elif len(row) >= 3 and row[0].strip().isdigit() and int(row[0]) > 0 and row[1].strip() and row[2].strip():
+            pairs.append((row[1].strip(), row[2].strip()))
+    return pairs
+
+def extract_store_name(rows: List[List[str]]) -> str:
+    """
+    ヒアリングシートの「店舗名」行 (A列=店舗名, B列=店舗名の値) から店舗名を取り出す
+
+    Returns:
+        str: 店舗名 (見つからなければ空文字)
+    """
+    for row in rows:
+        if len(row) >= 2 and row[0].strip() == "店舗名" and row[1].strip():
+            return row[1].strip()
+    return ""
+
+def export_rows(originals: List, cleaned: List, english: List, translations: Dict[str, List]) -> List[List[str]]:
+    """
+    翻訳結果を main.py の「csvファイルを作成」と同じレイアウトの行 (ヘッダ付き) にする
+
+    列: 日本語メニュー名, 日本語説明, 英語メニュー名, 英語説明, 言語ごとに (メニュー名, 説明, ペアリング)
+    日本語は校正済みがあればそれ、無ければ原文。英訳が無い item は "(Skipped)"。未完了の言語は空欄。
+
+    Args:
+        originals (List[MenuItem]): 原文
+        cleaned (List[MenuItem]): 校正済み日本語 (未実行・未完了の位置は None または短いリスト)
+        english (List[MenuItem]): 英訳 (同上)
+        translations (Dict[str, List[MenuItem]]): {言語: [MenuItem]}
+
+    Returns:
+        List[List[str]]: ヘッダ行 + item ごとの行
+    """
+    headers = ["日本語メニュー名", "日本語説明", "英語メニュー名", "英語説明"]
+    for lang in translations.keys():
+        headers.extend([f"{lang}メニュー名", f"{lang}説明", f"{lang}ペアリング"])
+    rows = [headers]
+
+    def _at(items: List, i: int):
+        return items[i] if i < len(items) else None
+
+    for i, original in enumerate(originals):
+        row = []
+        try:
+            # 1. JP (Cleaned or Original)
+            jp_item = _at(cleaned, i) or original
+            row.extend([jp_item.menu_title, jp_item.menu_content])
+
+            # 2. EN (Optional - might not exist if skipped)
+            en_item = _at(english, i)
+            if en_item is not None:
+                row.extend([en_item.menu_title, en_item.menu_content])
+            else:
+                row.extend(["(Skipped)", "(Skipped)"])
+
+            # 3. Multi-Lang
+            for items in translations.values():
+                m_item = _at(items, i)
+                if m_item is not None:
+                    row.extend([m_item.menu_title, m_item.menu_content, m_item.pairing])
+                else:
+                    row.extend(["", "", ""])
+        except Exception as e:
+            row.extend(["Error", str(e)])
+        rows.append(row)
+    return rows
@@ -0,0 +1,88 @@
+import re
+import unicodedata
+import uuid
+from dataclasses import replace
+from threading import Lock
+from typing import Dict, List, Sequence, Tuple
+
+from .models import MenuItem
+
+# 同一 run 内の重複 item (ランチ / ディナーの両ページにある「生ビール」など) を
+# 1件の作業単位にまとめ、結果を元の全位置に配り直す。
+
+_SPACE_PATTERN = re.compile(r"\s+")
+
+_stats_lock = Lock()
+_stats: Dict[str, Dict[str, int]] = {}
+
+
+def canonical_key(item: MenuItem) -> Tuple[str, str]:
+    """(title, content) を NFKC 正規化・空白畳み込み・小文字化したキー"""
+    def _norm(text: str) -> str:
+        text = unicodedata.normalize("NFKC", text or "")
+        return _SPACE_PATTERN.sub(" ", text).strip().lower()
+    return _norm(item.menu_title), _norm(item.menu_content)
+
+
+def dedupe_items(items: Sequence[MenuItem]) -> Tuple[List[MenuItem], List[List[int]]]:
+    """
+    正規化キーが同じ item をまとめる (初出順を維持)。
+
+    Returns:
+        unique_items: 重複を除いた item (各グループの初出)
+        positions: unique_items[u] が元のどの位置に対応するか (positions[u][0] が初出位置)
+    """
+    index: Dict[Tuple[str, str], int] = {}
+    unique_items: List[MenuItem] = []
+    positions: List[List[int]] = []
+    for pos, item in enumerate(items):
+        key = canonical_key(item)
+        u = index.get(key)
+        if u is None:
+            index[key] = len(unique_items)
+            unique_items.append(item)
+            positions.append([pos])
+        else:
+            positions[u].append(pos)
+    return unique_items, positions
+
+
+def copy_for_position(result: MenuItem) -> MenuItem:
+    """重複位置に配る結果のコピー (同じ MenuItem を共有しないよう id は振り直す)"""
+    return replace(result, id=str(uuid.uuid4()))
+
+
+def fan_out(unique_results: Sequence[MenuItem], positions: List[List[int]], total: int) -> List[MenuItem]:
+    """unique_items の結果を元の並び (長さ total) に展開する"""
+    results: List[MenuItem] = [None] * total
+    for res, group in zip(unique_results, positions):
+        results[group[0]] = res
+        for pos in group[1:]:
+            results[pos] = copy_for_position(res)
+    return results
+
+
+def record_dedup(stage: str, items: int, unique: int, tasks_per_item: int = 1):
+    """
+    ステージごとの重複削減を集計する。
+    tasks_per_item は 1 item あたりの作業数 (多言語ステージなら言語数)
+    """
+    with _stats_lock:
+        s = _stats.setdefault(stage, {"items": 0, "unique": 0, "tasks_saved": 0})
+        s["items"] += items
+        s["unique"] += unique
+        s["tasks_saved"] += (items - unique) * tasks_per_item
+
+
+def get_dedup_stats() -> Dict[str, dict]:
+    """
+    {stage: {items, unique, tasks_saved}}。
+    tasks_saved は重複のために発生しなかった (item × 言語) タスク数 = per_item モードでの節約呼び出し数
+    """
+    with _stats_lock:
+        return {stage: dict(s) for stage, s in _stats.items()}
+
+
+def reset_dedup_stats():
+    with _stats_lock:
+        _stats.clear()
@@ -0,0 +1,344 @@
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import time
+from dataclasses import dataclass, fields, replace
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage
+
+from .languages import canonical_language
+from .token_estimator import estimate_tokens
+
+# --------------------------------------------------------------------
+# Fake Gemini Provider
+# --------------------------------------------------------------------
+# API キーなしでパイプライン全体を動かすためのチャットモデル。
+# LLM_PROVIDER=fake のとき llm_pool.get_chat_model がこれを返す。
+# プロンプトの種類 (校正 / 英訳 / Transcreation / バッチ / 全言語 / QC / 画像抽出) を見分けて
+# 各パーサが受け付ける形の JSON を返し、遅延・エラー・429・トークン数を設定どおりに再現する。
+
+
+@dataclass(frozen=True)
+class FakeLLMConfig:
+    latency_median_ms: float = 800.0   # 1呼び出しの遅延 (対数正規分布の中央値)
+    latency_sigma: float = 0.5         # 対数正規分布の σ (0 = 固定遅延)
+    ms_per_output_token: float = 4.0   # 出力トークンあたりの追加遅延
+    error_rate: float = 0.0            # 5xx (transient) を返す割合
+    rate_limit_rate: float = 0.0       # 429 を返す割合
+    malformed_rate: float = 0.0        # 壊れた JSON を返す割合
+    schema_malformed_rate: float = 0.0 # JSON スキーマ指定 (response_json_schema) の呼び出しで壊れた JSON を返す割合
+    qc_fail_rate: float = 0.0          # Transcreation で QC 不合格になる (短すぎる) 出力の割合
+    vision_items: int = 20             # 画像抽出で返す item 数
+    seed: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> "FakeLLMConfig":
+        seed = os.getenv("FAKE_LLM_SEED")
+        return cls(
+            latency_median_ms=float(os.getenv("FAKE_LLM_LATENCY_MS", "800")),
+            latency_sigma=float(os.getenv("FAKE_LLM_LATENCY_SIGMA", "0.5")),
+            ms_per_output_token=float(os.getenv("FAKE_LLM_MS_PER_OUTPUT_TOKEN", "4")),
+            error_rate=float(os.getenv("FAKE_LLM_ERROR_RATE", "0")),
+            rate_limit_rate=float(os.getenv("FAKE_LLM_429_RATE", "0")),
+            malformed_rate=float(os.getenv("FAKE_LLM_MALFORMED_RATE", "0")),
+            schema_malformed_rate=float(os.getenv("FAKE_LLM_SCHEMA_MALFORMED_RATE", "0")),
+            qc_fail_rate=float(os.getenv("FAKE_LLM_QC_FAIL_RATE", "0")),
+            vision_items=int(os.getenv("FAKE_LLM_VISION_ITEMS", "20")),
+            seed=int(seed) if seed else None,
+        )
+
+
+class FakeAPIError(Exception):
+    """Gemini の API エラーに見せかけた例外 (rate_limiter.classify_error が code で分類する)"""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+_config = FakeLLMConfig.from_env()
+_rng = random.Random(_config.seed)
+_lock = Lock()
+_stats: Dict[str, Dict[str, Any]] = {}
+
+
+def configure_fake_llm(**overrides) -> FakeLLMConfig:
+    """設定を差し替える (ベンチマーク用)。seed を渡すと乱数列もリセットする"""
+    global _config
+    unknown = set(overrides) - {f.name for f in fields(FakeLLMConfig)}
+    if unknown:
+        raise TypeError(f"Unknown fake LLM settings: {sorted(unknown)}")
+    with _lock:
+        _config = replace(_config, **overrides)
+        if "seed" in overrides:
+            _rng.seed(overrides["seed"])
+        return _config
+
+
+def get_fake_config() -> FakeLLMConfig:
+    return _config
+
+
+def _record(kind: str, latency: float, outcome: str, tokens_in: int, tokens_out: int):
+    with _lock:
+        s = _stats.setdefault(kind, {"calls": 0, "errors": 0, "rate_limited": 0, "malformed": 0, "timeouts": 0, "tokens_in": 0, "tokens_out": 0, "latencies": []})
+        s["calls"] += 1
+        if outcome != "ok":
+            s[outcome] += 1
+        s["tokens_in"] += tokens_in
+        s["tokens_out"] += tokens_out
+        s["latencies"].append(latency)
+
+
+def get_fake_stats() -> Dict[str, dict]:
+    """{プロンプト種別: {calls, errors, rate_limited, malformed, timeouts, tokens_in, tokens_out, latencies}}"""
+    with _lock:
+        return {kind: {**s, "latencies": list(s["latencies"])} for kind, s in _stats.items()}
+
+
+def reset_fake_stats():
+    with _lock:
+        _stats.clear()
+
+
+# --------------------------------------------------------------------
+# Responders: (種別名, 判定, 応答生成)。先に一致したものを使う
+# --------------------------------------------------------------------
+# 言語ごとの説明文の素材 (qc_rules のスクリプト判定・文字数予算を満たすもの)
+_FILLER = {
+    "Korean": ("구운 요리", "겉은 바삭하고 속은 촉촉한 식감을 즐겨 보세요. 소스를 곁들이면 풍미가 더욱 깊어집니다. "),
+    "Thai": ("อาหารย่าง", "เนื้อสัมผัสกรอบนอกนุ่มใน รับประทานคู่กับซอสเพื่อรสชาติที่กลมกล่อมยิ่งขึ้น "),
+    "Chinese": ("烤料理", "外皮香脆内里多汁口感丰富建议搭配酱汁一起品尝风味更佳"),
+    "Taiwanese": ("烤料理", "外皮香脆內裡多汁口感豐富建議搭配醬汁一起品嚐風味更佳"),
+    "Cantonese": ("烤料理", "外皮香脆內裡多汁口感豐富建議搭配醬汁一起品嚐風味更佳"),
+}
+_LATIN_FILLER = ("Grilled dish", "Crisp outside and juicy inside, enjoy it with the house sauce and a light drink. ")
+_BUDGET_CHARS = {"English": 240, "Chinese": 120, "Taiwanese": 120, "Cantonese": 120, "Korean": 150, "Thai": 250}
+
+
+def _text_of(inputs: Any) -> str:
+    if isinstance(inputs, str):
+        return inputs
+    if isinstance(inputs, (list, tuple)):
+        return "\n".join(_text_of(v) for v in inputs)
+    if isinstance(inputs, dict):
+        return str(inputs.get("text", ""))
+    if hasattr(inputs, "to_string"):
+        return inputs.to_string()
+    content = getattr(inputs, "content", None)
+    return _text_of(content) if content is not None else str(inputs)
+
+
+def _json_after(text: str, marker: str, end_marker: Optional[str] = None) -> Any:
+    # マーカーはルール文中にも出てくる (例: "listed in [PERSONAS]") ので最後の出現 = セクション見出しから読む
+    body = text.rsplit(marker, 1)[1]
+    if end_marker and end_marker in body:
+        body = body.split(end_marker, 1)[0]
+    try:
+        return json.loads(body.strip())
+    except json.JSONDecodeError:
+        return None
+
+
+def _language(text: str) -> str:
+    m = re.search(r"- Language:\s*(.+)", text)
+    return m.group(1).strip() if m else "English"
+
+
+def _transcreation(lang: str, seed: str) -> dict:
+    # 呼び出し側は "韓国語" / "Korean" のどちらでも渡すので英語名に揃えてから引く
+    lang = canonical_language(lang)
+    name, unit = _FILLER.get(lang, _LATIN_FILLER)
+    budget = _BUDGET_CHARS.get(lang, 260)
+    if _rng.random() < _config.qc_fail_rate:
+        description = unit[:5]
+    else:
+        description = (unit * (int(budget * 0.8) // len(unit) + 1))[: int(budget * 0.8)].strip()
+    return {"name": f"{name} {seed}".strip(), "description": description, "pairing": "Sake" if lang not in _FILLER else name}
+
+
+def _item_name(text: str) -> str:
+    m = re.search(r"Item name \(JP\):\s*(.+)", text)
+    return m.group(1).strip()[:20] if m else ""
+
+
+def _menu_json(text: str, marker: str, end_marker: str, english: bool) -> str:
+    src = _json_after(text, marker, end_marker) or {}
+    title = str(src.get("menu_title", ""))
+    content = str(src.get("menu_content", ""))
+    if english:
+        title, content = f"{title} (EN)", _LATIN_FILLER[1] * 2
+    return "```json\n" + json.dumps({"menu_title": title, "menu_content": content}, ensure_ascii=False) + "\n```"
+
+
+def _cleanup_en(text: str) -> str:
+    src = _json_after(text, "【原文】", "【校正・英訳】") or {}
+    ja = {"menu_title": str(src.get("menu_title", "")), "menu_content": str(src.get("menu_content", ""))}
+    en = {"menu_title": f"{ja['menu_title']} (EN)", "menu_content": _LATIN_FILLER[1] * 2}
+    return "```json\n" + json.dumps({"ja": ja, "en": en}, ensure_ascii=False) + "\n```"
+
+
+def _qc(text: str) -> str:
+    if "[Items (Source JP -> Generated)]" in text:
+        items = _json_after(text, "[Items (Source JP -> Generated)]") or []
+        return json.dumps({str(it.get("id")): "PASS" for it in items})
+    if "[Generated (keyed by language)]" in text:
+        generated = _json_after(text, "[Generated (keyed by language)]") or {}
+        return json.dumps({lang: "PASS" for lang in generated})
+    return "PASS"
+
+
+def _batch(text: str) -> str:
+    lang = _language(text)
+    items = _json_after(text, "[INPUT ITEMS]") or []
+    return json.dumps([{"id": it.get("id"), **_transcreation(lang, str(it.get("name_ja", ""))[:20])} for it in items], ensure_ascii=False)
+
+
+def _multilang(text: str) -> str:
+    personas = _json_after(text, "[PERSONAS]", "[INPUT]") or {}
+    seed = _item_name(text)
+    return json.dumps({lang: _transcreation(lang, seed) for lang in personas}, ensure_ascii=False)
+
+
+def _vision(_text: str) -> str:
+    items = [
+        {
+            "menu_name_jp": f"料理{i + 1}",
+            "price": str(500 + 100 * (i % 10)),
+            "category": ["Appetizer", "Main", "Drink", "Dessert"][i % 4],
+            "description_rich": "外はカリッと中はふっくら。自家製のタレでどうぞ。",
+        }
+        for i in range(_config.vision_items)
+    ]
+    return json.dumps({"items": items}, ensure_ascii=False)
+
+
+def _full_page(_text: str) -> str:
+    items = [
+        {"name_ja_raw": f"料理{i + 1}", "price_raw": f"{500 + 100 * (i % 10)}円", "price_val": 500 + 100 * (i % 10),
+         "category_raw": "一品料理", "is_set": False, "confidence": 0.95}
+        for i in range(_config.vision_items)
+    ]
+    return json.dumps({"items": items, "meta": {"layout_type": "list", "warnings": []}}, ensure_ascii=False)
+
+
+def _extract_items(_text: str) -> str:
+    return json.dumps([
+        {"name_ja": f"料理{i + 1}", "price_val": 500 + 100 * i, "price_raw": f"{500 + 100 * i}円", "category_ja": "一品料理"}
+        for i in range(min(_config.vision_items, 10))
+    ], ensure_ascii=False)
+
+
+Responder = Tuple[str, Callable[[str], bool], Callable[[str], str]]
+
+RESPONDERS: List[Responder] = [
+    ("qc", lambda t: "Quality Control Auditor" in t, _qc),
+    ("transcreation_batch", lambda t: "[INPUT ITEMS]" in t, _batch),
+    ("transcreation_multilang", lambda t: "[PERSONAS]" in t, _multilang),
+    ("transcreation", lambda t: "transcreation copywriter" in t,
+     lambda t: json.dumps(_transcreation(_language(t), _item_name(t)), ensure_ascii=False)),
+    ("cleanup_en", lambda t: "【校正・英訳】" in t, _cleanup_en),
+    ("cleanup", lambda t: "【不要部分削除後】" in t, lambda t: _menu_json(t, "【原文】", "【不要部分削除後】", english=False)),
+    ("ja_to_en", lambda t: "【英語訳】" in t, lambda t: _menu_json(t, "【日本語】", "【英語訳】", english=True)),
+    ("vision", lambda t: "menu_name_jp" in t, _vision),
+    ("full_page", lambda t: "name_ja_raw" in t, _full_page),
+    ("extract_items", lambda t: '"name_ja"' in t, _extract_items),
+]
+
+
+def register_responder(kind: str, match: Callable[[str], bool], respond: Callable[[str], str]):
+    """独自プロンプト用の応答を追加する (既存より優先)"""
+    RESPONDERS.insert(0, (kind, match, respond))
+
+
+class FakeChatModel:
+    """
+    ChatGoogleGenerativeAI の代わりに使うチャットモデル (invoke / ainvoke のみ)。
+    usage_metadata と response_metadata["token_usage"] に推定トークン数を入れて返す。
+    timeout を渡すと、遅延がそれを超える呼び出しは timeout 秒で TimeoutError を送出する (クライアントの期限と同じ)。
+    """
+
+    def __init__(
+        self,
+        model: str = "fake-gemini",
+        temperature: float = 0.0,
+        max_output_tokens: Optional[int] = None,
+        timeout: Optional[float] = None,
+        **_kwargs,
+    ):
+        self.model = model
+        self.temperature = temperature
+        self.max_output_tokens = max_output_tokens
+        self.timeout = timeout
+
+    def _plan(self, inputs: Any, schema: Optional[dict] = None) -> Tuple[str, str, float, Optional[Exception], int, int, str]:
+        """
+        (種別, 応答本文, 遅延秒, 送出する例外, 入力トークン, 出力トークン, 結果) を決める。
+        schema (response_json_schema) があれば、プロンプトとスキーマの両方で種別を見分け、フェンス無しの JSON を返す
+        """
+        text = _text_of(inputs)
+        schema_text = json.dumps(schema, ensure_ascii=False, separators=(",", ":")) if schema else ""
+        kind, content = "other", "OK"
+        for name, match, respond in RESPONDERS:
+            if match(text) or (schema_text and match(schema_text)):
+                kind, content = name, respond(text)
+                break
+        if schema:
+            content = re.sub(r"^```(?:json)?\s*|\s*```$", "", content.strip())
+        config = _config
+        with _lock:
+            draw = _rng.random()
+            malformed = _rng.random() < (config.schema_malformed_rate if schema else config.malformed_rate)
+            jitter = _rng.gauss(0.0, 1.0)
+        latency = config.latency_median_ms / 1000.0 * math.exp(config.latency_sigma * jitter)
+        tokens_in = estimate_tokens(text) + estimate_tokens(schema_text)
+
+        error = None
+        if draw < config.rate_limit_rate:
+            error = FakeAPIError(429, "RESOURCE_EXHAUSTED: quota exceeded (fake)")
+            latency *= 0.1
+        elif draw < config.rate_limit_rate + config.error_rate:
+            error = FakeAPIError(503, "UNAVAILABLE: service temporarily unavailable (fake)")
+        elif malformed:
+            content = content[: max(1, len(content) // 2)]
+        tokens_out = 0 if error else estimate_tokens(content)
+        latency += tokens_out * config.ms_per_output_token / 1000.0
+        if self.timeout and latency > self.timeout:
+            error = TimeoutError(f"Deadline of {self.timeout}s exceeded (fake)")
+            latency, tokens_out = self.timeout, 0
+        if error is None:
+            outcome = "malformed" if malformed else "ok"
+        elif isinstance(error, TimeoutError):
+            outcome = "timeouts"
+        else:
+            outcome = "rate_limited" if error.code == 429 else "errors"
+        return kind, content, latency, error, tokens_in, tokens_out, outcome
+
+    def _respond(self, kind, content, latency, error, tokens_in, tokens_out, outcome) -> AIMessage:
+        _record(kind, latency, outcome, tokens_in, tokens_out)
+        if error is not None:
+            raise error
+        return AIMessage(
+            content=content,
+            usage_metadata={"input_tokens": tokens_in, "output_tokens": tokens_out, "total_tokens": tokens_in + tokens_out},
+            response_metadata={
+                "model_name": self.model,
+                "finish_reason": "STOP",
+                "token_usage": {"prompt_tokens": tokens_in, "completion_tokens": tokens_out},
+            },
+        )
+
+    def invoke(self, inputs: Any, *args, **kwargs) -> AIMessage:
+        planned = self._plan(inputs, kwargs.get("response_json_schema"))
+        time.sleep(planned[2])
+        return self._respond(*planned)
+
+    async def ainvoke(self, inputs: Any, *args, **kwargs) -> AIMessage:
+        planned = self._plan(inputs, kwargs.get("response_json_schema"))
+        await asyncio.sleep(planned[2])
+        return self._respond(*planned)
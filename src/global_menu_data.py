@@ -1,26 +1,32 @@
 # Common Menu Dictionary for Cost Reduction (Suzuka Architecture)
-# Format: "Normalized Japanese Name": { "en": "...", "zh": "...", ... }
+# Format: "Normalized Japanese Name": { "en": "...", "zh": "...", ..., "aliases": [...] }
+# Larger dictionaries are loaded from MENU_DICTIONARY_PATH (see menu_dictionary.py).
 
 GLOBAL_MENU_DICT = {
     "枝豆": {
         "en": "Edamame",
-        "description_en": "Boiled soybeans in the pod, lightly salted. A classic Japanese appetizer."
+        "description_en": "Boiled soybeans in the pod, lightly salted. A classic Japanese appetizer.",
+        "aliases": ["えだまめ", "茶豆"]
     },
     "生ビール": {
         "en": "Draft Beer",
-        "description_en": "Freshly poured draft beer."
+        "description_en": "Freshly poured draft beer.",
+        "aliases": ["ドラフトビール"]
     },
     "唐揚げ": {
         "en": "Fried Chicken (Karaage)",
-        "description_en": "Japanese-style deep-fried chicken, marinated in soy sauce and ginger."
+        "description_en": "Japanese-style deep-fried chicken, marinated in soy sauce and ginger.",
+        "aliases": ["から揚げ", "からあげ", "唐揚"]
     },
     "冷奴": {
         "en": "Chilled Tofu (Hiyayakko)",
-        "description_en": "Cold tofu topped with green onions and ginger."
+        "description_en": "Cold tofu topped with green onions and ginger.",
+        "aliases": ["冷やっこ", "冷ややっこ", "ひややっこ"]
     },
     "刺身盛り合わせ": {
         "en": "Sashimi Assortment",
-        "description_en": "Chef's selection of fresh seasonal raw fish."
+        "description_en": "Chef's selection of fresh seasonal raw fish.",
+        "aliases": ["刺身盛合せ", "刺盛り", "お造り盛り合わせ"]
     },
     "シーザーサラダ": {
         "en": "Caesar Salad",
@@ -28,7 +34,8 @@ GLOBAL_MENU_DICT = {
     },
     "ポテトフライ": {
         "en": "French Fries",
-        "description_en": "Crispy fried potatoes."
+        "description_en": "Crispy fried potatoes.",
+        "aliases": ["フライドポテト", "ポテト"]
     }
 }
 
@@ -36,6 +43,10 @@ def lookup_global_menu(name_ja: str):
     """
     Normalizes the input name and looks it up in the dictionary.
     Returns None if not found.
+
+    Backed by menu_dictionary (exact match on the canonicalized Japanese name or alias).
     """
-    norm_name = name_ja.strip().replace(" ", "").replace("　", "")
-    return GLOBAL_MENU_DICT.get(norm_name)
+    from .menu_dictionary import lookup_menu
+
+    match = lookup_menu(name_ja)
+    return match.entry if match else None
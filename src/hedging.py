@@ -0,0 +1,176 @@
+import asyncio
+import os
+import time
+from collections import deque
+from threading import Lock
+from typing import Any, Dict, Optional
+
+# --------------------------------------------------------------------
+# Configuration
+# --------------------------------------------------------------------
+HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "0") == "1"
+# 遅延の何パーセンタイルを超えたら複製リクエストを出すか
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1.0"))
+# 分位点が安定するまで (この件数の実測が溜まるまで) はヘッジしない
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# 追加呼び出しの上限 (通常呼び出し1回あたり何回ぶんのヘッジを許すか) と貯められる上限
+HEDGE_MAX_RATIO = float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.05"))
+HEDGE_BURST = float(os.getenv("LLM_HEDGE_BURST", "5"))
+LATENCY_WINDOW = int(os.getenv("LLM_HEDGE_LATENCY_WINDOW", "500"))
+
+
+def _percentile(ordered: list, q: float) -> float:
+    """最近順位法。空なら 0"""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered) + 0.5)) - 1))]
+
+
+class Hedger:
+    """
+    モデルごとのヘッジ判断と統計 (Tail at Scale の hedged request)
+
+    - 遅延: 直近 LATENCY_WINDOW 件の成功呼び出しの遅延から percentile 分位点を取り、
+      それ (最低 min_delay 秒) を過ぎても応答が無ければ同じリクエストをもう1本出す
+    - 予算: 通常呼び出し1回ごとに max_ratio クレジットが貯まり (上限 burst)、ヘッジ1本で1消費する。
+      追加コストは呼び出し数の max_ratio 倍を超えない
+    - 統計: hedged / hedge_wins / 予算・空き枠不足で見送った数、遅延の p50/p95/p99
+    """
+
+    def __init__(
+        self,
+        percentile: float = HEDGE_PERCENTILE,
+        min_delay: float = HEDGE_MIN_DELAY,
+        min_samples: int = HEDGE_MIN_SAMPLES,
+        max_ratio: float = HEDGE_MAX_RATIO,
+        burst: float = HEDGE_BURST,
+        window: int = LATENCY_WINDOW,
+    ):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.max_ratio = max_ratio
+        self.burst = burst
+        self._latencies: deque = deque(maxlen=window)
+        self._credits = 0.0
+        self._lock = Lock()
+        self._stats = {"calls": 0, "hedged": 0, "hedge_wins": 0, "skipped_budget": 0, "skipped_capacity": 0}
+
+    def start_call(self) -> Optional[float]:
+        """呼び出し開始時に呼ぶ。ヘッジまでの待ち秒数 (まだヘッジしない場合は None) を返す"""
+        with self._lock:
+            self._stats["calls"] += 1
+            self._credits = min(self.burst, self._credits + self.max_ratio)
+            if len(self._latencies) < self.min_samples:
+                return None
+            return max(self.min_delay, _percentile(sorted(self._latencies), self.percentile))
+
+    def try_hedge(self, limiter: Any = None) -> bool:
+        """予算と limiter の空き枠があれば1本ぶん消費して True"""
+        if limiter is not None and not limiter.has_headroom():
+            with self._lock:
+                self._stats["skipped_capacity"] += 1
+            return False
+        with self._lock:
+            if self._credits < 1.0:
+                self._stats["skipped_budget"] += 1
+                return False
+            self._credits -= 1.0
+            self._stats["hedged"] += 1
+            return True
+
+    def record(self, seconds: float, hedge_won: bool = False):
+        """成功した呼び出しの (呼び出し元から見た) 遅延を記録する"""
+        with self._lock:
+            self._latencies.append(seconds)
+            if hedge_won:
+                self._stats["hedge_wins"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            ordered = sorted(self._latencies)
+        stats["hedge_rate"] = stats["hedged"] / stats["calls"] if stats["calls"] else 0.0
+        stats["win_rate"] = stats["hedge_wins"] / stats["hedged"] if stats["hedged"] else 0.0
+        stats["p50"] = _percentile(ordered, 0.50)
+        stats["p95"] = _percentile(ordered, 0.95)
+        stats["p99"] = _percentile(ordered, 0.99)
+        return stats
+
+
+_hedgers: Dict[str, Hedger] = {}
+_hedgers_lock = Lock()
+
+
+def get_hedger(model: str) -> Hedger:
+    """プロセス共有の Hedger (モデル名ごとに1つ)"""
+    with _hedgers_lock:
+        if model not in _hedgers:
+            _hedgers[model] = Hedger()
+        return _hedgers[model]
+
+
+def get_hedge_stats() -> Dict[str, dict]:
+    with _hedgers_lock:
+        hedgers = dict(_hedgers)
+    return {model: h.stats() for model, h in hedgers.items()}
+
+
+def reset_hedgers():
+    """全 Hedger を破棄する (遅延の実測も消える。ベンチマークの条件揃え用)"""
+    with _hedgers_lock:
+        _hedgers.clear()
+
+
+class HedgedChatModel:
+    """
+    チャットモデルのラッパー。ainvoke が遅延分位点を超えたら同じリクエストをもう1本出し、
+    先に成功した方を返して残りは取り消す (片方が失敗したらもう片方を待つ)。
+    レート制御の内側ではなく外側に置くこと (ヘッジも limiter の枠と RPM/TPM を消費させるため)。
+    invoke はヘッジしない。それ以外の属性は元のモデルに委譲する。
+    """
+
+    def __init__(self, llm: Any, hedger: Optional[Hedger] = None):
+        self._llm = llm
+        self._hedger = hedger or get_hedger(str(getattr(llm, "model", "default")))
+        self._limiter = getattr(llm, "limiter", None)
+
+    def __getattr__(self, name):
+        return getattr(self._llm, name)
+
+    def invoke(self, inputs: Any, *args, **kwargs):
+        return self._llm.invoke(inputs, *args, **kwargs)
+
+    async def ainvoke(self, inputs: Any, *args, **kwargs):
+        started = time.monotonic()
+        delay = self._hedger.start_call()
+        primary = asyncio.ensure_future(self._llm.ainvoke(inputs, *args, **kwargs))
+        tasks = [primary]
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and self._hedger.try_hedge(self._limiter):
+                    tasks.append(asyncio.ensure_future(self._llm.ainvoke(inputs, *args, **kwargs)))
+
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=tasks.index):
+                    if task.exception() is None:
+                        self._hedger.record(time.monotonic() - started, hedge_won=task is not primary)
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+
+def with_hedging(llm: Any) -> Any:
+    """LLM_HEDGE_ENABLED=1 ならヘッジ付きラッパーを返す"""
+    if not HEDGE_ENABLED:
+        return llm
+    return HedgedChatModel(llm)
@@ -0,0 +1,489 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Any, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .llm_pool import get_chat_model
+from .observability import log_key_usage
+from .rate_limiter import (
+    CANCELLED,
+    DEFAULT_RETRY_POLICY,
+    GEMINI_CALL_TIMEOUT,
+    GEMINI_INITIAL_CONCURRENCY,
+    GEMINI_MAX_CONCURRENCY,
+    GEMINI_MIN_CONCURRENCY,
+    GEMINI_RPM,
+    GEMINI_TPM,
+    RATE_LIMIT,
+    TRANSIENT,
+    AdaptiveRateLimiter,
+    RateLimitedChatModel,
+    RetryPolicy,
+    classify_error,
+    current_priority,
+    get_limiter,
+    usage_tokens,
+)
+
+# --------------------------------------------------------------------
+# API Key Pool (horizontal LLM throughput)
+# --------------------------------------------------------------------
+# 1ジョブ = 1キーだと、そのキーの枠 (RPM / TPM / 1日のリクエスト数) がそのまま上限になる。
+# 複数のキーを登録すると、1呼び出しごとに一番空いているキーを選び、キーごとの limiter
+# (rate_limiter.AdaptiveRateLimiter) で枠を守る。
+# 429 を返したキー・1日の上限に達したキーは、枠が戻る (分の枠: KEY_COOLDOWN_SECONDS / 日の枠: 太平洋時間の0時)
+# までローテーションから外し、その呼び出しは待たずに別のキーでやり直す。
+# キーは GEMINI_API_KEYS (カンマ区切り、デプロイ全体の設定) か register_keys(api_key, keys) で登録する。
+# register_keys は呼び出し元の api_key ごとの登録なので、同じプロセスの別セッションが別のキーで呼んでも
+# そのセッションの追加キーは混ざらない。呼び出し元の api_key と合わせて 2本以上あるときだけ使う
+# (1本なら従来どおり with_rate_limit)。
+# キーそのものはログに出さず、key_id (ハッシュの先頭) で識別する。
+
+KEY_RPM = int(os.getenv("GEMINI_KEY_RPM", str(GEMINI_RPM)))
+KEY_TPM = int(os.getenv("GEMINI_KEY_TPM", str(GEMINI_TPM)))
+# 1日あたりのリクエスト上限 (0 で無制限)
+KEY_RPD = int(os.getenv("GEMINI_KEY_RPD", "0"))
+# 429 を返したキーを外しておく秒数 (Gemini の分単位の枠が戻るまで)
+KEY_COOLDOWN_SECONDS = float(os.getenv("GEMINI_KEY_COOLDOWN", "60"))
+# 全キーが外れていて、戻るまでこれより長くかかるなら待たずに失敗させる (ジョブは再開できる)
+KEY_MAX_WAIT_SECONDS = float(os.getenv("GEMINI_KEY_MAX_WAIT", "120"))
+# 日の枠が戻る時刻のタイムゾーン (Gemini API は太平洋時間の0時)
+QUOTA_TIMEZONE = os.getenv("GEMINI_QUOTA_TIMEZONE", "America/Los_Angeles")
+
+_DAILY_MARKERS = ("per day", "perday", "daily")
+_POLL_INTERVAL = 0.02
+
+
+def key_id(api_key: str) -> str:
+    """ログ・統計用のキーの識別子 (キーそのものは残さない)"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:8]
+
+
+def _load_quotas() -> Dict[str, dict]:
+    """GEMINI_KEY_QUOTAS='{"<key_id>": {"rpm": 1000, "tpm": 4000000, "rpd": 0}}' でキーごとに上書きする"""
+    raw = os.getenv("GEMINI_KEY_QUOTAS")
+    if not raw:
+        return {}
+    try:
+        return {str(k): dict(v) for k, v in json.loads(raw).items()}
+    except (ValueError, AttributeError, TypeError) as e:
+        print(f"[KeyPool] Ignoring invalid GEMINI_KEY_QUOTAS: {e}")
+        return {}
+
+
+KEY_QUOTAS = _load_quotas()
+
+
+def _next_daily_reset(now: float) -> float:
+    """次に日の枠が戻る時刻 (epoch 秒)"""
+    try:
+        from zoneinfo import ZoneInfo
+
+        local = datetime.fromtimestamp(now, ZoneInfo(QUOTA_TIMEZONE))
+    except Exception:
+        local = datetime.fromtimestamp(now).astimezone()
+    midnight = (local + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight.timestamp()
+
+
+class KeyPoolExhausted(RuntimeError):
+    """全キーが枠切れで、KEY_MAX_WAIT_SECONDS 以内に戻らない (code = 429 なので classify_error では rate_limit)"""
+
+    code = 429
+
+
+class PooledKey:
+    """
+    プールの1キー。キーごとの limiter (RPM / TPM / 同時実行数の AIMD) と、1日のリクエスト数、
+    ローテーションから外れている期限 (exhausted_until, epoch 秒) を持つ。
+    """
+
+    def __init__(self, api_key: str, rpm: int = KEY_RPM, tpm: int = KEY_TPM, rpd: int = KEY_RPD):
+        self.api_key = api_key
+        self.key_id = key_id(api_key)
+        quota = KEY_QUOTAS.get(self.key_id, {})
+        self.rpm = int(quota.get("rpm", rpm))
+        self.tpm = int(quota.get("tpm", tpm))
+        self.rpd = int(quota.get("rpd", rpd))
+        self.limiter = AdaptiveRateLimiter(
+            rpm=self.rpm,
+            tpm=self.tpm,
+            initial_concurrency=GEMINI_INITIAL_CONCURRENCY,
+            min_concurrency=GEMINI_MIN_CONCURRENCY,
+            max_concurrency=GEMINI_MAX_CONCURRENCY,
+        )
+        self.exhausted_until = 0.0
+        self._day_reset = _next_daily_reset(time.time())
+        self._day_requests = 0
+        self._recent: Deque[float] = deque()
+        self._lock = Lock()
+        self._stats = {"calls": 0, "successes": 0, "tokens": 0, RATE_LIMIT: 0, "errors": 0, "benched": 0}
+
+    def available(self, now: float) -> bool:
+        return now >= self.exhausted_until
+
+    def rpm_utilization(self, now: float) -> float:
+        """直近1分のリクエスト数 / RPM"""
+        with self._lock:
+            while self._recent and now - self._recent[0] > 60:
+                self._recent.popleft()
+            return len(self._recent) / self.rpm if self.rpm else 0.0
+
+    def try_acquire(self, est_tokens: int, now: float, priority: int = 0) -> float:
+        """このキーで1呼び出しぶんの枠を取る。取れたら 0、取れなければ待つべき秒数"""
+        if not self.available(now):
+            return self.exhausted_until - now
+        with self._lock:
+            if now >= self._day_reset:
+                self._day_reset = _next_daily_reset(now)
+                self._day_requests = 0
+            if self.rpd and self._day_requests >= self.rpd:
+                day_limited = True
+            else:
+                day_limited = False
+        if day_limited:
+            self.bench(self._day_reset, "daily request quota")
+            return self.exhausted_until - now
+        wait = self.limiter.try_acquire(est_tokens, priority)
+        if wait:
+            return wait
+        with self._lock:
+            self._day_requests += 1
+            self._recent.append(now)
+            self._stats["calls"] += 1
+        return 0.0
+
+    def bench(self, until: float, reason: str):
+        """until (epoch 秒) までローテーションから外す"""
+        with self._lock:
+            if until <= self.exhausted_until:
+                return
+            self.exhausted_until = until
+            self._stats["benched"] += 1
+        log_key_usage(self.key_id, "benched", detail=f"{reason}; until {datetime.fromtimestamp(until).isoformat(timespec='seconds')}")
+        print(f"[KeyPool] key {self.key_id} out of rotation for {until - time.time():.0f}s ({reason})")
+
+    def restore_if_due(self, now: float):
+        """外していた期限を過ぎたらローテーションに戻す"""
+        with self._lock:
+            if not self.exhausted_until or now < self.exhausted_until:
+                return
+            self.exhausted_until = 0.0
+        log_key_usage(self.key_id, "restored")
+        print(f"[KeyPool] key {self.key_id} back in rotation")
+
+    def release(self, kind: Optional[str], est_tokens: int, actual_tokens: int = 0, error: Optional[BaseException] = None):
+        self.limiter.release(kind, est_tokens, actual_tokens)
+        now = time.time()
+        with self._lock:
+            if kind is None:
+                self._stats["successes"] += 1
+                self._stats["tokens"] += actual_tokens
+            elif kind == RATE_LIMIT:
+                self._stats[RATE_LIMIT] += 1
+            elif kind != CANCELLED:
+                self._stats["errors"] += 1
+        if kind == RATE_LIMIT:
+            # 日の枠切れは日付が変わるまで、分の枠切れは枠が戻るまで外す
+            daily = error is not None and any(m in str(error).lower() for m in _DAILY_MARKERS)
+            self.bench(_next_daily_reset(now) if daily else now + KEY_COOLDOWN_SECONDS, "daily quota exhausted (429)" if daily else "rate limited (429)")
+        if kind != CANCELLED:
+            limiter_stats = self.limiter.stats()
+            log_key_usage(
+                self.key_id, kind or "ok", tokens=actual_tokens,
+                in_flight=limiter_stats["in_flight"], concurrency_limit=limiter_stats["concurrency_limit"],
+                rpm_utilization=self.rpm_utilization(now),
+            )
+
+    def stats(self) -> dict:
+        now = time.time()
+        utilization = self.rpm_utilization(now)
+        limiter_stats = self.limiter.stats()
+        with self._lock:
+            return {
+                **self._stats,
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+                "rpd": self.rpd,
+                "day_requests": self._day_requests,
+                "rpm_utilization": utilization,
+                "in_flight": limiter_stats["in_flight"],
+                "concurrency_limit": limiter_stats["concurrency_limit"],
+                "available": self.available(now),
+                "available_in_sec": max(0.0, self.exhausted_until - now),
+            }
+
+
+class KeyPool:
+    """
+    複数キーのプール。acquire() は外れていないキーのうち負荷 (同時実行数の使用率 → 直近1分の RPM 使用率) の
+    小さい順に枠を取りにいき、最初に取れたキーを返す。どのキーも取れなければ一番早く空くまで待つ。
+    """
+
+    def __init__(self, keys: Sequence[PooledKey]):
+        self.keys = list(keys)
+
+    def _order(self, now: float) -> List[PooledKey]:
+        def load(key: PooledKey) -> Tuple[float, float]:
+            s = key.limiter.stats()
+            return s["in_flight"] / max(1, s["concurrency_limit"]), key.rpm_utilization(now)
+        for key in self.keys:
+            key.restore_if_due(now)
+        return sorted((k for k in self.keys if k.available(now)), key=load)
+
+    def _try_acquire(self, est_tokens: int, priority: int = 0) -> Tuple[Optional[PooledKey], float]:
+        now = time.time()
+        waits = []
+        for key in self._order(now):
+            wait = key.try_acquire(est_tokens, now, priority)
+            if not wait:
+                return key, 0.0
+            waits.append(wait)
+        if not waits:
+            # 全キーが外れている: 一番早く戻るキーまで
+            restore = min(k.exhausted_until for k in self.keys) - now
+            if restore > KEY_MAX_WAIT_SECONDS:
+                raise KeyPoolExhausted(f"All {len(self.keys)} API keys exhausted their quota; next key available in {restore:.0f}s")
+            waits.append(restore)
+        return None, max(_POLL_INTERVAL, min(waits))
+
+    def _add_waiter(self, priority: int):
+        # どのキーで取れるか分からないので、全キーの limiter に並ぶ (rate_limiter.call_priority)
+        for key in self.keys:
+            key.limiter.add_waiter(priority)
+
+    def _remove_waiter(self, priority: int):
+        for key in self.keys:
+            key.limiter.remove_waiter(priority)
+
+    async def acquire(self, est_tokens: int) -> PooledKey:
+        started = time.monotonic()
+        priority = current_priority()
+        self._add_waiter(priority)
+        try:
+            while True:
+                key, wait = self._try_acquire(est_tokens, priority)
+                if key is not None:
+                    key.limiter.add_wait(time.monotonic() - started)
+                    return key
+                await asyncio.sleep(min(wait, 1.0))
+        finally:
+            self._remove_waiter(priority)
+
+    def acquire_sync(self, est_tokens: int) -> PooledKey:
+        started = time.monotonic()
+        priority = current_priority()
+        self._add_waiter(priority)
+        try:
+            while True:
+                key, wait = self._try_acquire(est_tokens, priority)
+                if key is not None:
+                    key.limiter.add_wait(time.monotonic() - started)
+                    return key
+                time.sleep(min(wait, 1.0))
+        finally:
+            self._remove_waiter(priority)
+
+    def has_headroom(self) -> bool:
+        """どれかのキーに今すぐ空きがあるか (ヘッジ用)"""
+        now = time.time()
+        return any(k.available(now) and k.limiter.has_headroom() for k in self.keys)
+
+    def has_available(self) -> bool:
+        now = time.time()
+        return any(k.available(now) for k in self.keys)
+
+    @property
+    def concurrency_limit(self) -> int:
+        now = time.time()
+        return sum(k.limiter.concurrency_limit for k in self.keys if k.available(now))
+
+    def capacity(self) -> Tuple[int, int]:
+        """外れていないキーの (RPM, TPM) の合計"""
+        now = time.time()
+        keys = [k for k in self.keys if k.available(now)]
+        return sum(k.rpm for k in keys), sum(k.tpm for k in keys)
+
+
+class KeyPooledChatModel(RateLimitedChatModel):
+    """
+    with_rate_limit の代わりに使うラッパー。1呼び出しごとに KeyPool からキーを選び、
+    そのキーのプール済みクライアント (llm_pool) で呼ぶ。
+    429 はキーを外して別のキーで即やり直す (再試行回数に数えない。全キーが外れたら KeyPool が待つか失敗させる)。
+    5xx / 期限切れは従来どおりバックオフして再試行する。
+    """
+
+    def __init__(
+        self,
+        pool: KeyPool,
+        model: str,
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None,
+        policy: RetryPolicy = DEFAULT_RETRY_POLICY,
+        timeout: float = GEMINI_CALL_TIMEOUT,
+    ):
+        self._pool = pool
+        self._model = model
+        self._temperature = temperature
+        self._max_tokens = max_tokens
+        # model / temperature など (キャッシュキー・ヘッジの集計に使う) は1本目のキーのクライアントに委譲する
+        super().__init__(self._client(pool.keys[0]), limiter=None, policy=policy, timeout=timeout)
+
+    def _client(self, key: PooledKey) -> Any:
+        return get_chat_model(key.api_key, self._model, self._temperature, self._max_tokens)
+
+    @property
+    def limiter(self) -> KeyPool:
+        return self._pool
+
+    def _should_retry(self, kind: str, attempt: int) -> bool:
+        if kind == RATE_LIMIT and self._pool.has_available():
+            return True
+        return kind in (RATE_LIMIT, TRANSIENT) and self._policy.should_retry(kind, attempt)
+
+    async def ainvoke(self, inputs: Any, *args, **kwargs):
+        est = self._estimate(inputs)
+        attempt = 0
+        while True:
+            key = await self._pool.acquire(est)
+            try:
+                call = self._client(key).ainvoke(inputs, *args, **kwargs)
+                response = await (asyncio.wait_for(call, self._timeout) if self._timeout else call)
+            except asyncio.CancelledError:
+                key.release(CANCELLED, est)
+                raise
+            except Exception as e:
+                if isinstance(e, (asyncio.TimeoutError, TimeoutError)):
+                    key.limiter.record_timeout()
+                kind = classify_error(e)
+                key.release(kind, est, error=e)
+                if not self._should_retry(kind, attempt):
+                    raise
+                key.limiter.record_retry()
+                if kind == RATE_LIMIT and self._pool.has_available():
+                    continue
+                await asyncio.sleep(self._policy.backoff(attempt))
+                attempt += 1
+                continue
+            key.release(None, est, usage_tokens(response))
+            return response
+
+    def invoke(self, inputs: Any, *args, **kwargs):
+        est = self._estimate(inputs)
+        attempt = 0
+        while True:
+            key = self._pool.acquire_sync(est)
+            try:
+                response = self._client(key).invoke(inputs, *args, **kwargs)
+            except Exception as e:
+                if isinstance(e, (asyncio.TimeoutError, TimeoutError)):
+                    key.limiter.record_timeout()
+                kind = classify_error(e)
+                key.release(kind, est, error=e)
+                if not self._should_retry(kind, attempt):
+                    raise
+                key.limiter.record_retry()
+                if kind == RATE_LIMIT and self._pool.has_available():
+                    continue
+                time.sleep(self._policy.backoff(attempt))
+                attempt += 1
+                continue
+            key.release(None, est, usage_tokens(response))
+            return response
+
+
+# --------------------------------------------------------------------
+# Process-wide registry
+# --------------------------------------------------------------------
+_keys: Dict[str, PooledKey] = {}
+_extra_keys: Dict[str, List[str]] = {}  # key_id(呼び出し元の api_key) -> 追加キー
+_registry_lock = Lock()
+
+
+def _split_keys(raw: str) -> List[str]:
+    return [k.strip() for k in raw.split(",") if k.strip()]
+
+
+def register_keys(api_key: str, extra_keys: Iterable[str]):
+    """
+    api_key で呼んだときにプールに足すキーを登録する (st.secrets / Supabase から読んだもの。重複・空は無視)。
+    api_key ごとに前回の登録を置き換える。api_key が空なら何もしない
+    """
+    api_key = (api_key or "").strip()
+    if not api_key:
+        return
+    keys: List[str] = []
+    for k in extra_keys:
+        k = (k or "").strip()
+        if k and k != api_key and k not in keys:
+            keys.append(k)
+    with _registry_lock:
+        if keys:
+            _extra_keys[key_id(api_key)] = keys
+        else:
+            _extra_keys.pop(key_id(api_key), None)
+
+
+def configured_keys(api_key: Optional[str] = None) -> List[str]:
+    """api_key + GEMINI_API_KEYS + api_key に register_keys() したキー (重複を除き、この順)"""
+    keys: List[str] = []
+    with _registry_lock:
+        extra = list(_extra_keys.get(key_id(api_key), [])) if api_key else []
+    for k in [api_key or ""] + _split_keys(os.getenv("GEMINI_API_KEYS", "")) + extra:
+        k = k.strip()
+        if k and k not in keys:
+            keys.append(k)
+    return keys
+
+
+def get_key_pool(api_key: Optional[str] = None) -> Optional[KeyPool]:
+    """キーが2本以上あれば、それらのプール (キーの状態はプロセス内で共有)。1本以下なら None"""
+    keys = configured_keys(api_key)
+    if len(keys) < 2:
+        return None
+    with _registry_lock:
+        pooled = []
+        for k in keys:
+            kid = key_id(k)
+            if kid not in _keys:
+                _keys[kid] = PooledKey(k)
+            pooled.append(_keys[kid])
+    return KeyPool(pooled)
+
+
+def shared_concurrency(api_key: Optional[str] = None, max_concurrency: Optional[int] = None) -> int:
+    """
+    今 API に同時に出せる呼び出し数。キープールがあれば外れていないキーの枠の合計、無ければ共有 limiter の現在値
+    (max_concurrency を渡すとそれで頭打ち)
+    """
+    pool = get_key_pool(api_key)
+    limit = pool.concurrency_limit if pool is not None else get_limiter().concurrency_limit
+    if max_concurrency is not None:
+        limit = min(limit, max_concurrency)
+    return max(1, limit)
+
+
+def with_key_pool(pool: KeyPool, model: str, temperature: float = 0.0, max_tokens: Optional[int] = None, timeout: float = GEMINI_CALL_TIMEOUT) -> KeyPooledChatModel:
+    return KeyPooledChatModel(pool, model, temperature, max_tokens, timeout=timeout)
+
+
+def get_key_pool_stats(api_key: Optional[str] = None) -> Dict[str, dict]:
+    """
+    {key_id: {calls, successes, tokens, rate_limit, errors, benched, rpm_utilization, available, ...}}
+    api_key を渡すとそのキーのプールに入るキーだけ (省略時はプロセス内の全キー)
+    """
+    scope = {key_id(k) for k in configured_keys(api_key)} if api_key else None
+    with _registry_lock:
+        keys = [k for k in _keys.values() if scope is None or k.key_id in scope]
+    return {k.key_id: k.stats() for k in keys}
+
+
+def reset_key_pool():
+    """キーの状態 (limiter・外れている期限・統計) を破棄する。登録したキーは残す (ベンチマークの条件揃え用)"""
+    with _registry_lock:
+        _keys.clear()
@@ -1,72 +1,182 @@
 from __future__ import annotations
 
-from typing import List, Dict, Tuple, Any
+from typing import List, Dict, Tuple, Any, AsyncIterator, Callable, Optional, Set
+from dataclasses import dataclass
 import asyncio
 import json
+import logging
 import re
 import os
 from langchain_core.prompts import PromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
 import streamlit as st
+from pydantic import BaseModel, Field
 
-from .models import MenuItem
+from .models import MenuItem, TranslationEvent, TRANSLATION_PENDING
+from .scheduler import run_bounded, iter_bounded, DEFAULT_MAX_CONCURRENCY
+from .token_estimator import estimate_tokens, split_by_token_budget
+from .llm_cache import with_cache, is_cache_hit, invalidate_cached, commit_cached
+from .qc_rules import evaluate as local_qc, record as record_qc_decision
+from .languages import canonical_language
+from .llm_pool import get_chat_model
+from .rate_limiter import with_rate_limit, classify_error, PARSE, DEFAULT_RETRY_POLICY
+from .hedging import with_hedging
+from .model_routing import route, cascade, record_attempt
+from .llm_json import parse_json, parse_fields, coerce
+from .prompt_registry import register_prompt, register_structured_prompt, record_prompt_usage, RenderedPrompt
+from .structured_output import OutputFormat, use_schema
+from .personas import PERSONA_DEFINITIONS, DEFAULT_QC_RULES
+from .dedup import dedupe_items, fan_out, copy_for_position, record_dedup
+from .menu_dictionary import lookup_menu, entry_translation, record_dictionary_skip
+from .language_priority import prioritize_languages, remaining_by_language
+from .key_pool import get_key_pool, with_key_pool
 
 # LangChain v1系で output_parsers の場所が割れるので、ここは classic に固定して安定化
 from langchain_classic.output_parsers import StructuredOutputParser, ResponseSchema
 
+# (item, 言語) ごとの結果 (キャッシュヒット・QC 合否・再試行) は件数が多いので debug ログに出す。
+# 見るときは logging.getLogger("src.langchain_utils").setLevel(logging.DEBUG)
+logger = logging.getLogger(__name__)
 
-# スキーマの定義
+
+# スキーマの定義 (プロンプトの出力形式指示用。応答の解析は llm_json で行う)
 response_schemas = [
     ResponseSchema(name="menu_title", description="メニューのタイトル"),
     ResponseSchema(name="menu_content", description="メニューの説明文")
 ]
 output_parser = StructuredOutputParser.from_response_schemas(response_schemas)
 
+
+# 同じ形の pydantic モデル (LLM_STRUCTURED_OUTPUT=1 のとき JSON スキーマにして送る)
+class MenuText(BaseModel):
+    menu_title: str = Field(description="メニューのタイトル")
+    menu_content: str = Field(description="メニューの説明文")
+
+
+# ja = 校正後の日本語、en = その英訳 (書き方はプロンプト側にあるのでスキーマに説明は付けない)
+class CleanupEnglishOutput(BaseModel):
+    ja: MenuText
+    en: MenuText
+
+
+# 各フィールドの書き方は [OUTPUT RULES] にあるのでスキーマに説明は付けない
+class TranscreationOutput(BaseModel):
+    name: str
+    description: str
+    pairing: str
+
+
+class BatchTranscreationOutput(TranscreationOutput):
+    id: str
+
 # --------------------------------------------------------------------
-# 1) 不要部分削除のためのプロンプト
+# プロンプトは import 時に1回だけコンパイルして prompt_registry に登録する。
+# いずれも [静的プレフィックス (役割・ルール・出力形式・ペルソナ)] + [item ごとのサフィックス] の順。
+# プロンプトを変えたら PROMPT_VERSION (と各テンプレートの版) を上げること。
 # --------------------------------------------------------------------
-cleanup_template = """
-外国人観光客向けに、レストランのメニューの翻訳を行います。
-前準備として、以下の日本語テキストから、不要な自己アピールや頑張りに関する言葉などを削除し、料理の説明や歴史・食べ方など利用者に有益な情報は残してください。
-また、文化や歴史的な背景情報が必要な情報があれば、内容の中に適宜追加してください。
+_format_instructions = output_parser.get_format_instructions()
+_SCHEMA_NOTE = "Return JSON matching the response schema."
 
-{format_instructions}
+CLEANUP_FORMAT = OutputFormat("cleanup", MenuText, _format_instructions, _SCHEMA_NOTE)
+JA_TO_EN_FORMAT = OutputFormat("ja_to_en", MenuText, _format_instructions, _SCHEMA_NOTE)
+CLEANUP_EN_FORMAT = OutputFormat("cleanup_en", CleanupEnglishOutput, """
+出力は次の形式の JSON のみ:
+```json
+{
+  "ja": {"menu_title": "校正後のメニュー名", "menu_content": "校正後の説明文"},
+  "en": {"menu_title": "English menu name", "menu_content": "English description"}
+}
+```
+""", _SCHEMA_NOTE)
+TRANSCREATION_FORMAT = OutputFormat("transcreation", TranscreationOutput, """
+[DELIVER]
+Return JSON:
+{
+  "name": "...",
+  "description": "...",
+  "pairing": "..."
+}
+""", _SCHEMA_NOTE)
+TRANSCREATION_BATCH_FORMAT = OutputFormat("transcreation_batch", List[BatchTranscreationOutput], """
+[DELIVER]
+Return a JSON array with one object per input item:
+[
+  {"id": "...", "name": "...", "description": "...", "pairing": "..."}
+]
+""", "Return one object per input item, matching the response schema.")
+TRANSCREATION_MULTILANG_FORMAT = OutputFormat("transcreation_multilang", Dict[str, TranscreationOutput], """
+[DELIVER]
+Return a JSON object keyed by language:
+{
+  "<Language>": {"name": "...", "description": "...", "pairing": "..."}
+}
+""", "Return one object per language, keyed by language, matching the response schema.")
 
-【原文】
-{original_text}
+# --------------------------------------------------------------------
+# 1) 不要部分削除のためのプロンプト
+# --------------------------------------------------------------------
+cleanup_prompt = register_structured_prompt(
+    "cleanup", "2",
+    prefix="""
+    外国人観光客向けに、レストランのメニューの翻訳を行います。
+    前準備として、以下の日本語テキストから、不要な自己アピールや頑張りに関する言葉などを削除し、料理の説明や歴史・食べ方など利用者に有益な情報は残してください。
+    また、文化や歴史的な背景情報が必要な情報があれば、内容の中に適宜追加してください。
 
-【不要部分削除後】
-"""
+    {format_instructions}
+    """,
+    suffix="""
+    【原文】
+    {original_text}
 
-cleanup_prompt = PromptTemplate(
-    input_variables=["original_text"],
-    partial_variables={"format_instructions": output_parser.get_format_instructions()},
-    template=cleanup_template
+    【不要部分削除後】
+    """,
+    fmt=CLEANUP_FORMAT,
 )
 
 # --------------------------------------------------------------------
-# 2) 日本語 → 英語翻訳のためのプロンプト
+# 2) 日本語 → 英語翻訳のためのプロンプト (ペルソナ付き)
 # --------------------------------------------------------------------
-ja_to_en_template = """
-外国人観光客向けに、以下の日本語メニューを自然な英語に翻訳してください。
-
-{format_instructions}
+ja_to_en_prompt = register_structured_prompt(
+    "ja_to_en", "2",
+    prefix="""
+    外国人観光客向けに、以下の日本語メニューを自然な英語に翻訳してください。
 
-【日本語】
-{cleaned_japanese_text}
+    {format_instructions}
 
-【英語訳】
-"""
+    {persona_instruction}
+    """,
+    suffix="""
+    【日本語】
+    {cleaned_japanese_text}
 
-ja_to_en_prompt = PromptTemplate(
-    input_variables=["cleaned_japanese_text"],
-    partial_variables={"format_instructions": output_parser.get_format_instructions()},
-    template=ja_to_en_template
+    【英語訳】
+    """,
+    fmt=JA_TO_EN_FORMAT,
 )
 
 # --------------------------------------------------------------------
-# 3) 英語 → 多言語翻訳のためのプロンプト
+# 1+2) 不要部分削除と英語翻訳を1回で行うプロンプト (JA_EN_MODE="fused")
 # --------------------------------------------------------------------
+cleanup_en_prompt = register_structured_prompt(
+    "cleanup_en", "1",
+    prefix="""
+    外国人観光客向けに、レストランのメニューの翻訳を行います。以下の2つを1回で行ってください。
+    1. 校正 (ja): 日本語テキストから、不要な自己アピールや頑張りに関する言葉などを削除し、料理の説明や歴史・食べ方など利用者に有益な情報は残してください。
+       また、文化や歴史的な背景情報が必要な情報があれば、内容の中に適宜追加してください。
+    2. 英訳 (en): 1 の校正後の日本語を、外国人観光客向けの自然な英語に翻訳してください。
+
+    {format_instructions}
+
+    {persona_instruction}
+    """,
+    suffix="""
+    【原文】
+    {original_text}
+
+    【校正・英訳】
+    """,
+    fmt=CLEANUP_EN_FORMAT,
+)
+
 # --------------------------------------------------------------------
 # 3) 英語 → 多言語翻訳のためのプロンプト
 # --------------------------------------------------------------------
@@ -105,7 +215,7 @@ PERSONA_PROMPTS = {
     "標準 (丁寧)": "Translate in a standard, polite, and clear tone.",
 }
 
-from .observability import log_api_cost
+from .observability import log_api_cost, log_prompt_split, estimate_cost_jpy, extract_usage
 
 # Removed local COST_MODEL and log_api_usage integration
 # Uses centralized observability module now.
@@ -127,279 +237,703 @@ LANGUAGE_PERSONAS = {
     "HongKong": "You are a 'Cantonese Chef'. Use Cantonese stylistic nuances (written in Traditional Chinese). Emphasize 'Wok Hei' and freshness.",
 }
 
-def get_llm(api_key: str, temperature: float = 0.0):
-    return ChatGoogleGenerativeAI(
-        model=os.getenv("GEMINI_MODEL", "gemini-2.5-flash"),
-        google_api_key=api_key,
-        temperature=temperature,
-    )
+# Transcreation エンジンの実行モード
+ENGINE_MODES = ("per_item", "batched", "multilang")
 
-def remove_unnecessary_parts(text_list: List[MenuItem], api_key: str) -> List[MenuItem]:
-    """1件ずつ不要部分削除を行い、結果をMenuItemのリストで返す"""
-    llm = get_llm(api_key)
-    # chain = cleanup_prompt | llm | output_parser # 旧実装
-    # UsageMetadataを取得するために chain を分割実行する
-    
-    results = []
-    progress_text = "✒️ 日本語校正"
-    my_bar = st.progress(0, text=progress_text)
-    total_items = len(text_list)
-    
-    for i, menu_item in enumerate(text_list, 1):
-        try:
-            input_text = {
-                "menu_title": menu_item.menu_title,
-                "menu_content": menu_item.menu_content
-            }
-            
-            # 手動でChainを実行してMetadataを抜く
-            formatted_prompt = cleanup_prompt.format_prompt(original_text=json.dumps(input_text, ensure_ascii=False))
-            response = llm.invoke(formatted_prompt)
-            
-            # ログ記録
-            if hasattr(response, "response_metadata") and "token_usage" in response.response_metadata:
-                usage = response.response_metadata["token_usage"]
-                prompt_tokens = usage.get("prompt_tokens", 0) or usage.get("total_tokens", 0) # Fallback if needed
-                completion_tokens = usage.get("completion_tokens", 0)
-                # Gemini 2.5 Flashは response_metadata の構造が少し違う場合があるが、
-                # langchain-google-genai では通常 'token_usage': {'prompt_tokens': X, 'completion_tokens': Y, 'total_tokens': Z}
-                log_api_usage("cleanup_ja", llm.model, prompt_tokens, completion_tokens)
-            
-            parsed_output = output_parser.parse(response.content)
-            
-            new_item = MenuItem(
-                menu_title=parsed_output["menu_title"],
-                menu_content=parsed_output["menu_content"]
-            )
-            results.append(new_item)
-            
-            progress = int(i / total_items * 100)
-            my_bar.progress(progress, text=f"{progress_text} ({i}/{total_items})")
-            
-        except Exception as e:
-            st.error(f"日本語校正中にエラーが発生しました: {e}")
-            results.append(MenuItem.create_error(str(e)))
-    
-    my_bar.progress(100, text=f"✅ 日本語校正完了")
-    return results
+# 校正 + 英訳の実行方式: two_step = 校正と英訳を別々に (2リクエスト/item)、fused = 1リクエストで両方
+JA_EN_MODES = ("two_step", "fused")
+DEFAULT_JA_EN_MODE = os.getenv("JA_EN_MODE", "two_step")
 
-def translate_japanese_to_english(menu_items: List[MenuItem], api_key: str, persona: str = "標準 (丁寧)") -> List[MenuItem]:
-    """日本語のMenuItemリストを英語に翻訳し、結果をMenuItemのリストで返す"""
-    llm = get_llm(api_key)
-    
-    # 英語翻訳用プロンプトにもペルソナ適用
-    ja_to_en_template_persona = """
-    外国人観光客向けに、以下の日本語メニューを自然な英語に翻訳してください。
-    
-    {persona_instruction}
-    
-    {format_instructions}
-    
-    【日本語】
-    {cleaned_japanese_text}
-    
-    【英語訳】
-    """
-    
-    ja_to_en_prompt_persona = PromptTemplate(
-        input_variables=["cleaned_japanese_text", "persona_instruction"],
-        partial_variables={"format_instructions": output_parser.get_format_instructions()},
-        template=ja_to_en_template_persona
-    )
+# batched モード: 1バッチあたりの推定トークン予算 (入力 + 想定出力) と最大件数
+DEFAULT_BATCH_TOKEN_BUDGET = int(os.getenv("TRANSCREATION_BATCH_TOKENS", "6000"))
+MAX_BATCH_ITEMS = int(os.getenv("TRANSCREATION_BATCH_MAX_ITEMS", "20"))
+BATCH_OUTPUT_TOKENS_PER_ITEM = 300  # 18秒食レポ + ペアリング程度
 
-    # chain = ja_to_en_prompt_persona | llm | output_parser
-    
-    results = []
-    progress_text = "🔤 英語翻訳"
-    my_bar = st.progress(0, text=progress_text)
-    total_items = len(menu_items)
-    
-    persona_instruction = PERSONA_PROMPTS.get(persona, PERSONA_PROMPTS["標準 (丁寧)"])
+# プロンプトテンプレートの版。プロンプトを変更したら上げる (LLMキャッシュのキーに含まれる)
+PROMPT_VERSION = "s1-04.3"
 
-    for i, menu_item in enumerate(menu_items, 1):
-        try:
-            input_text = {
-                "menu_title": menu_item.menu_title,
-                "menu_content": menu_item.menu_content
-            }
-            
-            formatted_prompt = ja_to_en_prompt_persona.format_prompt(
-                cleaned_japanese_text=json.dumps(input_text, ensure_ascii=False),
-                persona_instruction=persona_instruction
-            )
-            response = llm.invoke(formatted_prompt)
+# 全試行が QC / パースで落ちたときに説明文の先頭に付ける印 (原文のまま残る = 未翻訳。status は TRANSLATION_PENDING)
+PENDING_PREFIX = "(Translation Pending)"
 
-            # ログ記録
-            if hasattr(response, "response_metadata") and "token_usage" in response.response_metadata:
-                usage = response.response_metadata["token_usage"]
-                log_api_usage("trans_en", llm.model, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+# --- S1-04 Transcreation Prompt Templates ---
+# partial_variables として埋め込むので、ここの { } はエスケープ不要
+_TRANSCREATION_RULES = """
+1) Title format: "{Localized name}" (Keep it native script only unless specified)
+2) Body: ~18 seconds silent reading (3-beat structure: Texture/Ratio -> How to Eat -> Pairing).
+3) No medical/health claims. No “guarantee”. No unverifiable origin claims.
+4) Be specific without inventing facts. If unknown, phrase as suggestion, not assertion.
+""".strip()
 
-            parsed_output = output_parser.parse(response.content)
-            
-            translated_item = MenuItem(
-                menu_title=parsed_output["menu_title"],
-                menu_content=parsed_output["menu_content"]
-            )
-            results.append(translated_item)
-            
-            progress = int(i / total_items * 100)
-            my_bar.progress(progress, text=f"{progress_text} ({i}/{total_items})")
-            
-        except Exception as e:
-            st.error(f"英語翻訳中にエラーが発生しました: {e}")
-            results.append(MenuItem.create_error(str(e)))
-    
-    my_bar.progress(100, text=f"✅ 英語翻訳完了")
-    return results
-
-async def translate_english_to_many_async(menu_items: List[MenuItem], target_languages: Dict[str, List[MenuItem]], api_key: str, persona: str = "標準 (丁寧)") -> Dict[str, List[MenuItem]]:
-    """英語から指定言語への翻訳を非同期で並列実行 (S1-04 Transcreation Engine)"""
-    llm = get_llm(api_key)
-    
-    # --- S1-04 Transcreation Prompt Template ---
-    transcreation_template = """
+# per_item: 1 item × 1 言語
+transcreation_prompt = register_structured_prompt(
+    "transcreation", "2",
+    prefix="""
     [ROLE]
     You are a transcreation copywriter for restaurant menus.
     Your voice MUST match the Persona below.
 
+    [OUTPUT RULES]
+    {rules}
+    5) JSON Output ONLY.
+
+    {format_instructions}
+
     [PERSONA]
     - Language: {target_language}
     - Speaker: {persona_role}
     - Tone: {persona_tone}
     - Forbidden: {persona_forbidden}
-
+    - Context: {persona}
+    """,
+    suffix="""
     [INPUT]
     - Item name (JP): {name_ja}
     - Item description (JP): {desc_ja}
+    """,
+    fmt=TRANSCREATION_FORMAT,
+    partial_variables={"rules": _TRANSCREATION_RULES},
+)
+
+# batched: 複数 item × 1 言語
+batch_prompt = register_structured_prompt(
+    "transcreation_batch", "2",
+    prefix="""
+    [ROLE]
+    You are a transcreation copywriter for restaurant menus.
+    Your voice MUST match the Persona below.
+
+    [OUTPUT RULES]
+    {rules}
+    5) Translate EVERY item independently. Keep each "id" exactly as given.
+    6) JSON Output ONLY.
+
+    {format_instructions}
+
+    [PERSONA]
+    - Language: {target_language}
+    - Speaker: {persona_role}
+    - Tone: {persona_tone}
+    - Forbidden: {persona_forbidden}
     - Context: {persona}
+    """,
+    suffix="""
+    [INPUT ITEMS]
+    {items_json}
+    """,
+    fmt=TRANSCREATION_BATCH_FORMAT,
+    partial_variables={"rules": _TRANSCREATION_RULES},
+)
+
+# multilang: 1 item × 全言語
+multilang_prompt = register_structured_prompt(
+    "transcreation_multilang", "2",
+    prefix="""
+    [ROLE]
+    You are a team of transcreation copywriters for restaurant menus.
+    Write one version per language below. Each version's voice MUST match its own Persona.
 
     [OUTPUT RULES]
-    1) Title format: "{Localized name}" (Keep it native script only unless specified)
-    2) Body: ~18 seconds silent reading (3-beat structure: Texture/Ratio -> How to Eat -> Pairing).
-    3) No medical/health claims. No “guarantee”. No unverifiable origin claims.
-    4) Be specific without inventing facts. If unknown, phrase as suggestion, not assertion.
-    5) JSON Output ONLY.
+    {rules}
+    5) Produce EVERY language listed in [PERSONAS]. Use the language names exactly as keys.
+    6) JSON Output ONLY.
+
+    {format_instructions}
+
+    [CONTEXT]
+    {persona}
+
+    [PERSONAS]
+    {personas_json}
+    """,
+    suffix="""
+    [INPUT]
+    - Item name (JP): {name_ja}
+    - Item description (JP): {desc_ja}
+    """,
+    fmt=TRANSCREATION_MULTILANG_FORMAT,
+    partial_variables={"rules": _TRANSCREATION_RULES},
+)
+
+# --- S1-06 QC Audit Prompt Templates ---
+_QC_HEADER = f"""
+Act as a Quality Control Auditor for restaurant menu translations.
+
+[Rules]
+{DEFAULT_QC_RULES.strip()}
+""".strip()
 
-    [DELIVER]
-    Return JSON:
-    {{
-      "name": "...",
-      "description": "...",
-      "pairing": "..."
-    }}
+qc_prompt = register_prompt(
+    "qc", "2",
+    prefix="""
+    {header}
+
+    Evaluate the generated translation below as PASS or FAIL. If FAIL, provide brief reason.
+    Format: "PASS" or "FAIL: [Reason]"
+    """,
+    suffix="""
+    [Source (JP)]
+    Name: {source_name}
+    Desc: {source_desc}
+
+    [Generated ({target_language})]
+    Name: {name}
+    Desc: {description}
+    Pairing: {pairing}
+    """,
+    partial_variables={"header": _QC_HEADER},
+)
+
+qc_batch_prompt = register_prompt(
+    "qc_batch", "2",
+    prefix="""
+    {header}
+
+    Evaluate every item below as PASS or FAIL.
+    Return JSON ONLY: {{"<id>": "PASS" or "FAIL: [Reason]", ...}}
+
+    [Target language]
+    {target_language}
+    """,
+    suffix="""
+    [Items (Source JP -> Generated)]
+    {items_json}
+    """,
+    partial_variables={"header": _QC_HEADER},
+)
+
+qc_multilang_prompt = register_prompt(
+    "qc_multilang", "2",
+    prefix="""
+    {header}
+
+    Evaluate every language below as PASS or FAIL.
+    Return JSON ONLY: {{"<Language>": "PASS" or "FAIL: [Reason]", ...}}
+    """,
+    suffix="""
+    [Source (JP)]
+    Name: {source_name}
+    Desc: {source_desc}
+
+    [Generated (keyed by language)]
+    {generated_json}
+    """,
+    partial_variables={"header": _QC_HEADER},
+)
+
+# QC 監査が失敗して合格扱い (fail open) にしたときの理由。監査していない出力はキャッシュに保存しない
+QC_UNAVAILABLE = "QC unavailable"
+
+def get_llm(api_key: str, temperature: float = 0.0, prompt_version: str = PROMPT_VERSION, model: Optional[str] = None, qc_gated: bool = False):
+    # model 省略時は GEMINI_MODEL。ステージごとのモデルは model_routing.route() で決める
+    # qc_gated=True (QC 監査を受ける生成) は呼び出し時にキャッシュへ保存せず、QC 合格後に commit_cached() で保存する
+    # 同じ (api_key, model, temperature) のクライアントはプールから使い回す (接続を再利用)
+    model = model or os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+    # キーが複数登録されていれば、1呼び出しごとに空いているキーへ振り分ける (キーごとの枠で制御)
+    pool = get_key_pool(api_key)
+    if pool is not None:
+        limited = with_key_pool(pool, model, temperature)
+    else:
+        limited = with_rate_limit(get_chat_model(api_key, model, temperature))
+    # 共有レート制御 + 429/5xx/期限切れリトライを挟み、遅い呼び出しはヘッジ (有効時)、
+    # その外側で永続キャッシュ (ヒット時は枠を消費しない)
+    return with_cache(with_hedging(limited), prompt_version, store_on_call=not qc_gated)
+
+def _log_usage(response, phase: str, model_name: str, store_id: str = "unknown_store", prompt: Optional[RenderedPrompt] = None):
+    tokens_in, tokens_out = extract_usage(response)
+    if tokens_in or tokens_out:
+        log_api_cost(store_id, phase, model_name, tokens_in, tokens_out)
+        if prompt is not None:
+            # 静的プレフィックス / item サフィックスの内訳 (プレフィックスキャッシュの効き具合の確認用)
+            cache_read = record_prompt_usage(prompt, response)
+            log_prompt_split(store_id, phase, prompt.name, prompt.version, prompt.prefix_tokens, prompt.suffix_tokens, cache_read)
+
+def _record_route(stage: str, model_name: str, passed: int, failed: int, tier: int, response=None):
+    """model_routing の集計にこのリクエストの結果と費用を載せる (キャッシュヒットは費用 0)"""
+    tokens_in, tokens_out = extract_usage(response) if response is not None else (0, 0)
+    record_attempt(
+        stage, model_name, passed, failed, tier=tier,
+        tokens_in=tokens_in, tokens_out=tokens_out, cost_jpy=estimate_cost_jpy(model_name, tokens_in, tokens_out),
+    )
+
+def _parse_json_response(content: str) -> Any:
+    """```json フェンス付きでも素のJSONでも読めるようにパースし、壊れていれば修復する (dict / list を返す)"""
+    return parse_json(content)
+
+def _parse_menu_fields(content: str) -> dict:
+    """校正 / 英訳の応答 (menu_title / menu_content) を読む"""
+    return parse_fields(content, [schema.name for schema in response_schemas])
+
+def _record_output(fmt: OutputFormat, structured: bool, rendered: RenderedPrompt, response, ok: bool):
+    """出力形式 (形式の説明 / JSON スキーマ) ごとの入力トークンとパース結果を集計する (キャッシュヒットは数えない)"""
+    if response is not None and not is_cache_hit(response):
+        fmt.record(structured, rendered.prefix_tokens + rendered.suffix_tokens, ok)
+
+def _collect_ordered(done_map: Dict[Any, Any], total: int) -> List[MenuItem]:
+    """run_bounded の結果を入力順に並べ直す。例外はその item だけエラー MenuItem にする"""
+    results = []
+    for i in range(total):
+        res = done_map.get(i)
+        if isinstance(res, Exception) or res is None:
+            results.append(MenuItem.create_error(str(res)))
+        else:
+            results.append(res)
+    return results
+
+def _with_source(result: MenuItem, source: MenuItem) -> MenuItem:
+    """校正・英訳の結果に翻訳元の日本語メニュー名を引き継ぐ (後段の辞書引き用)"""
+    result.source_title = source.source_title or source.menu_title
+    return result
+
+def dictionary_source_name(item: MenuItem) -> str:
+    """
+    辞書を引く日本語名。英訳済みの item (Admin / パイプライン) は翻訳元の source_title、
+    source_title が無いのは日本語の元 item なのでその menu_title。英訳後の menu_title では引かない
+    """
+    return item.source_title or item.menu_title
+
+def dictionary_item(item: MenuItem, lang: str) -> Optional[MenuItem]:
+    """
+    辞書に lang の訳 (名前と説明) があれば LLM を呼ばずにその MenuItem を返す。
+    辞書は日本語名の完全一致でだけ引く (dictionary_source_name)
     """
-    
-    transcreation_prompt = PromptTemplate(
-        input_variables=["target_language", "persona_role", "persona_tone", "persona_forbidden", "name_ja", "desc_ja", "persona"],
-        template=transcreation_template
+    match = lookup_menu(dictionary_source_name(item))
+    hit = entry_translation(match.entry, lang) if match else None
+    if hit is None:
+        return None
+    name, description, pairing = hit
+    return MenuItem(
+        menu_title=name,
+        menu_content=description,
+        pairing=pairing,
+        confidence=match.score,
+        status="confirmed",
     )
 
-    from .personas import PERSONA_DEFINITIONS, DEFAULT_QC_RULES
-    from .models import MenuItem
+def _persona_def(lang: str) -> dict:
+    # Get Persona Data (S1-03). PERSONA_DEFINITIONS は英語名なので "韓国語" なども引けるように揃える
+    return PERSONA_DEFINITIONS.get(canonical_language(lang), {
+        "role": "Professional Translator",
+        "tone": "Polite, accurate.",
+        "forbidden": "Mistranslations",
+        "keywords": []
+    })
+
+# --- プロンプトの組み立て (実行時と見積もり (translation_planner) で同じ文字列を作る) ---
+# structured を省略したら LLM_STRUCTURED_OUTPUT に従う (True = 形式の説明の代わりに JSON スキーマを送る版)
+def render_cleanup(menu_item: MenuItem, structured: Optional[bool] = None) -> RenderedPrompt:
+    input_text = {"menu_title": menu_item.menu_title, "menu_content": menu_item.menu_content}
+    return cleanup_prompt.render(structured, original_text=json.dumps(input_text, ensure_ascii=False))
+
+def render_ja_to_en(menu_item: MenuItem, persona: str, structured: Optional[bool] = None) -> RenderedPrompt:
+    input_text = {"menu_title": menu_item.menu_title, "menu_content": menu_item.menu_content}
+    return ja_to_en_prompt.render(
+        structured,
+        cleaned_japanese_text=json.dumps(input_text, ensure_ascii=False),
+        persona_instruction=PERSONA_PROMPTS.get(persona, PERSONA_PROMPTS["標準 (丁寧)"])
+    )
+
+def render_cleanup_en(menu_item: MenuItem, persona: str, structured: Optional[bool] = None) -> RenderedPrompt:
+    input_text = {"menu_title": menu_item.menu_title, "menu_content": menu_item.menu_content}
+    return cleanup_en_prompt.render(
+        structured,
+        original_text=json.dumps(input_text, ensure_ascii=False),
+        persona_instruction=PERSONA_PROMPTS.get(persona, PERSONA_PROMPTS["標準 (丁寧)"])
+    )
+
+def render_transcreation(name_ja: str, desc_ja: str, lang: str, persona: str, structured: Optional[bool] = None) -> RenderedPrompt:
+    persona_def = _persona_def(lang)
+    return transcreation_prompt.render(
+        structured,
+        target_language=lang,
+        persona_role=persona_def["role"],
+        persona_tone=persona_def["tone"],
+        persona_forbidden=persona_def["forbidden"],
+        name_ja=name_ja,
+        desc_ja=desc_ja,
+        persona=persona # Extra context
+    )
+
+def render_transcreation_batch(batch: List[Tuple[int, MenuItem]], lang: str, persona: str, structured: Optional[bool] = None) -> RenderedPrompt:
+    persona_def = _persona_def(lang)
+    items_json = json.dumps(
+        [{"id": str(idx), "name_ja": item.menu_title, "desc_ja": item.menu_content} for idx, item in batch],
+        ensure_ascii=False
+    )
+    return batch_prompt.render(
+        structured,
+        target_language=lang,
+        persona_role=persona_def["role"],
+        persona_tone=persona_def["tone"],
+        persona_forbidden=persona_def["forbidden"],
+        persona=persona,
+        items_json=items_json
+    )
+
+def render_transcreation_multilang(menu_item: MenuItem, langs: List[str], persona: str, structured: Optional[bool] = None) -> RenderedPrompt:
+    personas_json = json.dumps(
+        {lang: {k: _persona_def(lang)[k] for k in ("role", "tone", "forbidden")} for lang in langs},
+        ensure_ascii=False, indent=2
+    )
+    return multilang_prompt.render(
+        structured,
+        personas_json=personas_json,
+        name_ja=menu_item.menu_title,
+        desc_ja=menu_item.menu_content,
+        persona=persona
+    )
+
+def batch_cost(entry: Tuple[int, MenuItem]) -> int:
+    """batched モードのバッチ分割に使う1件あたりの推定トークン (入力 + 想定出力)"""
+    _, item = entry
+    return estimate_tokens(item.menu_title) + estimate_tokens(item.menu_content) + BATCH_OUTPUT_TOKENS_PER_ITEM
+
+def _progress_callback(on_progress: Optional[Callable[[int, int], None]]):
+    def _on_complete(_key, _result, done, total):
+        if on_progress:
+            on_progress(done, total)
+    return _on_complete
+
+def _run_with_progress_bar(coro_factory: Callable[[Callable[[int, int], None]], Any], progress_text: str, done_text: str, error_label: str) -> List[MenuItem]:
+    """非同期ステージを st.progress 付きで同期実行する (main.py / Admin 用)"""
+    my_bar = st.progress(0, text=progress_text)
+
+    def _on_progress(done: int, total: int):
+        my_bar.progress(int(done / total * 100), text=f"{progress_text} ({done}/{total})")
+
+    results = asyncio.run(coro_factory(_on_progress))
+    for item in results:
+        if item.status == "error":
+            st.error(f"{error_label}中にエラーが発生しました: {item.menu_content}")
+
+    my_bar.progress(100, text=done_text)
+    return results
+
+async def remove_unnecessary_parts_async(
+    text_list: List[MenuItem],
+    api_key: str,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> List[MenuItem]:
+    """
+    不要部分削除を max_concurrency 件まで並列で行い、入力と同じ順序の MenuItem リストで返す。
+    失敗した item はその位置にエラー MenuItem が入る。on_progress(done, total) は1件完了ごとに呼ばれる。
+    """
+    llm = get_llm(api_key, model=route("cleanup"))
+    # chain = cleanup_prompt | llm | output_parser # 旧実装
+    # UsageMetadataを取得するために chain を分割実行する
+
+    async def clean_one(menu_item: MenuItem) -> MenuItem:
+        # 辞書に校正済みの日本語 (description_ja) があればそれを使う
+        hit = dictionary_item(menu_item, "Japanese")
+        if hit is not None:
+            record_dictionary_skip("cleanup_ja")
+            return _with_source(hit, menu_item)
+
+        # 手動でChainを実行してMetadataを抜く
+        structured = use_schema()
+        rendered = render_cleanup(menu_item, structured)
+        formatted_prompt = rendered.text
+        response = await llm.ainvoke(formatted_prompt, **CLEANUP_FORMAT.invoke_kwargs(structured))
+
+        # ログ記録
+        _log_usage(response, "cleanup_ja", llm.model, prompt=rendered)
+
+        try:
+            parsed_output = _parse_menu_fields(response.content)
+        except Exception:
+            _record_output(CLEANUP_FORMAT, structured, rendered, response, ok=False)
+            invalidate_cached(llm, formatted_prompt)
+            raise
+        _record_output(CLEANUP_FORMAT, structured, rendered, response, ok=True)
+
+        return _with_source(MenuItem(
+            menu_title=parsed_output["menu_title"],
+            menu_content=parsed_output["menu_content"]
+        ), menu_item)
+
+    # 同じ内容の item は1回だけ処理して全位置に配る (進捗はユニーク件数ベース)
+    unique_items, positions = dedupe_items(text_list)
+    record_dedup("cleanup_ja", len(text_list), len(unique_items))
+    jobs = [(i, (lambda item=item: clean_one(item))) for i, item in enumerate(unique_items)]
+    done_map = await run_bounded(jobs, max_concurrency=max_concurrency, on_complete=_progress_callback(on_progress))
+    return fan_out(_collect_ordered(done_map, len(unique_items)), positions, len(text_list))
+
+def remove_unnecessary_parts(text_list: List[MenuItem], api_key: str) -> List[MenuItem]:
+    """不要部分削除を並列実行し、st.progress を更新しながら結果をMenuItemのリストで返す"""
+    return _run_with_progress_bar(
+        lambda on_progress: remove_unnecessary_parts_async(text_list, api_key, on_progress=on_progress),
+        progress_text="✒️ 日本語校正",
+        done_text="✅ 日本語校正完了",
+        error_label="日本語校正",
+    )
+
+async def translate_japanese_to_english_async(
+    menu_items: List[MenuItem],
+    api_key: str,
+    persona: str = "標準 (丁寧)",
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> List[MenuItem]:
+    """
+    日本語のMenuItemリストを max_concurrency 件まで並列で英語に翻訳し、入力と同じ順序で返す。
+    失敗した item はその位置にエラー MenuItem が入る。on_progress(done, total) は1件完了ごとに呼ばれる。
+    """
+    llm = get_llm(api_key, model=route("ja_to_en"))
+
+
+    async def translate_one(menu_item: MenuItem) -> MenuItem:
+        hit = dictionary_item(menu_item, "English")
+        if hit is not None:
+            record_dictionary_skip("trans_en")
+            return _with_source(hit, menu_item)
+
+        # 英語翻訳用プロンプトにもペルソナ適用 (ペルソナ指示は静的プレフィックス側)
+        structured = use_schema()
+        rendered = render_ja_to_en(menu_item, persona, structured)
+        formatted_prompt = rendered.text
+        response = await llm.ainvoke(formatted_prompt, **JA_TO_EN_FORMAT.invoke_kwargs(structured))
+
+        # ログ記録
+        _log_usage(response, "trans_en", llm.model, prompt=rendered)
+
+        try:
+            parsed_output = _parse_menu_fields(response.content)
+        except Exception:
+            _record_output(JA_TO_EN_FORMAT, structured, rendered, response, ok=False)
+            invalidate_cached(llm, formatted_prompt)
+            raise
+        _record_output(JA_TO_EN_FORMAT, structured, rendered, response, ok=True)
+
+        # 英訳後も辞書を日本語で引けるように翻訳元の名前を残す
+        return _with_source(MenuItem(
+            menu_title=parsed_output["menu_title"],
+            menu_content=parsed_output["menu_content"]
+        ), menu_item)
+
+    # 同じ内容の item は1回だけ翻訳して全位置に配る (進捗はユニーク件数ベース)
+    unique_items, positions = dedupe_items(menu_items)
+    record_dedup("trans_en", len(menu_items), len(unique_items))
+    jobs = [(i, (lambda item=item: translate_one(item))) for i, item in enumerate(unique_items)]
+    done_map = await run_bounded(jobs, max_concurrency=max_concurrency, on_complete=_progress_callback(on_progress))
+    return fan_out(_collect_ordered(done_map, len(unique_items)), positions, len(menu_items))
+
+def translate_japanese_to_english(menu_items: List[MenuItem], api_key: str, persona: str = "標準 (丁寧)") -> List[MenuItem]:
+    """日本語のMenuItemリストを並列で英語に翻訳し、st.progress を更新しながら結果をMenuItemのリストで返す"""
+    return _run_with_progress_bar(
+        lambda on_progress: translate_japanese_to_english_async(menu_items, api_key, persona, on_progress=on_progress),
+        progress_text="🔤 英語翻訳",
+        done_text="✅ 英語翻訳完了",
+        error_label="英語翻訳",
+    )
+
+async def clean_and_translate_async(
+    menu_items: List[MenuItem],
+    api_key: str,
+    persona: str = "標準 (丁寧)",
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> Tuple[List[MenuItem], List[MenuItem]]:
+    """
+    校正と英訳を1 item 1リクエストで行う (remove_unnecessary_parts → translate_japanese_to_english の2回ぶんを1回に)。
+    (校正済み日本語, 英訳) を入力と同じ順序で返す。失敗した item は両方の同じ位置にエラー MenuItem が入る。
+    """
+    llm = get_llm(api_key, model=route("cleanup_en"))
+
+    async def fuse_one(menu_item: MenuItem) -> Tuple[MenuItem, MenuItem]:
+        # 辞書に日本語・英語の両方があれば LLM を呼ばない (片方だけなら生成して、ある方は辞書を優先)
+        ja_hit = dictionary_item(menu_item, "Japanese")
+        en_hit = dictionary_item(menu_item, "English")
+        if ja_hit is not None and en_hit is not None:
+            record_dictionary_skip("cleanup_en")
+            return _with_source(ja_hit, menu_item), _with_source(en_hit, menu_item)
+
+        structured = use_schema()
+        rendered = render_cleanup_en(menu_item, persona, structured)
+        formatted_prompt = rendered.text
+        response = await llm.ainvoke(formatted_prompt, **CLEANUP_EN_FORMAT.invoke_kwargs(structured))
+        _log_usage(response, "cleanup_en", llm.model, prompt=rendered)
+
+        try:
+            parsed = coerce(parse_json(response.content), CleanupEnglishOutput)
+        except Exception:
+            _record_output(CLEANUP_EN_FORMAT, structured, rendered, response, ok=False)
+            invalidate_cached(llm, formatted_prompt)
+            raise
+        _record_output(CLEANUP_EN_FORMAT, structured, rendered, response, ok=True)
+
+        return (
+            _with_source(ja_hit or MenuItem(menu_title=parsed.ja.menu_title, menu_content=parsed.ja.menu_content), menu_item),
+            _with_source(en_hit or MenuItem(menu_title=parsed.en.menu_title, menu_content=parsed.en.menu_content), menu_item),
+        )
+
+    unique_items, positions = dedupe_items(menu_items)
+    record_dedup("cleanup_en", len(menu_items), len(unique_items))
+    jobs = [(i, (lambda item=item: fuse_one(item))) for i, item in enumerate(unique_items)]
+    done_map = await run_bounded(jobs, max_concurrency=max_concurrency, on_complete=_progress_callback(on_progress))
+    # (ja, en) の組を2本の列に分ける。例外はどちらの列でも同じ位置のエラー MenuItem になる
+    sides = [
+        {i: res[side] if isinstance(res, tuple) else res for i, res in done_map.items()}
+        for side in (0, 1)
+    ]
+    cleaned, english = (fan_out(_collect_ordered(side, len(unique_items)), positions, len(menu_items)) for side in sides)
+    return cleaned, english
+
+def clean_and_translate(menu_items: List[MenuItem], api_key: str, persona: str = "標準 (丁寧)") -> Tuple[List[MenuItem], List[MenuItem]]:
+    """校正 + 英訳を1回で並列実行し、st.progress を更新しながら (校正済み日本語, 英訳) を返す"""
+    english: List[MenuItem] = []
+
+    async def run(on_progress):
+        cleaned, translated = await clean_and_translate_async(menu_items, api_key, persona, on_progress=on_progress)
+        english.extend(translated)
+        return cleaned
+
+    # エラー item は両方の同じ位置に入るので、表示は校正側だけでよい
+    cleaned = _run_with_progress_bar(
+        run,
+        progress_text="✒️🔤 日本語校正 + 英語翻訳",
+        done_text="✅ 日本語校正 + 英語翻訳完了",
+        error_label="日本語校正 + 英語翻訳",
+    )
+    return cleaned, english
+
+@dataclass(frozen=True)
+class TranscreationEngine:
+    """transcreation_engine が返す生成 + QC + 再試行の関数 (同じ LLM ラッパーを共有する)"""
+    single: Callable[..., Any]     # (item, lang, tier=0) -> MenuItem
+    batch: Callable[..., Any]      # ([(idx, item), ...], lang, tier=0) -> {idx: MenuItem}
+    multilang: Callable[..., Any]  # (idx, item, langs) -> {(lang, idx): MenuItem}
+
+
+def transcreation_engine(api_key: str, persona: str = "標準 (丁寧)") -> TranscreationEngine:
+    """
+    英語 (または日本語) の item を各言語へ翻訳する関数を組み立てる (S1-04 Transcreation Engine / S1-06 QC)。
+    LLM ラッパー (キャッシュ・hedging・limiter) はここで1回だけ作るので、item ごとに呼ぶ側
+    (translation_pipeline) も1回の実行につき1つ作って使い回すこと
+    """
+    # QC 監査用。生成は試行ごとに model_routing のカスケード (1回目は速いモデル、QC/パース失敗で上位へ) で選ぶ
+    llm = get_llm(api_key, model=route("qc"))
+    generation_llms: Dict[str, Any] = {}
+
+    def generation_llm(tier: int):
+        model_name = route("transcreation", tier)
+        if model_name not in generation_llms:
+            generation_llms[model_name] = get_llm(api_key, model=model_name, qc_gated=True)
+        return generation_llms[model_name]
+
+    # 1 item の再試行回数 = カスケードの段数 - 1 (最低1回)
+    item_retries = max(1, len(cascade("transcreation")) - 1)
 
     async def verify_quality(original_input: dict, generated_output: dict, lang: str) -> Tuple[bool, str]:
-        """S1-06 QC Audit"""
-        qc_prompt = f"""
-        Act as a Quality Control Auditor for restaurant menu translations.
-        
-        [Rules]
-        {DEFAULT_QC_RULES}
-        
-        [Source (JP)]
-        Name: {original_input['menu_title']}
-        Desc: {original_input['menu_content']}
-        
-        [Generated ({lang})]
-        Name: {generated_output.get('name', 'N/A')}
-        Desc: {generated_output.get('description', 'N/A')}
-        Pairing: {generated_output.get('pairing', 'N/A')}
-        
-        Evaluate PASS or FAIL. If FAIL, provide brief reason.
-        Format: "PASS" or "FAIL: [Reason]"
-        """
+        """S1-06 QC Audit (ローカルルールで決まらない場合のみ LLM 監査)。監査できなかったら (True, QC_UNAVAILABLE)"""
+        decision, reason = local_qc(generated_output, lang)
+        record_qc_decision(decision)
+        if decision is not None:
+            return decision, reason
+
+        rendered = qc_prompt.render(
+            source_name=original_input['menu_title'],
+            source_desc=original_input['menu_content'],
+            target_language=lang,
+            name=generated_output.get('name', 'N/A'),
+            description=generated_output.get('description', 'N/A'),
+            pairing=generated_output.get('pairing', 'N/A'),
+        )
         try:
-            res = await llm.ainvoke(qc_prompt)
+            res = await llm.ainvoke(rendered.text)
             content = res.content.strip()
             
             # Log QC Cost
-            if hasattr(res, "response_metadata") and "token_usage" in res.response_metadata:
-                usage = res.response_metadata["token_usage"]
-                log_api_cost(f"QC_{lang}", llm.model, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+            _log_usage(res, f"QC_{lang}", llm.model, prompt=rendered)
 
             if content.upper().startswith("PASS"):
                 return True, ""
             return False, content
         except Exception as e:
             print(f"QC Error: {e}")
-            return True, "" # Fail open
-
-    async def translate_with_retry(input_dict: dict, lang: str, max_retries: int = 1) -> dict:
-        # Get Persona Data (S1-03)
-        persona_def = PERSONA_DEFINITIONS.get(lang, {
-            "role": "Professional Translator",
-            "tone": "Polite, accurate.",
-            "forbidden": "Mistranslations",
-            "keywords": []
-        })
+            return True, QC_UNAVAILABLE # Fail open (キャッシュには残さない)
 
+    async def translate_with_retry(input_dict: dict, lang: str, max_retries: int = 1, tier: int = 0) -> Optional[dict]:
+        """
+        tier: 1回目の試行に使うカスケードの段 (バッチ / 全言語モードの失敗分は 1 から始める)。
+        全試行が QC / パースで落ちたら None
+        """
         for attempt in range(max_retries + 1): # Attempt 0 + Max Retries
-            # 1. Generate
-            formatted_prompt = transcreation_prompt.format_prompt(
-                target_language=lang,
-                persona_role=persona_def["role"],
-                persona_tone=persona_def["tone"],
-                persona_forbidden=persona_def["forbidden"],
-                name_ja=input_dict["menu_title"],
-                desc_ja=input_dict["menu_content"],
-                persona=persona # Extra context
-            )
-            
+            # 1. Generate (試行ごとにカスケードを1段ずつ上げる)
+            gen_tier = tier + attempt
+            gen_llm = generation_llm(gen_tier)
+            structured = use_schema()
+            rendered = render_transcreation(input_dict["menu_title"], input_dict["menu_content"], lang, persona, structured)
+            formatted_prompt = rendered.text
+            response = None
+
             try:
-                response = await llm.ainvoke(formatted_prompt)
-                
+                response = await gen_llm.ainvoke(formatted_prompt, **TRANSCREATION_FORMAT.invoke_kwargs(structured))
+
                 # Log Gen Cost
-                if hasattr(response, "response_metadata") and "token_usage" in response.response_metadata:
-                    usage = response.response_metadata["token_usage"]
-                    log_api_cost(f"trans_{lang}", llm.model, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+                _log_usage(response, f"trans_{lang}", gen_llm.model, prompt=rendered)
 
-                # Parse JSON
-                parsed = output_parser.parse(response.content)
+                # Parse JSON (name/description/pairing 形式なので menu_title 前提の output_parser は使わない)
+                try:
+                    parsed = _parse_json_response(response.content)
+                except Exception:
+                    _record_output(TRANSCREATION_FORMAT, structured, rendered, response, ok=False)
+                    raise
+                _record_output(TRANSCREATION_FORMAT, structured, rendered, response, ok=isinstance(parsed, dict))
                 
                 # Normalize keys
                 if "menu_title" in parsed and "name" not in parsed:
                     parsed["name"] = parsed["menu_title"]
                 if "menu_content" in parsed and "description" not in parsed:
                     parsed["description"] = parsed["menu_content"]
+
+                # キャッシュヒット = 過去に QC を通過した出力 (合格後にだけ保存する) なので、生成も QC もスキップ
+                if is_cache_hit(response):
+                    logger.debug("%s: cache hit", lang)
+                    return parsed
                 
                 # 2. Quality Control (QC)
                 is_pass, reason = await verify_quality(input_dict, parsed, lang)
+                _record_route("transcreation", gen_llm.model, int(is_pass), int(not is_pass), gen_tier, response)
                 if is_pass:
-                    print(f"✅ {lang}: Pass")
+                    logger.debug("%s: QC pass", lang)
+                    if reason != QC_UNAVAILABLE:
+                        commit_cached(gen_llm, formatted_prompt, response)
                     return parsed
                 else:
-                    print(f"⚠️ {lang}: QC Fail - {reason} (Attempt {attempt+1})")
-                    continue 
+                    logger.debug("%s: QC fail - %s (attempt %d)", lang, reason, attempt + 1)
+                    # 不合格の出力はキャッシュに残さない (次の試行で再生成させる)
+                    invalidate_cached(gen_llm, formatted_prompt)
+                    continue
 
             except Exception as e:
-                # print(f"Error {lang}: {e}")
-                pass
+                invalidate_cached(gen_llm, formatted_prompt)
+                # 429 / 5xx の再試行は RateLimitedChatModel 側で済んでいるので、
+                # ここまで来た rate_limit / transient / fatal は打ち切る。再生成で直りうるのは parse のみ
+                kind = classify_error(e)
+                logger.debug("%s: %s error - %s (attempt %d)", lang, kind, e, attempt + 1)
+                if kind != PARSE:
+                    break
+                _record_route("transcreation", gen_llm.model, 0, 1, gen_tier, response)
             
-            # Wait briefly before retry if not last attempt
+            # Back off before retry if not last attempt
             if attempt < max_retries:
-                await asyncio.sleep(1)
+                await asyncio.sleep(DEFAULT_RETRY_POLICY.backoff(attempt))
         
-        # Fallback if all attempts fail
-        return {
-             "name": input_dict["menu_title"], 
-             "description": f"(Translation Pending) {input_dict['menu_content']}",
-             "pairing": ""
-        }
+        return None
 
-    async def process_single_item(item: MenuItem, lang: str) -> MenuItem:
+    async def process_single_item(item: MenuItem, lang: str, tier: int = 0) -> MenuItem:
         try:
             input_data = {"menu_title": item.menu_title, "menu_content": item.menu_content}
-            result_dict = await translate_with_retry(input_data, lang, max_retries=1)
-            
+            result_dict = await translate_with_retry(input_data, lang, max_retries=item_retries, tier=tier)
+            if result_dict is None:
+                # Fallback if all attempts fail: 原文のまま翻訳待ちとして返す (公開しない・ジョブ再開で作り直す)
+                return MenuItem(
+                    menu_title=item.menu_title,
+                    menu_content=f"{PENDING_PREFIX} {item.menu_content}",
+                    confidence=0.0,
+                    status=TRANSLATION_PENDING
+                )
+
             return MenuItem(
                 menu_title=result_dict.get("name", item.menu_title),
                 menu_content=result_dict.get("description", item.menu_content),
@@ -410,23 +944,394 @@ async def translate_english_to_many_async(menu_items: List[MenuItem], target_lan
         except Exception as e:
             return MenuItem.create_error(f"{lang} Error: {str(e)}")
 
+    # --- Batched Mode (複数 item を1プロンプトに詰める) ---
+    async def verify_quality_batch(batch_inputs: Dict[str, dict], generated: Dict[str, dict], lang: str) -> Tuple[Dict[str, str], bool]:
+        """
+        S1-06 QC Audit (バッチ版)。(FAIL した id -> 理由, 全件を監査できたか) を返す。
+        ローカルルールで決まらない item だけ LLM 監査
+        """
+        local_failed: Dict[str, str] = {}
+        undecided: Dict[str, dict] = {}
+        for item_id, out in generated.items():
+            decision, reason = local_qc(out, lang)
+            record_qc_decision(decision)
+            if decision is False:
+                local_failed[item_id] = reason
+            elif decision is None:
+                undecided[item_id] = out
+        if not undecided:
+            return local_failed, True
+
+        entries = []
+        for item_id, out in undecided.items():
+            src = batch_inputs[item_id]
+            entries.append({
+                "id": item_id,
+                "source_name": src["menu_title"],
+                "source_desc": src["menu_content"],
+                "name": out.get("name", "N/A"),
+                "description": out.get("description", "N/A"),
+                "pairing": out.get("pairing", "N/A"),
+            })
+        rendered = qc_batch_prompt.render(target_language=lang, items_json=json.dumps(entries, ensure_ascii=False))
+        try:
+            res = await llm.ainvoke(rendered.text)
+            _log_usage(res, f"QC_batch_{lang}", llm.model, prompt=rendered)
+            verdicts = _parse_json_response(res.content)
+            return {
+                **local_failed,
+                **{
+                    item_id: str(verdict)
+                    for item_id, verdict in verdicts.items()
+                    if item_id in undecided and not str(verdict).strip().upper().startswith("PASS")
+                },
+            }, True
+        except Exception as e:
+            print(f"QC Batch Error: {e}")
+            return local_failed, False # Fail open (キャッシュには残さない)
+
+    async def translate_batch(batch: List[Tuple[int, MenuItem]], lang: str, tier: int = 0) -> Dict[int, MenuItem]:
+        """
+        1言語ぶんのバッチを1リクエストで翻訳する。
+        パース失敗・欠落・QC FAIL の item は、残りだけで再バッチ (全件失敗なら半分に分割) して
+        カスケードの次の段のモデルで再試行し、最終的に1件になったら per-item の translate_with_retry に落とす。
+        """
+        if len(batch) == 1:
+            idx, item = batch[0]
+            return {idx: await process_single_item(item, lang, tier)}
+
+        batch_inputs = {
+            str(idx): {"menu_title": item.menu_title, "menu_content": item.menu_content}
+            for idx, item in batch
+        }
+        gen_llm = generation_llm(tier)
+        structured = use_schema()
+        rendered = render_transcreation_batch(batch, lang, persona, structured)
+        formatted_prompt = rendered.text
+
+        generated: Dict[str, dict] = {}
+        cache_hit = False
+        response = None
+        try:
+            response = await gen_llm.ainvoke(formatted_prompt, **TRANSCREATION_BATCH_FORMAT.invoke_kwargs(structured))
+            cache_hit = is_cache_hit(response)
+            _log_usage(response, f"trans_batch_{lang}", gen_llm.model, prompt=rendered)
+            parsed = _parse_json_response(response.content)
+            if isinstance(parsed, dict):
+                parsed = parsed.get("items", [])
+            for out in parsed:
+                item_id = str(out.get("id", ""))
+                if item_id in batch_inputs and out.get("name") and out.get("description"):
+                    generated[item_id] = out
+        except Exception as e:
+            print(f"⚠️ {lang}: Batch of {len(batch)} failed - {e}")
+        # 1件でも読めなかった (壊れた / 欠けた) 応答はパース失敗として数える
+        _record_output(TRANSCREATION_BATCH_FORMAT, structured, rendered, response, ok=len(generated) == len(batch_inputs))
+
+        failed = set(batch_inputs) - set(generated)
+        audited = False
+        if generated and not cache_hit:
+            qc_failed, audited = await verify_quality_batch(batch_inputs, generated, lang)
+            for item_id, reason in qc_failed.items():
+                logger.debug("%s: QC fail (batch) id=%s - %s", lang, item_id, reason)
+            failed |= set(qc_failed)
+        if response is not None and not cache_hit:
+            _record_route("transcreation", gen_llm.model, len(batch) - len(failed), len(failed), tier, response)
+        # 全件が QC を通った応答だけをキャッシュに残す
+        if failed:
+            invalidate_cached(gen_llm, formatted_prompt)
+        elif audited:
+            commit_cached(gen_llm, formatted_prompt, response)
+
+        results = {
+            int(item_id): MenuItem(
+                menu_title=out.get("name", ""),
+                menu_content=out.get("description", ""),
+                pairing=out.get("pairing", ""),
+                confidence=0.9,
+                status="confirmed"
+            )
+            for item_id, out in generated.items()
+            if item_id not in failed
+        }
+
+        # Split & Retry
+        retry = [(idx, item) for idx, item in batch if str(idx) in failed]
+        if retry:
+            if len(retry) == len(batch):
+                mid = len(retry) // 2
+                halves = [retry[:mid], retry[mid:]]
+            else:
+                halves = [retry]
+            for sub_results in await asyncio.gather(*(translate_batch(h, lang, tier + 1) for h in halves)):
+                results.update(sub_results)
+        return results
+
+    # --- Multi-Language Mode (1 item の全言語を1リクエストで生成) ---
+    async def verify_quality_multilang(input_dict: dict, generated: Dict[str, dict]) -> Tuple[Dict[str, str], bool]:
+        """
+        S1-06 QC Audit (全言語版)。(FAIL した言語 -> 理由, 全言語を監査できたか) を返す。
+        ローカルルールで決まらない言語だけ LLM 監査
+        """
+        local_failed: Dict[str, str] = {}
+        undecided: Dict[str, dict] = {}
+        for lang, out in generated.items():
+            decision, reason = local_qc(out, lang)
+            record_qc_decision(decision)
+            if decision is False:
+                local_failed[lang] = reason
+            elif decision is None:
+                undecided[lang] = out
+        if not undecided:
+            return local_failed, True
+
+        rendered = qc_multilang_prompt.render(
+            source_name=input_dict['menu_title'],
+            source_desc=input_dict['menu_content'],
+            generated_json=json.dumps(undecided, ensure_ascii=False),
+        )
+        try:
+            res = await llm.ainvoke(rendered.text)
+            _log_usage(res, "QC_multilang", llm.model, prompt=rendered)
+            verdicts = _parse_json_response(res.content)
+            return {
+                **local_failed,
+                **{
+                    lang: str(verdict)
+                    for lang, verdict in verdicts.items()
+                    if lang in undecided and not str(verdict).strip().upper().startswith("PASS")
+                },
+            }, True
+        except Exception as e:
+            print(f"QC Multilang Error: {e}")
+            return local_failed, False # Fail open (キャッシュには残さない)
+
+    async def translate_item_multilang(idx: int, item: MenuItem, langs: List[str]) -> Dict[Tuple[str, int], MenuItem]:
+        """
+        1 item の全言語を1リクエストで (カスケード1段目のモデルで) 生成する。
+        欠落・QC FAIL の言語だけ per-item の translate_with_retry で次の段からやり直す。
+        """
+        input_dict = {"menu_title": item.menu_title, "menu_content": item.menu_content}
+        gen_llm = generation_llm(0)
+        structured = use_schema()
+        rendered = render_transcreation_multilang(item, langs, persona, structured)
+        formatted_prompt = rendered.text
+
+        generated: Dict[str, dict] = {}
+        cache_hit = False
+        response = None
+        try:
+            response = await gen_llm.ainvoke(formatted_prompt, **TRANSCREATION_MULTILANG_FORMAT.invoke_kwargs(structured))
+            cache_hit = is_cache_hit(response)
+            _log_usage(response, "trans_multilang", gen_llm.model, prompt=rendered)
+            parsed = _parse_json_response(response.content)
+            for lang in langs:
+                out = parsed.get(lang)
+                if isinstance(out, dict) and out.get("name") and out.get("description"):
+                    generated[lang] = out
+        except Exception as e:
+            print(f"⚠️ item {idx}: Multilang generation failed - {e}")
+        _record_output(TRANSCREATION_MULTILANG_FORMAT, structured, rendered, response, ok=len(generated) == len(langs))
+
+        failed = set(langs) - set(generated)
+        audited = False
+        if generated and not cache_hit:
+            qc_failed, audited = await verify_quality_multilang(input_dict, generated)
+            for lang, reason in qc_failed.items():
+                logger.debug("%s: QC fail (multilang) item=%s - %s", lang, idx, reason)
+            failed |= set(qc_failed)
+        if response is not None and not cache_hit:
+            _record_route("transcreation", gen_llm.model, len(langs) - len(failed), len(failed), 0, response)
+        # 全言語が QC を通った応答だけをキャッシュに残す
+        if failed:
+            invalidate_cached(gen_llm, formatted_prompt)
+        elif audited:
+            commit_cached(gen_llm, formatted_prompt, response)
+
+        results = {
+            (lang, idx): MenuItem(
+                menu_title=out.get("name", ""),
+                menu_content=out.get("description", ""),
+                pairing=out.get("pairing", ""),
+                confidence=0.9,
+                status="confirmed"
+            )
+            for lang, out in generated.items()
+            if lang not in failed
+        }
+        retry_langs = [lang for lang in langs if lang in failed]
+        retried = await asyncio.gather(*(process_single_item(item, lang, tier=1) for lang in retry_langs))
+        for lang, res in zip(retry_langs, retried):
+            results[(lang, idx)] = res
+        return results
+
+    return TranscreationEngine(single=process_single_item, batch=translate_batch, multilang=translate_item_multilang)
+
+
+async def translate_english_to_many_stream(
+    menu_items: List[MenuItem],
+    target_languages: Dict[str, List[MenuItem]],
+    api_key: str,
+    persona: str = "標準 (丁寧)",
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    engine_mode: str = "per_item",
+    batch_token_budget: int = DEFAULT_BATCH_TOKEN_BUDGET,
+    skip: Optional[Set[Tuple[str, int]]] = None,
+    language_weights: Optional[Dict[str, float]] = None,
+) -> AsyncIterator[TranslationEvent]:
+    """
+    英語から指定言語への翻訳を非同期で並列実行し、(item, 言語) が1つ終わるごとに
+    TranslationEvent を yield する (S1-04 Transcreation Engine)
+
+    全 (item, 言語) タスクを1本のキューに平坦化し、max_concurrency で全体の同時実行数を制限する。
+    イベントは完了順 (入力順ではない) に届くので、item_index / lang で書き戻すこと。
+    同じ内容の item (dedup.canonical_key が一致) は1回だけ生成し、全位置ぶんのイベントを出す。
+
+    engine_mode:
+        "per_item": 1 item × 1 言語ごとに1リクエスト (従来方式)
+        "batched" : 1言語ぶんの複数 item を1プロンプトにまとめ、id キーの JSON 配列で受け取る。
+                    バッチサイズは batch_token_budget (推定トークン数) から自動決定する。
+        "multilang": 1 item の全言語を1プロンプトで生成し、言語キーの JSON オブジェクトで受け取る。
+                    日本語原文とルールを言語数ぶん送り直さずに済む。
+
+    skip: 実行済みとして飛ばす (lang, item_index) の集合 (ジョブ再開用)。
+          done / total は飛ばした分も含めた全体に対する値になる。
+    辞書 (menu_dictionary) にその言語の訳がある (item, 言語) は LLM を呼ばず、ジョブより先にイベントを出す。
+
+    language_weights: {言語: 重み} (省略時は language_priority.language_weights())。重みの大きい言語のジョブから
+          キューに積むので、per_item / batched では優先言語が先に全件揃う。言語の最後のイベントには lang_done が立つ。
+          multilang は1 item の全言語が1リクエストなので、重みはプロンプト内の言語の並びにだけ効く。
+    """
+    if engine_mode not in ENGINE_MODES:
+        raise ValueError(f"Unknown engine_mode: {engine_mode} (expected one of {ENGINE_MODES})")
+
+    engine = transcreation_engine(api_key, persona)
+
     # --- Main Loop ---
-    results = {lang: [] for lang in target_languages.keys()}
-    
-    # Process per language to manage tasks clearly
-    for lang in target_languages.keys():
-        lang_tasks = []
-        for item in menu_items:
-            lang_tasks.append(process_single_item(item, lang))
-        
-        # Gather results for this language
-        # (For 14 languages * N items, this is somewhat heavy, but async handles it well enough for <100 total reqs)
-        # Using a progress bar per language is good UX
-        
-        # Note: We can't easily update a Streamlit progress bar from inside async gather without callbacks.
-        # So we just await all.
-        
-        lang_results = await asyncio.gather(*lang_tasks)
-        results[lang] = list(lang_results)
-        
-    return results
\ No newline at end of file
+    # 言語ごとの直列 gather ではなく、全ジョブを1本のワークキューに積む
+    # 各ジョブは {(lang, item_index): MenuItem} を返す
+    #   per_item : 1 item × 1 言語
+    #   batched  : 複数 item × 1 言語
+    #   multilang: 1 item × 全言語
+    async def _run_single(idx: int, item: MenuItem, lang: str) -> Dict[Tuple[str, int], MenuItem]:
+        return {(lang, idx): await engine.single(item, lang)}
+
+    async def _run_batch(batch: List[Tuple[int, MenuItem]], lang: str) -> Dict[Tuple[str, int], MenuItem]:
+        return {(lang, idx): res for idx, res in (await engine.batch(batch, lang)).items()}
+
+    # 重みの大きい言語から順にジョブを積む (ワーカーはキューの先頭から取るので、その言語が先に揃う)
+    langs = prioritize_languages(target_languages.keys(), language_weights)
+    skip = skip or set()
+
+    # 同じ内容の item は1件ぶんだけ生成・QC し、完了時に全位置へ配る
+    # 以降のジョブは unique_items のインデックスで組み、skip は全位置が済んでいるものだけ飛ばす
+    unique_items, positions = dedupe_items(menu_items)
+    record_dedup("transcreation", len(menu_items), len(unique_items), tasks_per_item=len(langs))
+    unique_skip = {
+        (lang, u) for u, group in enumerate(positions) for lang in langs
+        if all((lang, pos) in skip for pos in group)
+    }
+
+    # 辞書に訳がある (item, 言語) は生成も QC もしない
+    dictionary_hits = {}
+    for u, item in enumerate(unique_items):
+        for lang in langs:
+            if (lang, u) in unique_skip:
+                continue
+            hit = dictionary_item(item, lang)
+            if hit is not None:
+                dictionary_hits[(lang, u)] = hit
+    if dictionary_hits:
+        record_dictionary_skip("transcreation", len(dictionary_hits))
+    unique_skip |= set(dictionary_hits)
+
+    jobs = []
+    job_tasks = {}
+    if engine_mode == "multilang":
+        for idx, item in enumerate(unique_items):
+            item_langs = [lang for lang in langs if (lang, idx) not in unique_skip]
+            if not item_langs:
+                continue
+            key = ("multilang", idx)
+            jobs.append((key, (lambda idx=idx, item=item, item_langs=item_langs: engine.multilang(idx, item, item_langs))))
+            job_tasks[key] = [(lang, idx) for lang in item_langs]
+    else:
+        for lang in langs:
+            pending = [(idx, item) for idx, item in enumerate(unique_items) if (lang, idx) not in unique_skip]
+            if engine_mode == "batched":
+                batches = split_by_token_budget(pending, batch_cost, batch_token_budget, MAX_BATCH_ITEMS)
+                for b_no, batch in enumerate(batches):
+                    key = (lang, "batch", b_no)
+                    jobs.append((key, (lambda batch=batch, lang=lang: _run_batch(batch, lang))))
+                    job_tasks[key] = [(lang, idx) for idx, _ in batch]
+            else:
+                for idx, item in pending:
+                    key = (lang, idx)
+                    jobs.append((key, (lambda idx=idx, item=item, lang=lang: _run_single(idx, item, lang))))
+                    job_tasks[key] = [(lang, idx)]
+
+    total_tasks = len(menu_items) * len(target_languages)
+    done_tasks = len({(lang, pos) for lang, pos in skip if lang in target_languages and pos < len(menu_items)})
+    remaining = remaining_by_language(langs, len(menu_items), skip)
+
+    def _events(lang: str, u: int, result: MenuItem, timings: Dict[str, float]) -> List[TranslationEvent]:
+        nonlocal done_tasks
+        events = []
+        pending_positions = [pos for pos in positions[u] if (lang, pos) not in skip]
+        for n, pos in enumerate(pending_positions):
+            done_tasks += 1
+            remaining[lang] -= 1
+            events.append(TranslationEvent(
+                item_index=pos,
+                item_id=menu_items[pos].id,
+                lang=lang,
+                result=result if n == 0 else copy_for_position(result),
+                timings=timings,
+                done=done_tasks,
+                total=total_tasks,
+                lang_done=remaining[lang] == 0,
+            ))
+        return events
+
+    for (lang, u), result in dictionary_hits.items():
+        for event in _events(lang, u, result, {"queued_sec": 0.0, "run_sec": 0.0, "since_start_sec": 0.0}):
+            yield event
+
+    async for key, res, timings in iter_bounded(jobs, max_concurrency=max_concurrency):
+        for lang, u in job_tasks[key]:
+            if isinstance(res, Exception):
+                result = MenuItem.create_error(f"{lang} Error: {str(res)}")
+            else:
+                result = res.get((lang, u)) or MenuItem.create_error(f"{lang} Error: missing result")
+            for event in _events(lang, u, result, timings):
+                yield event
+
+
+async def translate_english_to_many_async(
+    menu_items: List[MenuItem],
+    target_languages: Dict[str, List[MenuItem]],
+    api_key: str,
+    persona: str = "標準 (丁寧)",
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    on_progress: Optional[Callable[[int, int, str, int], None]] = None,
+    engine_mode: str = "per_item",
+    batch_token_budget: int = DEFAULT_BATCH_TOKEN_BUDGET,
+    language_weights: Optional[Dict[str, float]] = None,
+) -> Dict[str, List[MenuItem]]:
+    """
+    英語から指定言語への翻訳を非同期で並列実行し、全言語の結果をまとめて返す (S1-04 Transcreation Engine)
+
+    translate_english_to_many_stream を最後まで読み切るラッパー。
+    on_progress(done, total, lang, item_index) はタスク完了ごとに呼ばれる。
+    engine_mode / language_weights は translate_english_to_many_stream を参照。
+    """
+    results = {lang: [None] * len(menu_items) for lang in target_languages.keys()}
+    async for event in translate_english_to_many_stream(
+        menu_items, target_languages, api_key, persona,
+        max_concurrency=max_concurrency, engine_mode=engine_mode, batch_token_budget=batch_token_budget,
+        language_weights=language_weights,
+    ):
+        results[event.lang][event.item_index] = event.result
+        if on_progress:
+            on_progress(event.done, event.total, event.lang, event.item_index)
+    return results
@@ -0,0 +1,101 @@
+import json
+import os
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Set
+
+from .languages import canonical_language
+from .models import TRANSLATION_PENDING
+
+# --------------------------------------------------------------------
+# Language Priority (per-store language weights)
+# --------------------------------------------------------------------
+# 14言語は等しく重要ではない。来店客の大半は英語・中国語・韓国語・台湾 (繁体字) なので、
+# 重みの大きい言語の (item × 言語) タスクを先にキューへ積み、その言語を先に全件仕上げる。
+# 1言語の全件が揃った時点で TranslationEvent.lang_done が立ち、その言語は公開できる
+# (残りの言語を待たずにストアフロントへ出せる)。
+# 重みは DEFAULT_LANGUAGE_WEIGHTS → 環境変数 LANGUAGE_WEIGHTS (JSON) → 店舗ごとの設定 の順に上書きする。
+# 重みは英語名で持ち、main.py の日本語名 ("韓国語") でも language_weight() で引ける (languages.canonical_language)。
+
+DEFAULT_WEIGHT = 1.0
+
+DEFAULT_LANGUAGE_WEIGHTS: Dict[str, float] = {
+    "English": 10.0,
+    "Chinese": 8.0,
+    "Korean": 8.0,
+    "Taiwanese": 7.0,
+}
+
+
+def _load_env_weights() -> Dict[str, float]:
+    """LANGUAGE_WEIGHTS='{"Thai": 5}' で全店舗の既定を上書きする"""
+    raw = os.getenv("LANGUAGE_WEIGHTS")
+    if not raw:
+        return {}
+    try:
+        return parse_weights(json.loads(raw))
+    except (ValueError, AttributeError, TypeError) as e:
+        print(f"[LanguagePriority] Ignoring invalid LANGUAGE_WEIGHTS: {e}")
+        return {}
+
+
+def parse_weights(raw: Optional[Mapping[str, object]]) -> Dict[str, float]:
+    """{言語: 重み} (stores.language_weights の JSON など) を float に揃える。数値にならない値は捨てる"""
+    weights = {}
+    for lang, weight in (raw or {}).items():
+        try:
+            weights[str(lang)] = float(weight)
+        except (TypeError, ValueError):
+            continue
+    return weights
+
+
+ENV_LANGUAGE_WEIGHTS = _load_env_weights()
+
+
+def language_weights(store_weights: Optional[Mapping[str, object]] = None) -> Dict[str, float]:
+    """既定 + 環境変数 + 店舗ごとの重みを合わせた {言語: 重み}"""
+    return {**DEFAULT_LANGUAGE_WEIGHTS, **ENV_LANGUAGE_WEIGHTS, **parse_weights(store_weights)}
+
+
+def language_weight(weights: Mapping[str, float], lang: str) -> float:
+    """lang の重み。その名前で無ければ英語名で引き、どちらも無ければ DEFAULT_WEIGHT"""
+    if lang in weights:
+        return weights[lang]
+    return weights.get(canonical_language(lang), DEFAULT_WEIGHT)
+
+
+def prioritize_languages(langs: Iterable[str], weights: Optional[Mapping[str, float]] = None) -> List[str]:
+    """
+    重みの大きい順に並べた言語のリスト。同じ重みなら元の順を保つ。
+    weights を省略したら language_weights() (既定 + 環境変数) を使う。
+    """
+    weights = language_weights() if weights is None else weights
+    return sorted(langs, key=lambda lang: -language_weight(weights, lang))
+
+
+def priority_tiers(langs: Iterable[str], weights: Optional[Mapping[str, float]] = None) -> List[List[str]]:
+    """
+    [既定 (DEFAULT_WEIGHT) より重い言語, 残りの言語] (それぞれ prioritize_languages の順)。
+    どちらかが空なら1段だけ返す。
+    """
+    weights = language_weights() if weights is None else weights
+    ordered = prioritize_languages(langs, weights)
+    first = [lang for lang in ordered if language_weight(weights, lang) > DEFAULT_WEIGHT]
+    rest = [lang for lang in ordered if lang not in first]
+    return [first, rest] if first and rest else [ordered]
+
+
+def publishable_languages(results: Mapping[str, Sequence[Optional[object]]]) -> List[str]:
+    """
+    全件が揃い、エラーも翻訳待ち (TRANSLATION_PENDING) も1件も無い言語 (= 公開してよい言語)。
+    results は {言語: [MenuItem or None]}。
+    """
+    return [
+        lang for lang, items in results.items()
+        if items and all(item is not None and getattr(item, "status", "") not in ("error", TRANSLATION_PENDING) for item in items)
+    ]
+
+
+def remaining_by_language(langs: Iterable[str], n_items: int, skip: Optional[Set] = None) -> Dict[str, int]:
+    """言語ごとにまだイベントを出していない位置の数 (skip は実行済みの (lang, item_index))"""
+    skip = skip or set()
+    return {lang: sum(1 for pos in range(n_items) if (lang, pos) not in skip) for lang in langs}
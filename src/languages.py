@@ -0,0 +1,33 @@
+from typing import Dict
+
+# --------------------------------------------------------------------
+# Language Names
+# --------------------------------------------------------------------
+# main.py は日本語名 ("韓国語")、Admin・ペルソナ・QC ルールは英語名 ("Korean") を使う。
+# 言語ごとの表はすべて英語名で持ち、引くときに canonical_language() を通す
+# (日本語名のまま引くと既定値 = ラテン文字扱いに落ちる)。
+
+LANGUAGE_ALIASES: Dict[str, str] = {
+    "日本語": "Japanese",
+    "英語": "English",
+    "韓国語": "Korean",
+    "中国語": "Chinese",
+    "台湾語": "Taiwanese",
+    "広東語": "Cantonese",
+    "香港": "HongKong",
+    "タイ語": "Thai",
+    "フィリピン語": "Filipino",
+    "ベトナム語": "Vietnamese",
+    "インドネシア語": "Indonesian",
+    "スペイン語": "Spanish",
+    "ドイツ語": "German",
+    "フランス語": "French",
+    "イタリア語": "Italian",
+    "ポルトガル語": "Portuguese",
+}
+
+
+def canonical_language(lang: str) -> str:
+    """言語名を英語名に揃える ("韓国語" -> "Korean")。未登録の名前はそのまま返す"""
+    lang = str(lang).strip()
+    return LANGUAGE_ALIASES.get(lang, lang)
@@ -0,0 +1,279 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from threading import Lock
+from typing import Any, Optional
+
+from langchain_core.messages import AIMessage
+
+# --------------------------------------------------------------------
+# Configuration
+# --------------------------------------------------------------------
+CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(".cache", "llm_cache.sqlite"))
+CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "50000"))
+CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+
+
+def _canonicalize(value: Any) -> Any:
+    """プロンプト入力をハッシュ用の安定した形に変換する (PromptValue / Message / list / str)"""
+    if isinstance(value, str):
+        # 行末空白・インデント差分はキャッシュキーに影響させない
+        return "\n".join(line.strip() for line in value.strip().splitlines())
+    if isinstance(value, (list, tuple)):
+        return [_canonicalize(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _canonicalize(v) for k, v in sorted(value.items())}
+    if hasattr(value, "to_string"):
+        return _canonicalize(value.to_string())
+    if hasattr(value, "content"):
+        return {"type": getattr(value, "type", "message"), "content": _canonicalize(value.content)}
+    return str(value)
+
+
+def make_cache_key(model: str, temperature: float, prompt_version: str, inputs: Any) -> str:
+    payload = json.dumps(
+        {
+            "model": model,
+            "temperature": temperature,
+            "prompt_version": prompt_version,
+            "inputs": _canonicalize(inputs),
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    コンテンツアドレス型の LLM レスポンスキャッシュ (SQLite 永続化)
+
+    - キー: make_cache_key() のハッシュ (model / temperature / prompt_version / 正規化入力)
+    - 追い出し: TTL 切れ → LRU (最終アクセスが古い順) で max_entries / max_bytes 以内に収める
+    - 統計: hits / misses / writes / evictions (プロセス内カウンタ)
+    """
+
+    def __init__(
+        self,
+        path: str = CACHE_PATH,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        max_bytes: int = CACHE_MAX_BYTES,
+        ttl_seconds: int = CACHE_TTL_SECONDS,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = Lock()
+        self._counters = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        # 複数プロセス (bulk_translate.py のワーカー) で同じファイルを共有するので、書き込みが重なったら待つ
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30.0)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                usage TEXT,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, usage, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row and self.ttl_seconds and now - row[2] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self._counters["evictions"] += 1
+                row = None
+            if not row:
+                self._counters["misses"] += 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self._counters["hits"] += 1
+            return {"content": row[0], "usage": json.loads(row[1]) if row[1] else {}}
+
+    def contains(self, key: str) -> bool:
+        """統計・最終アクセス時刻を変えずに有効なエントリがあるかだけを見る (見積もり用)"""
+        with self._lock:
+            row = self._conn.execute("SELECT created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        return bool(row) and not (self.ttl_seconds and time.time() - row[0] > self.ttl_seconds)
+
+    def set(self, key: str, content: str, usage: Optional[dict] = None):
+        now = time.time()
+        size = len(content.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, content, usage, size, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, content, json.dumps(usage or {}), size, now, now),
+            )
+            self._counters["writes"] += 1
+            self._evict(now)
+            self._conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        """ロック取得済みで呼ぶこと"""
+        if self.ttl_seconds:
+            cur = self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            self._counters["evictions"] += max(cur.rowcount, 0)
+
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM llm_cache ORDER BY last_access ASC"
+        ).fetchall():
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            count -= 1
+            total -= size
+            self._counters["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+            counters = dict(self._counters)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            **counters,
+            "entries": count,
+            "bytes": total,
+            "hit_rate": counters["hits"] / lookups if lookups else 0.0,
+        }
+
+
+_default_cache: Optional[LLMResponseCache] = None
+_default_cache_lock = Lock()
+
+
+def get_default_cache() -> LLMResponseCache:
+    """プロセス共有のキャッシュインスタンス"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = LLMResponseCache()
+        return _default_cache
+
+
+def is_cache_hit(response: Any) -> bool:
+    metadata = getattr(response, "response_metadata", None) or {}
+    return bool(metadata.get("cache_hit"))
+
+
+class CachedChatModel:
+    """
+    チャットモデルのラッパー。invoke / ainvoke をキャッシュ経由にする。
+
+    ヒット時は response_metadata["cache_hit"] = True の AIMessage を返し、usage_metadata は付けない
+    (= コストログに載らない)。パースに失敗した出力は invalidate() で消すこと。
+    store_on_call=False なら呼び出し時には保存せず、呼び出し側が QC 合格後に store() したものだけを残す
+    (QC 前・QC 不合格・監査できなかった出力をヒットさせない)。
+    それ以外の属性 (model, temperature など) は元のモデルに委譲する。
+    """
+
+    def __init__(self, llm: Any, prompt_version: str, cache: Optional[LLMResponseCache] = None, store_on_call: bool = True):
+        self._llm = llm
+        self._prompt_version = prompt_version
+        self._cache = cache or get_default_cache()
+        self._store_on_call = store_on_call
+
+    def __getattr__(self, name):
+        return getattr(self._llm, name)
+
+    def cache_key(self, inputs: Any) -> str:
+        return make_cache_key(
+            getattr(self._llm, "model", ""),
+            getattr(self._llm, "temperature", None),
+            self._prompt_version,
+            inputs,
+        )
+
+    def _lookup(self, key: str) -> Optional[AIMessage]:
+        hit = self._cache.get(key)
+        if hit is None:
+            return None
+        return AIMessage(content=hit["content"], response_metadata={"cache_hit": True, "cached_usage": hit["usage"]})
+
+    def _store(self, key: str, response: Any):
+        content = getattr(response, "content", None)
+        if isinstance(content, str) and content and not is_cache_hit(response):
+            usage = getattr(response, "usage_metadata", None) or {}
+            self._cache.set(key, content, dict(usage))
+
+    def store(self, inputs: Any, response: Any):
+        """QC に合格した出力を保存する (store_on_call=False のとき)"""
+        self._store(self.cache_key(inputs), response)
+
+    def invoke(self, inputs: Any, *args, **kwargs):
+        key = self.cache_key(inputs)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+        response = self._llm.invoke(inputs, *args, **kwargs)
+        if self._store_on_call:
+            self._store(key, response)
+        return response
+
+    async def ainvoke(self, inputs: Any, *args, **kwargs):
+        key = self.cache_key(inputs)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+        response = await self._llm.ainvoke(inputs, *args, **kwargs)
+        if self._store_on_call:
+            self._store(key, response)
+        return response
+
+    def invalidate(self, inputs: Any):
+        """QC不合格やパース失敗した出力を次回以降ヒットさせないよう削除する"""
+        self._cache.delete(self.cache_key(inputs))
+
+
+def with_cache(llm: Any, prompt_version: str, store_on_call: bool = True) -> Any:
+    """LLM_CACHE_ENABLED=1 (デフォルト) ならキャッシュ付きラッパーを返す"""
+    if not CACHE_ENABLED:
+        return llm
+    return CachedChatModel(llm, prompt_version, store_on_call=store_on_call)
+
+
+def invalidate_cached(llm: Any, inputs: Any):
+    """キャッシュ無効時 (素のモデル) でも安全に呼べる invalidate"""
+    invalidate = getattr(llm, "invalidate", None)
+    if invalidate:
+        invalidate(inputs)
+
+
+def commit_cached(llm: Any, inputs: Any, response: Any):
+    """キャッシュ無効時 (素のモデル) でも安全に呼べる store (QC 合格後に呼ぶ)"""
+    if isinstance(llm, CachedChatModel):
+        llm.store(inputs, response)
@@ -0,0 +1,224 @@
+import json
+import re
+from threading import Lock
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+# --------------------------------------------------------------------
+# LLM JSON Extraction & Repair
+# --------------------------------------------------------------------
+# LLM の応答から JSON を取り出す共通処理。
+#   1. ```json フェンス・前置きの説明文・末尾の説明文を落とす
+#   2. そのまま json.loads (速い経路)
+#   3. 失敗したら寛容に修復して読み直す:
+#      - 末尾カンマ ({"a": 1,} / [1, 2,])
+#      - 文字列中のエスケープされていない " と改行・タブ
+#      - 途中で切れた出力 (max_tokens 切れ) は最後に完結した要素で配列・オブジェクトを閉じる
+# 修復で読めた1件 = 作り直さずに済んだ LLM 呼び出し1回として数える。
+
+T = TypeVar("T", bound=BaseModel)
+
+_FENCE_PATTERN = re.compile(r"```[ \t]*(?:json|JSON)?[ \t]*\n?(.*?)(?:```|$)", re.S)
+_WHITESPACE = " \t\r\n"
+_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+_stats_lock = Lock()
+_stats = {"parsed": 0, "repaired": 0, "failed": 0, "coerced": 0, "dropped": 0}
+_repair_kinds: Dict[str, int] = {}
+
+
+class LLMJSONError(json.JSONDecodeError):
+    """修復しても JSON として読めなかった (rate_limiter.classify_error では parse に分類される)"""
+
+    def __init__(self, message: str, text: str, pos: int = 0):
+        super().__init__(f"Could not parse JSON from LLM output: {message}", text, pos)
+
+
+def strip_fences(text: str) -> str:
+    """```json ... ``` の中身を返す (閉じフェンスが無い = 途中で切れた場合は末尾まで)。フェンスが無ければそのまま"""
+    match = _FENCE_PATTERN.search(text)
+    return (match.group(1) if match else text).strip()
+
+
+def _json_start(text: str) -> int:
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    return min(starts) if starts else -1
+
+
+def _next_char(text: str, i: int) -> str:
+    while i < len(text) and text[i] in _WHITESPACE:
+        i += 1
+    return text[i] if i < len(text) else ""
+
+
+def _repair(text: str) -> Tuple[Optional[str], List[str]]:
+    """
+    1回の走査で修復した JSON 文字列と、行った修復の種類を返す (修復できなければ None)。
+    文字列の " は直後 (空白を除く) が , : } ] か終端のときだけ閉じ引用符とみなす。
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    # 切れていた場合に戻る位置: (out の長さ, その時点の stack)
+    checkpoints: List[Tuple[int, Tuple[str, ...]]] = []
+    repairs: List[str] = []
+    in_string = escaped = False
+
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+                out.append(ch)
+            elif ch == "\\":
+                escaped = True
+                out.append(ch)
+            elif ch == '"':
+                if _next_char(text, i + 1) in ("", ",", ":", "}", "]"):
+                    in_string = False
+                    out.append(ch)
+                else:
+                    out.append('\\"')
+                    repairs.append("unescaped_quote")
+            elif ch in _CONTROL_ESCAPES:
+                out.append(_CONTROL_ESCAPES[ch])
+                repairs.append("control_char")
+            else:
+                out.append(ch)
+        elif ch == '"':
+            in_string = True
+            out.append(ch)
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            out.append(ch)
+            checkpoints.append((len(out), tuple(stack)))
+        elif ch in "}]":
+            if stack:
+                out.append(stack.pop())
+            if not stack:
+                if text[i + 1:].strip():
+                    repairs.append("trailing_text")
+                break
+            checkpoints.append((len(out), tuple(stack)))
+        elif ch == ",":
+            if _next_char(text, i + 1) in ("", "}", "]"):
+                repairs.append("trailing_comma")
+            else:
+                checkpoints.append((len(out), tuple(stack)))
+                out.append(ch)
+        else:
+            out.append(ch)
+        i += 1
+
+    if stack:
+        # 途中で切れている: 一番内側の開いた配列の要素境界 (無ければ最後の要素境界) まで戻して閉じる
+        arrays = [depth + 1 for depth, closer in enumerate(stack) if closer == "]"]
+        limit = arrays[-1] if arrays else len(stack)
+        cut = next((cp for cp in reversed(checkpoints) if len(cp[1]) <= limit), None)
+        if cut is None:
+            return None, repairs
+        pos, open_stack = cut
+        repaired = "".join(out[:pos]).rstrip().rstrip(",")
+        repairs.append("truncated")
+        return repaired + "".join(reversed(open_stack)), repairs
+    return "".join(out), repairs
+
+
+def _count(key: str, n: int = 1, kinds: Sequence[str] = ()):
+    with _stats_lock:
+        _stats[key] += n
+        for kind in set(kinds):
+            _repair_kinds[kind] = _repair_kinds.get(kind, 0) + 1
+
+
+def parse_json(text: str) -> Any:
+    """
+    LLM の応答から JSON (dict / list) を取り出す。読めなければ LLMJSONError。
+    """
+    if not isinstance(text, str):
+        raise LLMJSONError(f"expected str, got {type(text).__name__}", "")
+    body = strip_fences(text)
+    try:
+        data = json.loads(body)
+        _count("parsed")
+        return data
+    except ValueError:
+        pass
+
+    start = _json_start(body)
+    if start < 0:
+        _count("failed")
+        raise LLMJSONError("no JSON object or array found", body)
+    repaired, kinds = _repair(body[start:])
+    if repaired is not None:
+        try:
+            data = json.loads(repaired)
+        except ValueError:
+            data = None
+        else:
+            # 前置きの説明文を落としただけ / 修復なしで読めた場合も修復扱い (素の json.loads では読めなかった)
+            _count("repaired", kinds=kinds or ["leading_text"])
+            return data
+    _count("failed")
+    raise LLMJSONError("repair failed" + (f" ({', '.join(sorted(set(kinds)))})" if kinds else ""), body)
+
+
+def parse_fields(text: str, required: Sequence[str]) -> dict:
+    """JSON オブジェクトを取り出し、required のキーが揃っているか確かめて返す"""
+    data = parse_json(text)
+    if not isinstance(data, dict):
+        raise LLMJSONError(f"expected a JSON object, got {type(data).__name__}", text)
+    missing = [key for key in required if key not in data]
+    if missing:
+        raise LLMJSONError(f"missing keys {missing}", text)
+    return data
+
+
+def coerce(data: Any, model: Type[T]) -> T:
+    """dict を pydantic モデルに変換する (型は pydantic の lax モードで寄せる)。失敗は LLMJSONError"""
+    try:
+        result = model.model_validate(data)
+    except ValidationError as e:
+        raise LLMJSONError(f"{model.__name__}: {e.error_count()} invalid field(s)", json.dumps(data, ensure_ascii=False, default=str)) from e
+    _count("coerced")
+    return result
+
+
+def coerce_list(items: Any, model: Type[T]) -> List[T]:
+    """list の各要素を model に変換する。変換できない要素だけ捨てる (捨てた数は dropped に数える)"""
+    if isinstance(items, dict):
+        items = [items]
+    results: List[T] = []
+    dropped = 0
+    for item in items or []:
+        try:
+            results.append(model.model_validate(item))
+        except ValidationError:
+            dropped += 1
+    if results:
+        _count("coerced", len(results))
+    if dropped:
+        _count("dropped", dropped)
+    return results
+
+
+def get_json_stats() -> dict:
+    """
+    {parsed, repaired, failed, coerced, dropped, repairs: {種類: 件数}, calls_saved}
+    calls_saved は修復で読めた応答の数 (= 再生成せずに済んだ LLM 呼び出し)。
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+        stats["repairs"] = dict(_repair_kinds)
+    stats["calls_saved"] = stats["repaired"]
+    total = stats["parsed"] + stats["repaired"] + stats["failed"]
+    stats["repair_rate"] = stats["repaired"] / total if total else 0.0
+    return stats
+
+
+def reset_json_stats():
+    with _stats_lock:
+        for key in _stats:
+            _stats[key] = 0
+        _repair_kinds.clear()
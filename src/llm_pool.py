@@ -0,0 +1,181 @@
+import asyncio
+import atexit
+import hashlib
+import os
+import time
+import weakref
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Optional, Tuple
+
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+from .rate_limiter import GEMINI_CALL_TIMEOUT
+
+# --------------------------------------------------------------------
+# Configuration
+# --------------------------------------------------------------------
+POOL_MAX_CLIENTS = int(os.getenv("LLM_POOL_MAX_CLIENTS", "32"))
+POOL_IDLE_SECONDS = int(os.getenv("LLM_POOL_IDLE_SECONDS", "1800"))
+# "fake" にすると API を呼ばない FakeChatModel を返す (ベンチマーク・オフライン動作確認用)
+FAKE_PROVIDER = "fake"
+
+# (api_key のハッシュ, model, temperature, max_tokens, イベントループ id)
+PoolKey = Tuple[str, str, float, Optional[int], Optional[int]]
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _close_client(llm: Any):
+    """同期側の HTTP トランスポートを閉じる (非同期側は所有ループが無ければ閉じられないので GC に任せる)"""
+    client = getattr(llm, "client", None)
+    close = getattr(client, "close", None)
+    if close:
+        try:
+            close()
+        except Exception as e:
+            print(f"[LLMPool] close failed: {e}")
+
+
+class _Entry:
+    __slots__ = ("llm", "loop_ref", "last_used")
+
+    def __init__(self, llm: Any, loop: Optional[asyncio.AbstractEventLoop]):
+        self.llm = llm
+        self.loop_ref = weakref.ref(loop) if loop is not None else None
+        self.last_used = time.monotonic()
+
+    def is_stale(self, now: float, idle_seconds: int) -> bool:
+        if idle_seconds and now - self.last_used > idle_seconds:
+            return True
+        if self.loop_ref is not None:
+            loop = self.loop_ref()
+            return loop is None or loop.is_closed()
+        return False
+
+
+class ClientPool:
+    """
+    プロセス共有のチャットモデル (ChatGoogleGenerativeAI) プール
+
+    - キー: (api_key, model, temperature, max_tokens) + 非同期呼び出し元のイベントループ
+      クライアントは内部に keep-alive の HTTP コネクションプールを持つので、
+      インスタンスを使い回せば接続確立 (TLS ハンドシェイク) とモデル初期化を省ける。
+    - 非同期トランスポートは最初に使ったイベントループに紐づくため、ループ内から取得した場合は
+      ループごとに別インスタンスにする。ループが閉じたらそのエントリは破棄する。
+    - 追い出し: アイドル時間切れ / 終了済みループ / max_clients 超過 (LRU)
+    - 統計: created / reused / evicted
+    """
+
+    def __init__(self, max_clients: int = POOL_MAX_CLIENTS, idle_seconds: int = POOL_IDLE_SECONDS):
+        self.max_clients = max_clients
+        self.idle_seconds = idle_seconds
+        self._entries: "OrderedDict[PoolKey, _Entry]" = OrderedDict()
+        self._lock = Lock()
+        self._stats = {"created": 0, "reused": 0, "evicted": 0}
+
+    def get(
+        self,
+        api_key: str,
+        model: str,
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None,
+    ) -> ChatGoogleGenerativeAI:
+        loop = _running_loop()
+        key: PoolKey = (
+            hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16],
+            model,
+            float(temperature),
+            max_tokens,
+            id(loop) if loop is not None else None,
+        )
+        now = time.monotonic()
+        with self._lock:
+            stale = self._sweep(now)
+            entry = self._entries.get(key)
+            if entry is not None and not entry.is_stale(now, self.idle_seconds):
+                entry.last_used = now
+                self._entries.move_to_end(key)
+                self._stats["reused"] += 1
+                llm = entry.llm
+            else:
+                llm = None
+        for old in stale:
+            _close_client(old)
+        if llm is not None:
+            return llm
+
+        kwargs = {"model": model, "google_api_key": api_key, "temperature": temperature}
+        if GEMINI_CALL_TIMEOUT:
+            # 同期 invoke の期限 (ainvoke は RateLimitedChatModel 側でも期限を付ける)
+            kwargs["timeout"] = GEMINI_CALL_TIMEOUT
+        if max_tokens is not None:
+            kwargs["max_output_tokens"] = max_tokens
+        if os.getenv("LLM_PROVIDER", "gemini") == FAKE_PROVIDER:
+            from .fake_llm import FakeChatModel
+
+            llm = FakeChatModel(**kwargs)
+        else:
+            llm = ChatGoogleGenerativeAI(**kwargs)
+
+        with self._lock:
+            self._entries[key] = _Entry(llm, loop)
+            self._entries.move_to_end(key)
+            self._stats["created"] += 1
+            evicted = []
+            while len(self._entries) > self.max_clients:
+                _, old = self._entries.popitem(last=False)
+                evicted.append(old.llm)
+                self._stats["evicted"] += 1
+        for old in evicted:
+            _close_client(old)
+        return llm
+
+    def _sweep(self, now: float) -> list:
+        """ロック取得済みで呼ぶこと。期限切れエントリを外して、閉じるべきクライアントを返す"""
+        stale_keys = [k for k, e in self._entries.items() if e.is_stale(now, self.idle_seconds)]
+        stale = [self._entries.pop(k).llm for k in stale_keys]
+        self._stats["evicted"] += len(stale)
+        return stale
+
+    def close_all(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            _close_client(entry.llm)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["active"] = len(self._entries)
+        lookups = stats["created"] + stats["reused"]
+        stats["reuse_ratio"] = stats["reused"] / lookups if lookups else 0.0
+        return stats
+
+
+_default_pool = ClientPool()
+atexit.register(_default_pool.close_all)
+
+
+def get_chat_model(
+    api_key: str,
+    model: str,
+    temperature: float = 0.0,
+    max_tokens: Optional[int] = None,
+) -> ChatGoogleGenerativeAI:
+    """プール済みの ChatGoogleGenerativeAI を返す (無ければ作成)"""
+    return _default_pool.get(api_key, model, temperature, max_tokens)
+
+
+def get_pool_stats() -> dict:
+    return _default_pool.stats()
+
+
+def close_pool():
+    _default_pool.close_all()
@@ -0,0 +1,292 @@
+import csv
+import json
+import os
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .languages import canonical_language
+
+# --------------------------------------------------------------------
+# Global Menu Dictionary
+# --------------------------------------------------------------------
+# 定番メニュー (生ビール・枝豆・唐揚げ…) は店ごとに LLM で訳し直さず辞書から引く。
+# 表記ゆれ (全角/半角・ひらがな/カタカナ・【】★ などの装飾・「特製」などの冠) は
+# canonicalize_name で吸収する。辞書の訳をそのまま採用するのは正規化後の日本語キー (name_ja・aliases) と
+# 完全一致した場合だけ。文字 bigram の Dice 係数によるあいまい検索 (search) は候補の提示用で、
+# 「黒生ビール」→「生ビール」のような別メニューを確定させないよう lookup では使わない。
+
+# --------------------------------------------------------------------
+# Configuration
+# --------------------------------------------------------------------
+DICTIONARY_ENABLED = os.getenv("MENU_DICT_ENABLED", "1") == "1"
+DICTIONARY_PATH = os.getenv("MENU_DICTIONARY_PATH", os.path.join("resources", "menu_dictionary.csv"))
+# search() の候補に出す最低スコア
+MIN_FUZZY_SCORE = float(os.getenv("MENU_DICT_MIN_SCORE", "0.5"))
+
+# 言語名 (英語名。日本語名は languages.canonical_language で揃える) → 辞書エントリのフィールド接尾辞
+LANGUAGE_CODES = {
+    "Japanese": "ja",
+    "English": "en",
+    "Korean": "ko",
+    "Chinese": "zh",
+    "Taiwanese": "zh_tw",
+    "Cantonese": "yue",
+    "Thai": "th",
+    "Filipino": "tl",
+    "Vietnamese": "vi",
+    "Indonesian": "id",
+    "Spanish": "es",
+    "German": "de",
+    "French": "fr",
+    "Italian": "it",
+    "Portuguese": "pt",
+}
+
+# 先頭に付く宣伝文句 (取り除いた残りが空になる場合は残す)
+DECORATION_PREFIXES = (
+    "店長おすすめ", "店長のおすすめ", "当店自慢の", "当店自慢", "当店人気", "本日の", "今月の",
+    "期間限定", "数量限定", "季節限定", "特製", "自家製", "名物", "人気", "おすすめ", "極上", "絶品",
+)
+
+# 括弧ごと取り除く注記 (【期間限定】・(2人前)・「特製」など)。NFKC 後なので全角 () [] は半角になっている
+_BRACKETED = re.compile(r"【[^】]*】|「[^」]*」|『[^』]*』|〔[^〕]*〕|《[^》]*》|〈[^〉]*〉|\([^)]*\)|\[[^\]]*\]|<[^>]*>")
+_BRACKET_CHARS = re.compile(r"[【】「」『』〔〕《》〈〉()\[\]<>]")
+_DECORATION_CHARS = re.compile(r"[★☆◎○●◇◆□■△▲▽▼※♪♫♬♡♥✿❀!?~〜・…*#+\-=_/|:;,.、。\s]")
+# カタカナ (ァ-ヶ) → ひらがな (ぁ-ゖ)
+_KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(0x30A1, 0x30F7)}
+
+
+def canonicalize_name(name: str) -> str:
+    """
+    メニュー名を辞書引き用のキーに正規化する。
+        NFKC (全角英数・半角カナの畳み込み) → 括弧つき注記・装飾記号・空白の除去
+        → 先頭の宣伝文句の除去 → 小文字化 → カタカナをひらがなに畳み込み
+    例: "【期間限定】特製 カラアゲ(5個)★" → "からあげ"
+    """
+    text = unicodedata.normalize("NFKC", name or "")
+    stripped = _BRACKETED.sub("", text)
+    # 名前全体が括弧で囲まれている場合 (「唐揚げ」) は中身を残す
+    text = stripped if _DECORATION_CHARS.sub("", stripped) else _BRACKET_CHARS.sub("", text)
+    text = _DECORATION_CHARS.sub("", text)
+    changed = True
+    while changed:
+        changed = False
+        for prefix in DECORATION_PREFIXES:
+            if text.startswith(prefix) and len(text) > len(prefix):
+                text = text[len(prefix):]
+                changed = True
+    return text.lower().translate(_KATAKANA_TO_HIRAGANA)
+
+
+def _ngrams(key: str) -> set:
+    if len(key) < 2:
+        return {key} if key else set()
+    return {key[i:i + 2] for i in range(len(key) - 1)}
+
+
+def language_code(lang: str) -> str:
+    lang = canonical_language(lang)
+    return LANGUAGE_CODES.get(lang, lang.lower())
+
+
+def entry_translation(entry: dict, lang: str) -> Optional[Tuple[str, str, str]]:
+    """
+    エントリから lang の (名前, 説明, ペアリング) を返す。名前と説明が揃っていなければ None。
+    フィールド名は {code} / description_{code} / pairing_{code} (日本語は name_ja / description_ja)。
+    """
+    code = language_code(lang)
+    name = entry.get("name_ja") if code == "ja" else entry.get(code)
+    description = entry.get(f"description_{code}")
+    if not name or not description:
+        return None
+    return name, description, entry.get(f"pairing_{code}", "")
+
+
+@dataclass(frozen=True)
+class DictionaryMatch:
+    entry: dict
+    score: float
+    matched_key: str
+
+    @property
+    def exact(self) -> bool:
+        return self.score >= 1.0
+
+
+class MenuDictionary:
+    """
+    正規化キーの完全一致インデックス + 文字 bigram の転置インデックス
+
+    エントリは {"name_ja": ..., "en": ..., "description_en": ..., "aliases": [...]} 形式の dict。
+    キーにするのは日本語名 (name_ja・aliases) だけ。英語名 (en) は訳であって照合キーではないので登録しない
+    ("Fried Chicken" が唐揚げの訳で確定してしまうため)。
+    """
+
+    def __init__(self, entries: Iterable[dict] = ()):
+        self._entries: List[dict] = []
+        self._exact: Dict[str, int] = {}
+        self._keys: List[Tuple[str, int]] = []  # (正規化キー, エントリ番号)
+        self._grams: Dict[str, List[int]] = {}  # bigram → _keys の番号
+        self._lock = Lock()
+        self._stats = {"lookups": 0, "hits": 0, "misses": 0}
+        self.add_many(entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, entry: dict):
+        if not entry.get("name_ja"):
+            raise ValueError(f"Dictionary entry without name_ja: {entry}")
+        entry_id = len(self._entries)
+        self._entries.append(entry)
+        # 1 文字の別名 ("生" など) は別メニューの略記とも一致してしまうのでキーにしない
+        aliases = [a for a in entry.get("aliases") or [] if len(canonicalize_name(a)) >= 2]
+        for name in [entry["name_ja"]] + aliases:
+            key = canonicalize_name(name)
+            if not key or key in self._exact:
+                continue
+            self._exact[key] = entry_id
+            key_id = len(self._keys)
+            self._keys.append((key, entry_id))
+            for gram in _ngrams(key):
+                self._grams.setdefault(gram, []).append(key_id)
+
+    def add_many(self, entries: Iterable[dict]):
+        for entry in entries:
+            self.add(entry)
+
+    def search(self, name: str, limit: int = 5, min_score: float = MIN_FUZZY_SCORE) -> List[DictionaryMatch]:
+        """
+        スコア (bigram の Dice 係数、完全一致は 1.0) の高い順に候補を返す。エントリごとに最良キーのみ。
+        あいまい一致は別メニューのこともあるので、訳の確定には使わず候補の提示 (辞書の整備など) に使う
+        """
+        key = canonicalize_name(name)
+        if not key:
+            return []
+        entry_id = self._exact.get(key)
+        if entry_id is not None:
+            return [DictionaryMatch(self._entries[entry_id], 1.0, key)]
+
+        query = _ngrams(key)
+        overlap = Counter(key_id for gram in query for key_id in self._grams.get(gram, ()))
+        best: Dict[int, DictionaryMatch] = {}
+        for key_id, shared in overlap.items():
+            cand_key, cand_entry = self._keys[key_id]
+            score = 2.0 * shared / (len(query) + len(_ngrams(cand_key)))
+            if score >= min_score and (cand_entry not in best or score > best[cand_entry].score):
+                best[cand_entry] = DictionaryMatch(self._entries[cand_entry], score, cand_key)
+        return sorted(best.values(), key=lambda m: m.score, reverse=True)[:limit]
+
+    def lookup(self, name: str, record: bool = True) -> Optional[DictionaryMatch]:
+        """
+        正規化した日本語名がキーと完全一致するエントリ (無ければ None)。
+        record=True なら統計に計上する (見積もりでは False)
+        """
+        key = canonicalize_name(name)
+        entry_id = self._exact.get(key) if key else None
+        match = DictionaryMatch(self._entries[entry_id], 1.0, key) if entry_id is not None else None
+        if not record:
+            return match
+        with self._lock:
+            self._stats["lookups"] += 1
+            self._stats["hits" if match else "misses"] += 1
+        return match
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["entries"] = len(self._entries)
+        stats["hit_ratio"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        return stats
+
+    def reset_stats(self):
+        with self._lock:
+            for k in self._stats:
+                self._stats[k] = 0
+
+
+def _normalize_entry(entry: dict) -> dict:
+    aliases = entry.get("aliases") or []
+    if isinstance(aliases, str):
+        aliases = [a for a in aliases.split("|") if a.strip()]
+    return {**{k: v for k, v in entry.items() if v not in (None, "")}, "aliases": aliases}
+
+
+def load_dictionary_file(path: str) -> List[dict]:
+    """
+    辞書ファイルを読み込んでエントリのリストを返す。
+        .json : GLOBAL_MENU_DICT と同じ {name_ja: {...}} 形式、またはエントリの配列
+        .jsonl: 1行1エントリ
+        .csv  : ヘッダ行つき (name_ja, en, description_en, ko, description_ko, ..., aliases)
+                aliases は "|" 区切り
+    """
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        if ext == ".json":
+            data = json.load(f)
+            if isinstance(data, dict):
+                data = [{"name_ja": name, **fields} for name, fields in data.items()]
+        elif ext == ".jsonl":
+            data = [json.loads(line) for line in f if line.strip()]
+        elif ext == ".csv":
+            data = list(csv.DictReader(f))
+        else:
+            raise ValueError(f"Unsupported dictionary format: {path}")
+    return [_normalize_entry(entry) for entry in data if entry.get("name_ja")]
+
+
+_default_dictionary: Optional[MenuDictionary] = None
+_default_lock = Lock()
+
+_skip_lock = Lock()
+_skipped: Dict[str, int] = {}
+
+
+def get_default_dictionary() -> MenuDictionary:
+    """組み込みの GLOBAL_MENU_DICT + MENU_DICTIONARY_PATH (あれば) から作る共有辞書"""
+    global _default_dictionary
+    with _default_lock:
+        if _default_dictionary is None:
+            from .global_menu_data import GLOBAL_MENU_DICT
+
+            dictionary = MenuDictionary(
+                _normalize_entry({"name_ja": name, **fields}) for name, fields in GLOBAL_MENU_DICT.items()
+            )
+            if os.path.exists(DICTIONARY_PATH):
+                try:
+                    dictionary.add_many(load_dictionary_file(DICTIONARY_PATH))
+                except Exception as e:
+                    print(f"[MenuDictionary] Failed to load {DICTIONARY_PATH}: {e}")
+            _default_dictionary = dictionary
+        return _default_dictionary
+
+
+def lookup_menu(name: str, record: bool = True) -> Optional[DictionaryMatch]:
+    """共有辞書を日本語名で引く (完全一致のみ。MENU_DICT_ENABLED=0 なら常に None)"""
+    if not DICTIONARY_ENABLED:
+        return None
+    return get_default_dictionary().lookup(name, record)
+
+
+def record_dictionary_skip(stage: str, tasks: int = 1):
+    """辞書ヒットで LLM 呼び出しを省いたタスク数をステージごとに集計する"""
+    with _skip_lock:
+        _skipped[stage] = _skipped.get(stage, 0) + tasks
+
+
+def get_dictionary_stats() -> dict:
+    """共有辞書の lookup 統計 + skipped ({stage: 省いたタスク数})"""
+    stats = get_default_dictionary().stats()
+    with _skip_lock:
+        stats["skipped"] = dict(_skipped)
+    return stats
+
+
+def reset_dictionary_stats():
+    get_default_dictionary().reset_stats()
+    with _skip_lock:
+        _skipped.clear()
@@ -0,0 +1,107 @@
+import json
+import os
+from threading import Lock
+from typing import Dict, List
+
+# --------------------------------------------------------------------
+# Model Routing (cascade)
+# --------------------------------------------------------------------
+# ステージごとに「試す順のモデル列」を持つ。1回目は速くて安いモデルに投げ、
+# ローカル / LLM QC の不合格や JSON のパース失敗で再試行するときだけ次の (強い) モデルへ上げる。
+# 列の最後より先の再試行は最後のモデルのまま。
+
+# --------------------------------------------------------------------
+# Configuration
+# --------------------------------------------------------------------
+DEFAULT_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+FAST_MODEL = os.getenv("GEMINI_FAST_MODEL", "gemini-2.5-flash-lite")
+STRONG_MODEL = os.getenv("GEMINI_STRONG_MODEL", DEFAULT_MODEL)
+
+DEFAULT_ROUTES: Dict[str, List[str]] = {
+    "cleanup": [DEFAULT_MODEL],
+    "ja_to_en": [DEFAULT_MODEL],
+    "cleanup_en": [DEFAULT_MODEL],
+    "transcreation": [FAST_MODEL, STRONG_MODEL],
+    "qc": [DEFAULT_MODEL],
+    "vision": [FAST_MODEL, STRONG_MODEL],
+}
+
+
+def _load_routes() -> Dict[str, List[str]]:
+    """MODEL_ROUTES='{"transcreation": ["gemini-2.5-flash-lite", "gemini-2.5-pro"]}' でステージ単位に上書きする"""
+    routes = dict(DEFAULT_ROUTES)
+    raw = os.getenv("MODEL_ROUTES")
+    if raw:
+        try:
+            overrides = json.loads(raw)
+            for stage, models in overrides.items():
+                routes[stage] = [models] if isinstance(models, str) else list(models)
+        except (ValueError, AttributeError, TypeError) as e:
+            print(f"[ModelRouting] Ignoring invalid MODEL_ROUTES: {e}")
+    # 同じモデルが続く段は1段にまとめる (FAST_MODEL == STRONG_MODEL の場合など)
+    return {stage: list(dict.fromkeys(models)) or [DEFAULT_MODEL] for stage, models in routes.items()}
+
+
+ROUTES = _load_routes()
+
+_stats_lock = Lock()
+_stats: Dict[str, Dict[str, dict]] = {}
+
+
+def cascade(stage: str) -> List[str]:
+    """stage で試すモデルを順に返す (未設定のステージは DEFAULT_MODEL のみ)"""
+    return list(ROUTES.get(stage, [DEFAULT_MODEL]))
+
+
+def route(stage: str, tier: int = 0) -> str:
+    """tier 回目 (0 始まり) の試行に使うモデル"""
+    models = cascade(stage)
+    return models[min(max(tier, 0), len(models) - 1)]
+
+
+def record_attempt(
+    stage: str,
+    model: str,
+    passed: int,
+    failed: int,
+    tier: int = 0,
+    tokens_in: int = 0,
+    tokens_out: int = 0,
+    cost_jpy: float = 0.0,
+):
+    """
+    1リクエストぶんの結果を集計する。passed / failed は QC・パースを通った / 落ちた item 数
+    (per-item なら 1/0 か 0/1、バッチなら件数)。tier > 0 は上位モデルへの繰り上げ。
+    """
+    with _stats_lock:
+        s = _stats.setdefault(stage, {}).setdefault(model, {
+            "calls": 0, "passed": 0, "failed": 0, "escalated": 0, "tokens_in": 0, "tokens_out": 0, "cost_jpy": 0.0,
+        })
+        s["calls"] += 1
+        s["passed"] += passed
+        s["failed"] += failed
+        if tier > 0:
+            s["escalated"] += passed + failed
+        s["tokens_in"] += tokens_in
+        s["tokens_out"] += tokens_out
+        s["cost_jpy"] += cost_jpy
+
+
+def get_routing_stats() -> Dict[str, Dict[str, dict]]:
+    """
+    {stage: {model: {calls, passed, failed, escalated, tokens_in, tokens_out, cost_jpy, pass_rate, cost_per_pass_jpy}}}
+    pass_rate と cost_per_pass_jpy (合格1件あたりの費用) がカスケードの調整材料。
+    """
+    with _stats_lock:
+        stats = {stage: {model: dict(s) for model, s in models.items()} for stage, models in _stats.items()}
+    for models in stats.values():
+        for s in models.values():
+            judged = s["passed"] + s["failed"]
+            s["pass_rate"] = s["passed"] / judged if judged else 0.0
+            s["cost_per_pass_jpy"] = s["cost_jpy"] / s["passed"] if s["passed"] else 0.0
+    return stats
+
+
+def reset_routing_stats():
+    with _stats_lock:
+        _stats.clear()
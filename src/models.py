@@ -3,6 +3,10 @@ from typing import Dict, List, Optional
 import uuid
 from datetime import datetime
 
+# 翻訳結果の status: 全試行が QC / パースで落ちて原文のまま残ったもの (説明文の先頭に PENDING_PREFIX)。
+# 既定の "pending" (未処理) とは別の値にして、公開・再利用せずジョブの再開で作り直す
+TRANSLATION_PENDING = "translation_pending"
+
 @dataclass
 class MenuItem:
     """
@@ -13,9 +17,13 @@ class MenuItem:
         menu_content (str): 説明文 (JA_18S_TEXT)
         id (str): 一意な識別子 (UUID)
         confidence (float): AI視覚解析(Multimodal)の確信度 (0.0-1.0)
-        status (str): 状態 (pending, confirmed, etc.)
+        status (str): 状態 (pending, confirmed, error, translation_pending (TRANSLATION_PENDING) etc.)
         category (str): カテゴリ (optional)
         price (int): 価格 (optional)
+        source_hash (str): 翻訳元の日本語・ペルソナ・プロンプト版のハッシュ (source_hash.source_hash)。
+            翻訳結果ではその結果を作ったときの値が入り、元の値と違えば作り直しが必要
+        source_title (str): 翻訳元の日本語メニュー名。校正・英訳の結果にも引き継ぎ、
+            menu_title が英語になった後もメニュー辞書 (menu_dictionary) を日本語で引けるようにする
     """
     menu_title: str
     menu_content: str
@@ -26,6 +34,8 @@ class MenuItem:
     price: Optional[int] = None
     pairing: str = ""      # S1-04: Pairing suggestion
     search_tags: str = ""  # S1-04: Context/Tags
+    source_hash: str = ""  # 増分翻訳: 翻訳元のハッシュ
+    source_title: str = ""  # 辞書引き用: 翻訳元の日本語メニュー名
     
     def __str__(self) -> str:
         base = f"【メニュー名】{self.menu_title} (ID:{self.id[:4]}..)\n【説明】{self.menu_content}"
@@ -33,6 +43,11 @@ class MenuItem:
             base += f"\n【ペアリング】{self.pairing}"
         return base
     
+    @property
+    def is_translated(self) -> bool:
+        """エラーでも翻訳待ち (TRANSLATION_PENDING) でもない = 公開・再利用してよい翻訳結果"""
+        return self.status not in ("error", TRANSLATION_PENDING)
+
     @classmethod
     def create_error(cls, error_message: str) -> 'MenuItem':
         return cls(
@@ -83,4 +98,32 @@ class TranslationSet:
         row.extend(self.english.to_csv_row())
         for menu_item in self.translations.values():
             row.extend(menu_item.to_csv_row())
-        return row 
\ No newline at end of file
+        return row 
+
+@dataclass
+class TranslationEvent:
+    """
+    多言語翻訳ストリームの1イベント (1 item × 1 言語の完了)
+
+    Attributes:
+        item_index (int): 入力リスト内の位置
+        item_id (str): 入力 MenuItem の id
+        lang (str): 言語
+        result (MenuItem): 翻訳結果 (失敗時は status="error")
+        timings (Dict[str, float]): queued_sec / run_sec / since_start_sec
+        done (int): このイベントを含む完了済みタスク数
+        total (int): 全タスク数 (item数 × 言語数)
+        stage (str): 結果を出したステージ。パイプライン実行 (translation_pipeline) では
+            校正済み日本語 ("cleanup") / 英訳 ("ja_to_en") のイベントも流れる (done / total には数えない)
+        lang_done (bool): この言語の最後のイベント (以降この言語のイベントは来ない)。
+            エラーが無ければこの時点でその言語を公開できる (language_priority.publishable_languages)
+    """
+    item_index: int
+    item_id: str
+    lang: str
+    result: MenuItem
+    timings: Dict[str, float]
+    done: int
+    total: int
+    stage: str = "transcreation"
+    lang_done: bool = False
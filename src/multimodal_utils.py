@@ -1,14 +1,21 @@
-import os
 import json
 import base64
 from typing import List, Optional
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage
 from langchain_core.output_parsers import JsonOutputParser
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 
-from .observability import log_api_cost
+from .observability import log_api_cost, estimate_cost_jpy, extract_usage
 from .models import MenuItem
+from .llm_cache import with_cache, invalidate_cached, is_cache_hit
+from .llm_pool import get_chat_model
+from .rate_limiter import with_rate_limit
+from .key_pool import get_key_pool, with_key_pool
+from .menu_dictionary import lookup_menu, entry_translation
+from .model_routing import cascade, record_attempt
+from .llm_json import parse_json, coerce_list
+from .structured_output import OutputFormat, use_schema
+from .token_estimator import estimate_tokens
 
 # --------------------------------------------------------------------
 # Configuration
@@ -24,22 +31,61 @@ DEFAULT_MODEL = "gemini-2.0-flash-exp"
 # We default to the latest available Experimental or Pro model.
 DEFAULT_MODEL = "gemini-2.0-flash-exp" 
 
+# Vision 抽出プロンプトの版 (LLMキャッシュのキーに含まれる)
+VISION_PROMPT_VERSION = "vision-1"
+
 class RichMenuItem(BaseModel):
+    # モデルが余分なキーを返しても UI 側に渡す
+    model_config = ConfigDict(extra="allow")
+
     menu_name_jp: str = Field(description="Name of the dish in Japanese")
     price: str = Field(description="Price of the dish (numeric string)")
     category: str = Field(description="Category of the dish (e.g., Appetizer, Main, Drink)")
     description_rich: str = Field(description="A captivating 18-second food report describing the taste, texture, and appeal. MUST be in Japanese.")
 
+    @field_validator("price", mode="before")
+    @classmethod
+    def _price_as_text(cls, value):
+        # 1000 / 1000.0 のように数値で返ってきても文字列にそろえる
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        return "" if value is None else str(value)
+
 class MenuExtractionResult(BaseModel):
     items: List[RichMenuItem] = Field(description="List of extracted menu items")
 
+# 出力形式: 従来は JsonOutputParser の説明 (スキーマ全文) をプロンプトに埋め込む。
+# LLM_STRUCTURED_OUTPUT=1 なら同じスキーマを response_json_schema で渡す (応答はどちらも llm_json で読んで RichMenuItem に寄せる)
+VISION_FORMAT = OutputFormat(
+    "vision",
+    MenuExtractionResult,
+    JsonOutputParser(pydantic_object=MenuExtractionResult).get_format_instructions(),
+    "Return JSON matching the response schema.",
+)
+
 def get_vision_model(api_key: str, model_name: str = DEFAULT_MODEL):
-    return ChatGoogleGenerativeAI(
-        model=model_name,
-        google_api_key=api_key,
-        temperature=0.2, # Slight creativity for description, but grounded
-        max_output_tokens=8192,
-    )
+    # Slight creativity for description, but grounded (pooled: reuses the client's connections)
+    # キーが複数登録されていれば、呼び出しごとに空いているキーへ振り分ける (key_pool)
+    pool = get_key_pool(api_key)
+    if pool is not None:
+        limited = with_key_pool(pool, model_name, temperature=0.2, max_tokens=8192)
+    else:
+        limited = with_rate_limit(get_chat_model(api_key, model_name, temperature=0.2, max_tokens=8192))
+    # 共有レート制御 + 429/5xx リトライ。同じ画像・同じペルソナの再解析はキャッシュから返す
+    return with_cache(limited, VISION_PROMPT_VERSION)
+
+def annotate_with_dictionary(raw_items: List[dict]) -> List[dict]:
+    """
+    抽出した item のうちメニュー辞書に載っているものに英語名・説明を付ける
+    (menu_name_en / description_en / dictionary_score)。付いた item は後段の英訳で LLM を呼ばない。
+    """
+    for item in raw_items:
+        match = lookup_menu(item.get("menu_name_jp", ""))
+        hit = entry_translation(match.entry, "English") if match else None
+        if hit:
+            item["menu_name_en"], item["description_en"], _ = hit
+            item["dictionary_score"] = round(match.score, 3)
+    return raw_items
 
 def parse_menu_image(
     image_bytes: bytes, 
@@ -51,9 +97,7 @@ def parse_menu_image(
     Sends the image directly to Gemini to extract menu items as structured JSON.
     Returns a list of dicts compatible with the Menu Maker UI.
     """
-    model_name = os.getenv("GEMINI_MODEL", DEFAULT_MODEL)
-    llm = get_vision_model(api_key, model_name)
-    parser = JsonOutputParser(pydantic_object=MenuExtractionResult)
+    structured = use_schema()
 
     # Convert bytes to base64 for LangChain
     b64_image = base64.b64encode(image_bytes).decode("utf-8")
@@ -76,7 +120,7 @@ def parse_menu_image(
     5. Handle vertical text and handwritten text naturally.
     
     Format:
-    {parser.get_format_instructions()}
+    {VISION_FORMAT.prompt_text(structured)}
     """
 
     prompt = HumanMessage(
@@ -87,28 +131,55 @@ def parse_menu_image(
     )
 
     try:
-        # Invoke Gemini
-        response = llm.invoke([prompt])
-        
-        # Observability: Log Cost
-        if hasattr(response, "response_metadata") and "token_usage" in response.response_metadata:
-            usage = response.response_metadata["token_usage"]
-            log_api_cost(
-                store_id=store_id,
-                phase="vision_extraction",
-                model_name=model_name,
-                tokens_in=usage.get("prompt_tokens", 0),
-                tokens_out=usage.get("completion_tokens", 0)
-            )
-
-        # Parse Result
-        parsed = parser.parse(response.content)
-        
-        # Normalize to List[dict]
-        raw_items = parsed.get("items", []) if isinstance(parsed, dict) else parsed
-        
-        # Return raw dicts for easy dataframe usage
-        return raw_items
+        # 1回目は速いモデル。パースできない / 1件も取れない場合だけ次の段のモデルで読み直す (model_routing)
+        models = cascade("vision")
+        for tier, model_name in enumerate(models):
+            llm = get_vision_model(api_key, model_name)
+
+            # Invoke Gemini
+            response = llm.invoke([prompt], **VISION_FORMAT.invoke_kwargs(structured))
+
+            # Observability: Log Cost
+            tokens_in, tokens_out = extract_usage(response)
+            if tokens_in or tokens_out:
+                log_api_cost(
+                    store_id=store_id,
+                    phase="vision_extraction",
+                    model_name=model_name,
+                    tokens_in=tokens_in,
+                    tokens_out=tokens_out
+                )
+            cost_jpy = estimate_cost_jpy(model_name, tokens_in, tokens_out)
+            last_tier = tier == len(models) - 1
+
+            # Parse Result
+            counted = not is_cache_hit(response)
+            try:
+                parsed = parse_json(response.content)
+            except Exception:
+                if counted:
+                    VISION_FORMAT.record(structured, estimate_tokens(prompt_text), ok=False)
+                invalidate_cached(llm, [prompt])
+                record_attempt("vision", model_name, 0, 1, tier, tokens_in, tokens_out, cost_jpy)
+                if last_tier:
+                    raise
+                continue
+
+            # Normalize to List[dict] (項目が欠けた item は捨てる)
+            raw_items = [
+                item.model_dump()
+                for item in coerce_list(parsed.get("items", []) if isinstance(parsed, dict) else parsed, RichMenuItem)
+            ]
+            if counted:
+                VISION_FORMAT.record(structured, estimate_tokens(prompt_text), ok=bool(raw_items))
+            if not raw_items and not last_tier:
+                invalidate_cached(llm, [prompt])
+                record_attempt("vision", model_name, 0, 1, tier, tokens_in, tokens_out, cost_jpy)
+                continue
+            record_attempt("vision", model_name, 1, 0, tier, tokens_in, tokens_out, cost_jpy)
+
+            # Return raw dicts for easy dataframe usage
+            return annotate_with_dictionary(raw_items)
 
     except Exception as e:
         print(f"Error in parse_menu_image: {e}")
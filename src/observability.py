@@ -1,7 +1,10 @@
+import atexit
 import os
 import csv
+import time
 from datetime import datetime
 from threading import Lock
+from typing import Tuple
 
 # Thread-safe writing
 _log_lock = Lock()
@@ -9,6 +12,8 @@ _log_lock = Lock()
 LOG_DIR = "logs"
 API_LOG_FILE = os.path.join(LOG_DIR, "api_usage_log.csv")
 OP_LOG_FILE = os.path.join(LOG_DIR, "operation_log.csv")
+PROMPT_LOG_FILE = os.path.join(LOG_DIR, "prompt_usage_log.csv")
+KEY_LOG_FILE = os.path.join(LOG_DIR, "key_usage_log.csv")
 
 # Simplified Cost Model for Gemini (Adjust as needed for "Gemini 3.0" rates)
 # Defaulting to Gemini 1.5 Pro/Flash mixed rates approximation for estimation
@@ -20,6 +25,9 @@ COST_MODEL = {
 }
 USD_JPY = 150.0
 
+# In-process usage totals per phase (for benchmarks / job summaries)
+_usage_totals = {}
+
 def _ensure_log_dir():
     if not os.path.exists(LOG_DIR):
         os.makedirs(LOG_DIR)
@@ -31,6 +39,35 @@ def _init_csv(filepath, headers):
             writer = csv.writer(f)
             writer.writerow(headers)
 
+def estimate_cost_jpy(model_name: str, tokens_in: float, tokens_out: float) -> float:
+    """
+    Estimated cost in JPY for the given token counts (same rates as the usage log).
+    """
+    # Determine rates
+    rates = COST_MODEL.get(model_name, COST_MODEL["default"])
+    # Simple lookup or heavy fallback
+    if "flash" in model_name.lower():
+        rates = COST_MODEL.get("gemini-1.5-flash") # Fallback estimate
+    elif "pro" in model_name.lower():
+         rates = COST_MODEL.get("gemini-1.5-pro")
+
+    cost_usd = (tokens_in / 1_000_000 * rates["input"]) + (tokens_out / 1_000_000 * rates["output"])
+    return cost_usd * USD_JPY
+
+def extract_usage(response) -> Tuple[int, int]:
+    """
+    LLM response -> (input tokens, output tokens), or (0, 0) if the response carries no usage.
+    Gemini (langchain-google-genai) only fills usage_metadata; response_metadata["token_usage"] is the OpenAI-style fallback.
+    """
+    usage_md = getattr(response, "usage_metadata", None)
+    if usage_md:
+        return usage_md.get("input_tokens", 0) or 0, usage_md.get("output_tokens", 0) or 0
+    metadata = getattr(response, "response_metadata", None) or {}
+    if "token_usage" in metadata:
+        usage = metadata["token_usage"]
+        return usage.get("prompt_tokens", 0) or 0, usage.get("completion_tokens", 0) or 0
+    return 0, 0
+
 def log_api_cost(store_id: str, phase: str, model_name: str, tokens_in: int, tokens_out: int):
     """
     Logs API usage and estimated cost.
@@ -38,18 +75,15 @@ def log_api_cost(store_id: str, phase: str, model_name: str, tokens_in: int, tok
     try:
         _init_csv(API_LOG_FILE, ["timestamp", "store_id", "phase", "model", "tokens_in", "tokens_out", "cost_jpy"])
         
-        # Determine rates
-        rates = COST_MODEL.get(model_name, COST_MODEL["default"])
-        # Simple lookup or heavy fallback
-        if "flash" in model_name.lower():
-            rates = COST_MODEL.get("gemini-1.5-flash") # Fallback estimate
-        elif "pro" in model_name.lower():
-             rates = COST_MODEL.get("gemini-1.5-pro")
-
-        cost_usd = (tokens_in / 1_000_000 * rates["input"]) + (tokens_out / 1_000_000 * rates["output"])
-        cost_jpy = cost_usd * USD_JPY
+        cost_jpy = estimate_cost_jpy(model_name, tokens_in, tokens_out)
 
         with _log_lock:
+            totals = _usage_totals.setdefault(phase, {"calls": 0, "tokens_in": 0, "tokens_out": 0, "cost_jpy": 0.0})
+            totals["calls"] += 1
+            totals["tokens_in"] += tokens_in
+            totals["tokens_out"] += tokens_out
+            totals["cost_jpy"] += cost_jpy
+
             with open(API_LOG_FILE, "a", encoding="utf-8", newline="") as f:
                 writer = csv.writer(f)
                 writer.writerow([
@@ -64,6 +98,106 @@ def log_api_cost(store_id: str, phase: str, model_name: str, tokens_in: int, tok
     except Exception as e:
         print(f"[Observability] Failed to log API cost: {e}")
 
+def log_prompt_split(store_id: str, phase: str, prompt_name: str, prompt_version: str, prefix_tokens: int, suffix_tokens: int, cache_read_tokens: int):
+    """
+    Logs the static-prefix / per-item-suffix token split of one API call
+    (estimated tokens; cache_read_tokens is what the provider reports as served from its prefix cache).
+    """
+    try:
+        _init_csv(PROMPT_LOG_FILE, ["timestamp", "store_id", "phase", "prompt", "prompt_version", "prefix_tokens", "suffix_tokens", "cache_read_tokens"])
+        with _log_lock:
+            with open(PROMPT_LOG_FILE, "a", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow([
+                    datetime.now().isoformat(),
+                    store_id,
+                    phase,
+                    prompt_name,
+                    prompt_version,
+                    prefix_tokens,
+                    suffix_tokens,
+                    cache_read_tokens
+                ])
+    except Exception as e:
+        print(f"[Observability] Failed to log prompt split: {e}")
+
+# Per-call key events are aggregated in memory and written as one row per (key_id, event) every
+# KEY_LOG_FLUSH_SECONDS (and on flush_key_usage() / process exit) instead of one row per LLM call
+KEY_LOG_FLUSH_SECONDS = float(os.getenv("KEY_LOG_FLUSH_SECONDS", "60"))
+KEY_LOG_HEADERS = ["timestamp", "key_id", "event", "calls", "tokens", "in_flight", "concurrency_limit", "rpm_utilization", "detail"]
+# Key rotation events are rare and worth seeing right away: written immediately
+_KEY_IMMEDIATE_EVENTS = ("benched", "restored")
+
+_key_usage = {}
+_key_usage_flushed_at = time.monotonic()
+
+def _write_key_rows(rows):
+    _init_csv(KEY_LOG_FILE, KEY_LOG_HEADERS)
+    with open(KEY_LOG_FILE, "a", encoding="utf-8", newline="") as f:
+        csv.writer(f).writerows(rows)
+
+def _drain_key_usage():
+    # Caller holds _log_lock
+    global _key_usage_flushed_at
+    now = datetime.now().isoformat()
+    rows = [
+        [now, key_id, event, agg["calls"], agg["tokens"], agg["in_flight"], agg["concurrency_limit"], f"{agg['rpm_utilization']:.3f}", ""]
+        for (key_id, event), agg in _key_usage.items()
+    ]
+    _key_usage.clear()
+    _key_usage_flushed_at = time.monotonic()
+    return rows
+
+def log_key_usage(key_id: str, event: str, tokens: int = 0, in_flight: int = 0, concurrency_limit: int = 0, rpm_utilization: float = 0.0, detail: str = ""):
+    """
+    Records one API-key pool event (key_pool): a finished call (event = "ok" / error kind) or a key
+    taken out of / back into rotation ("benched" / "restored"). key_id is a hash, never the key itself.
+    Finished calls are aggregated per (key_id, event) (calls, tokens, peak in_flight / rpm_utilization,
+    latest concurrency_limit) and flushed periodically; rotation events are written at once.
+    """
+    try:
+        with _log_lock:
+            if event in _KEY_IMMEDIATE_EVENTS:
+                rows = _drain_key_usage()
+                rows.append([datetime.now().isoformat(), key_id, event, 0, tokens, in_flight, concurrency_limit, f"{rpm_utilization:.3f}", detail])
+                _write_key_rows(rows)
+                return
+            agg = _key_usage.setdefault((key_id, event), {"calls": 0, "tokens": 0, "in_flight": 0, "concurrency_limit": 0, "rpm_utilization": 0.0})
+            agg["calls"] += 1
+            agg["tokens"] += tokens
+            agg["in_flight"] = max(agg["in_flight"], in_flight)
+            agg["concurrency_limit"] = concurrency_limit
+            agg["rpm_utilization"] = max(agg["rpm_utilization"], rpm_utilization)
+            if time.monotonic() - _key_usage_flushed_at >= KEY_LOG_FLUSH_SECONDS:
+                _write_key_rows(_drain_key_usage())
+    except Exception as e:
+        print(f"[Observability] Failed to log key usage: {e}")
+
+def flush_key_usage():
+    """
+    Writes the aggregated key usage recorded since the last flush (end of a job / process exit).
+    """
+    try:
+        with _log_lock:
+            rows = _drain_key_usage()
+            if rows:
+                _write_key_rows(rows)
+    except Exception as e:
+        print(f"[Observability] Failed to flush key usage: {e}")
+
+atexit.register(flush_key_usage)
+
+def get_usage_totals() -> dict:
+    """
+    Returns a copy of the in-process usage totals: {phase: {calls, tokens_in, tokens_out, cost_jpy}}.
+    """
+    with _log_lock:
+        return {phase: dict(v) for phase, v in _usage_totals.items()}
+
+def reset_usage_totals():
+    with _log_lock:
+        _usage_totals.clear()
+
 def log_op_action(store_id: str, user_id: str, action: str, details: str = ""):
     """
     Logs human operations (Owner/Staff actions).
@@ -6,101 +6,118 @@ PERSONA_DEFINITIONS = {
         "role": "Urban Food Writer (New Yorker Foodie)",
         "tone": "Crispy, savory, zest. Friendly but knowledgeable. Use appetizing adjectives.",
         "forbidden": "Overly formal language, roundabout phrasing, baseless 'best' claims.",
-        "keywords": ["crisp", "juicy", "silky", "smoky", "zest"]
+        "keywords": ["crisp", "juicy", "silky", "smoky", "zest"],
+        "forbidden_phrases": ["best in the world", "world's best", "guaranteed", "cures", "detox"]
     },
     # --- S1-03-KO ---
     "Korean": {
         "role": "Gourmet SNS Reviewer (Seoul Influencer)",
         "tone": "Trendy, punchy, modern. Emphasize visual and flavor impact.",
         "forbidden": "Assertive health claims, overly expensive/snobbish tone.",
-        "keywords": ["한입 포인트 (One-bite point)", "spicy", "chewy", "refreshing", "visual"]
+        "keywords": ["한입 포인트 (One-bite point)", "spicy", "chewy", "refreshing", "visual"],
+        "forbidden_phrases": ["세계 최고", "보장", "치료", "다이어트 효과"]
     },
     # --- S1-03-ZH-CN ---
     "Chinese": {
         "role": "Practical Gourmet (Shanghai Style)",
         "tone": "Clear, well-organized. Use evocative four-character idioms for texture.",
         "forbidden": "Vague metaphors, long poetic ramblings without substance.",
-        "keywords": ["Texture-focused idioms", "Authentic flavor", "Practical"]
+        "keywords": ["Texture-focused idioms", "Authentic flavor", "Practical"],
+        "forbidden_phrases": ["世界第一", "保证", "治疗", "包治"]
     },
     # --- S1-03-ZH-TW ---
     "Taiwanese": {
         "role": "Taipei Food Blogger",
         "tone": "Elegant but relatable. Emphasize 'Q-texture' and layers of flavor.",
         "forbidden": "Mainland Chinese idioms/phrasing.",
-        "keywords": ["Q-texture", "Layered flavor", "Aroma", "Elegant"]
+        "keywords": ["Q-texture", "Layered flavor", "Aroma", "Elegant"],
+        "forbidden_phrases": ["世界第一", "保證", "治療"]
     },
     # --- S1-03-YUE ---
     "Cantonese": {
         "role": "Hong Kong Gourmet",
         "tone": "Witty, punchy, sophisticated. Use Cantonese nuances.",
         "forbidden": "Stiff written-style only (add some spoken flavor), Direct translation smell.",
-        "keywords": ["Wok Hei", "Freshness", "Punchy"]
+        "keywords": ["Wok Hei", "Freshness", "Punchy"],
+        "forbidden_phrases": ["世界第一", "保證", "治療"]
     },
     # --- S1-03-TH ---
     "Thai": {
         "role": "Local Food Guide",
         "tone": "Friendly, smiling tone. Specifically describe sour, sweet, spicy balance.",
         "forbidden": "Casual remarks about Religion/Royalty.",
-        "keywords": ["Aroma", "Sauce", "Grill check", "Balance"]
+        "keywords": ["Aroma", "Sauce", "Grill check", "Balance"],
+        "forbidden_phrases": ["ดีที่สุดในโลก", "รับประกัน", "รักษาโรค"]
     },
     # --- S1-03-FIL ---
     "Filipino": {
         "role": "Friendly Food Buddy",
         "tone": "Conversational, Taglish-friendly context if needed. 'Try this with...'",
         "forbidden": "Stiff academic language, overly technical terms.",
-        "keywords": ["Try this", "Savory", "Comfort food", "Conversation"]
+        "keywords": ["Try this", "Savory", "Comfort food", "Conversation"],
+        "forbidden_phrases": ["pinakamasarap sa buong mundo", "garantisado", "gamot sa"]
     },
     # --- S1-03-VI ---
     "Vietnamese": {
         "role": "Street Food Connoisseur",
         "tone": "Warm, practical. Focus on herbs, dipping sauces, and how to eat.",
         "forbidden": "Too many metaphors, abstract concepts, long winded stories.",
-        "keywords": ["Herbs", "Dipping sauce", "Fresh", "Practical"]
+        "keywords": ["Herbs", "Dipping sauce", "Fresh", "Practical"],
+        "forbidden_phrases": ["ngon nhất thế giới", "đảm bảo", "chữa bệnh"]
     },
     # --- S1-03-ID ---
     "Indonesian": {
         "role": "Friendly Local Host",
         "tone": "Polite, reassuring, simple. Clear steps.",
         "forbidden": "Definitive religious claims (e.g. '100% Halal') unless verified.",
-        "keywords": ["Comfort", "Spices", "Polite", "Reassuring"]
+        "keywords": ["Comfort", "Spices", "Polite", "Reassuring"],
+        "forbidden_phrases": ["100% halal", "terbaik di dunia", "dijamin", "menyembuhkan"]
     },
     # --- S1-03-ES ---
     "Spanish": {
         "role": "Tapas Bar Host",
         "tone": "Passionate, rhythmic, appetizing. Invites sharing.",
         "forbidden": "English sentence structure (syntax calque).",
-        "keywords": ["Joy", "Flavorful", "Sharing", "Rhythm"]
+        "keywords": ["Joy", "Flavorful", "Sharing", "Rhythm"],
+        "forbidden_phrases": ["el mejor del mundo", "garantizado", "cura el cáncer", "cura enfermedades"]
     },
     # --- S1-03-DE ---
     "German": {
         "role": "Reliable Gourmet Critic",
         "tone": "Logically structured (Ingredients -> Cooking -> Taste). Precise and honest.",
         "forbidden": "Vague claims like 'somehow tasty', emotional fluff.",
-        "keywords": ["Quality", "Craftsmanship", "Texture", "Logic"]
+        "keywords": ["Quality", "Craftsmanship", "Texture", "Logic"],
+        "forbidden_phrases": ["irgendwie lecker", "weltbeste", "garantiert", "heilt"]
     },
     # --- S1-03-FR ---
     "French": {
         "role": "Parisian Bistro Critic",
         "tone": "Elegant, focus on 'aftertaste' and pairings. Describe the sauce and harmony.",
         "forbidden": "Cheap salesy language (e.g. 'Super tasty').",
-        "keywords": ["Harmony", "Mariage", "Succulent", "Aftertaste"]
+        "keywords": ["Harmony", "Mariage", "Succulent", "Aftertaste"],
+        "forbidden_phrases": ["super bon", "trop bon", "le meilleur du monde", "garanti"]
     },
     # --- S1-03-IT ---
     "Italian": {
         "role": "Trattoria Storyteller",
         "tone": "Passionate, warm. Respect for ingredients and tradition. 'Buono!' spirit.",
         "forbidden": "Overly formal/bureaucratic terms, fake Italian stereotypes.",
-        "keywords": ["Al dente", "Freshness", "Abbinamento", "Passion"]
+        "keywords": ["Al dente", "Freshness", "Abbinamento", "Passion"],
+        "forbidden_phrases": ["il migliore del mondo", "garantito", "cura la malattia", "cura il cancro"]
     },
     # --- S1-03-PT ---
     "Portuguese": {
         "role": "Friendly Family Host",
         "tone": "Warm, inviting. Describe the feeling of biting into the food.",
         "forbidden": "English-like slang, cold technical terms.",
-        "keywords": ["Biting sensation", "Warmth", "Family", "Inviting"]
+        "keywords": ["Biting sensation", "Warmth", "Family", "Inviting"],
+        "forbidden_phrases": ["o melhor do mundo", "garantido", "cura o câncer", "cura doenças"]
     }
 }
 
+# S1-06 Local QC: phrases rejected in every language (safety / unverifiable claims)
+COMMON_FORBIDDEN_PHRASES = ["No.1", "No. 1", "guarantee", "miracle"]
+
 # S1-06 QC Rules (Persona & Fact Audit)
 DEFAULT_QC_RULES = """
 1. **Meaning Check**: Does the transcreation accurately reflect the ingredients and cooking method? (No hallucinations)
@@ -0,0 +1,202 @@
+import hashlib
+import string
+import textwrap
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any, Dict, Optional, Tuple
+
+from langchain_core.prompts import PromptTemplate
+
+from .structured_output import OutputFormat, SCHEMA_PROMPT_SUFFIX, use_schema
+from .token_estimator import estimate_tokens
+
+# --------------------------------------------------------------------
+# Prompt Registry
+# --------------------------------------------------------------------
+# テンプレートは import 時に1回だけコンパイルし、
+#   [静的プレフィックス: 役割・ルール・出力形式・ペルソナ] + [item ごとのサフィックス]
+# の順に並べる。プレフィックスはバイト単位で同一になるよう、整形済み文字列をメモ化して使い回す
+# (Gemini の暗黙的コンテキストキャッシュは先頭一致の長さで効く)。
+
+
+# 1テンプレートあたりにメモ化する整形済みプレフィックスの上限 (言語 × ペルソナ程度で足りる)
+MAX_PREFIXES_PER_PROMPT = 256
+
+
+def _variables(template: str) -> Tuple[str, ...]:
+    return tuple(sorted({name for _, name, _, _ in string.Formatter().parse(template) if name}))
+
+
+@dataclass(frozen=True)
+class RenderedPrompt:
+    """整形済みプロンプト。LLM には text (= prefix + suffix) を渡す"""
+    name: str
+    version: str
+    prefix: str
+    suffix: str
+    prefix_tokens: int
+    suffix_tokens: int
+
+    @property
+    def text(self) -> str:
+        return self.prefix + self.suffix
+
+
+class CompiledPrompt:
+    """
+    プレフィックス / サフィックスに分割済みのテンプレート。
+    partial_variables は import 時に埋め込む (呼び出しごとに変わらないもの)。
+    """
+
+    def __init__(self, name: str, version: str, prefix: str, suffix: str, partial_variables: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.version = version
+        prefix = textwrap.dedent(prefix).strip() + "\n\n"
+        suffix = textwrap.dedent(suffix).strip() + "\n"
+        # 固定値 (出力形式の説明など) はここで文字列に焼き込む。値に含まれる { } はエスケープする
+        for var, value in (partial_variables or {}).items():
+            escaped = value.replace("{", "{{").replace("}", "}}")
+            prefix = prefix.replace("{" + var + "}", escaped)
+            suffix = suffix.replace("{" + var + "}", escaped)
+        self.prefix_variables = _variables(prefix)
+        self.suffix_variables = _variables(suffix)
+        overlap = set(self.prefix_variables) & set(self.suffix_variables)
+        if overlap:
+            raise ValueError(f"Prompt '{name}': variables used in both prefix and suffix: {sorted(overlap)}")
+        self.prefix_template = PromptTemplate(input_variables=list(self.prefix_variables), template=prefix)
+        self.suffix_template = PromptTemplate(input_variables=list(self.suffix_variables), template=suffix)
+        self.fingerprint = hashlib.sha256((prefix + "\0" + suffix).encode("utf-8")).hexdigest()[:12]
+        self._prefix_cache: Dict[Tuple, Tuple[str, int]] = {}
+        self._lock = Lock()
+
+    def _render_prefix(self, values: Dict[str, Any]) -> Tuple[str, int]:
+        key = tuple(str(values[v]) for v in self.prefix_variables)
+        with self._lock:
+            cached = self._prefix_cache.get(key)
+        if cached is not None:
+            return cached
+        text = self.prefix_template.format(**values)
+        rendered = (text, estimate_tokens(text))
+        with self._lock:
+            if len(self._prefix_cache) >= MAX_PREFIXES_PER_PROMPT:
+                self._prefix_cache.clear()
+            return self._prefix_cache.setdefault(key, rendered)
+
+    def render(self, **values: Any) -> RenderedPrompt:
+        unknown = set(values) - set(self.prefix_variables) - set(self.suffix_variables)
+        if unknown:
+            raise KeyError(f"Prompt '{self.name}': unknown variables {sorted(unknown)}")
+        prefix, prefix_tokens = self._render_prefix({v: values[v] for v in self.prefix_variables})
+        suffix = self.suffix_template.format(**{v: values[v] for v in self.suffix_variables})
+        return RenderedPrompt(
+            name=self.name,
+            version=self.version,
+            prefix=prefix,
+            suffix=suffix,
+            prefix_tokens=prefix_tokens,
+            suffix_tokens=estimate_tokens(suffix),
+        )
+
+
+_registry: Dict[str, CompiledPrompt] = {}
+_registry_lock = Lock()
+
+_stats_lock = Lock()
+_stats: Dict[str, Dict[str, int]] = {}
+
+
+def register_prompt(
+    name: str,
+    version: str,
+    prefix: str,
+    suffix: str,
+    partial_variables: Optional[Dict[str, str]] = None,
+) -> CompiledPrompt:
+    """テンプレートをコンパイルして登録する (モジュールの import 時に呼ぶ)"""
+    compiled = CompiledPrompt(name, version, prefix, suffix, partial_variables)
+    with _registry_lock:
+        if name in _registry and _registry[name].fingerprint != compiled.fingerprint:
+            raise ValueError(f"Prompt '{name}' is already registered with a different template")
+        _registry[name] = compiled
+    return compiled
+
+
+class StructuredPrompt:
+    """
+    出力形式だけが違う2本のテンプレート (structured_output 参照)。
+    テンプレート中の {format_instructions} に、従来経路では形式の説明、スキーマ経路 ("<name>.schema") では短い指示を焼き込む。
+    """
+
+    def __init__(self, fmt: OutputFormat, instructions: CompiledPrompt, schema: CompiledPrompt):
+        self.output_format = fmt
+        self._prompts = {False: instructions, True: schema}
+
+    def render(self, structured: Optional[bool] = None, **values: Any) -> RenderedPrompt:
+        return self._prompts[use_schema(structured)].render(**values)
+
+
+def register_structured_prompt(
+    name: str,
+    version: str,
+    prefix: str,
+    suffix: str,
+    fmt: OutputFormat,
+    partial_variables: Optional[Dict[str, str]] = None,
+) -> StructuredPrompt:
+    """出力形式の説明を埋め込む版とスキーマ指定で送る版をまとめて登録する"""
+    partial_variables = partial_variables or {}
+    return StructuredPrompt(
+        fmt,
+        register_prompt(name, version, prefix, suffix, {**partial_variables, "format_instructions": fmt.instructions}),
+        register_prompt(name + SCHEMA_PROMPT_SUFFIX, version, prefix, suffix, {**partial_variables, "format_instructions": fmt.schema_note}),
+    )
+
+
+def get_prompt(name: str) -> CompiledPrompt:
+    return _registry[name]
+
+
+def list_prompts() -> Dict[str, dict]:
+    """{name: {version, fingerprint}} 登録済みテンプレートの一覧"""
+    with _registry_lock:
+        return {name: {"version": p.version, "fingerprint": p.fingerprint} for name, p in _registry.items()}
+
+
+def _cache_read_tokens(response: Any) -> int:
+    usage = getattr(response, "usage_metadata", None) or {}
+    details = usage.get("input_token_details") or {}
+    return details.get("cache_read", 0) or 0
+
+
+def record_prompt_usage(prompt: RenderedPrompt, response: Any) -> int:
+    """
+    1回の API 呼び出しについてプレフィックス / サフィックスの推定トークン数と、
+    プロバイダ側キャッシュから読まれた入力トークン数 (取得できれば) を集計する。
+    Returns: cache_read トークン数
+    """
+    cache_read = _cache_read_tokens(response)
+    with _stats_lock:
+        s = _stats.setdefault(prompt.name, {"calls": 0, "prefix_tokens": 0, "suffix_tokens": 0, "cache_read_tokens": 0})
+        s["calls"] += 1
+        s["prefix_tokens"] += prompt.prefix_tokens
+        s["suffix_tokens"] += prompt.suffix_tokens
+        s["cache_read_tokens"] += cache_read
+    return cache_read
+
+
+def get_prompt_stats() -> Dict[str, dict]:
+    """
+    テンプレートごとの集計 {name: {calls, prefix_tokens, suffix_tokens, cache_read_tokens, prefix_ratio}}
+    prefix_ratio は入力のうちキャッシュ可能な静的プレフィックスが占める割合 (推定)。
+    """
+    with _stats_lock:
+        stats = {name: dict(s) for name, s in _stats.items()}
+    for s in stats.values():
+        total = s["prefix_tokens"] + s["suffix_tokens"]
+        s["prefix_ratio"] = s["prefix_tokens"] / total if total else 0.0
+    return stats
+
+
+def reset_prompt_stats():
+    with _stats_lock:
+        _stats.clear()
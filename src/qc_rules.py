@@ -0,0 +1,159 @@
+import os
+import re
+from threading import Lock
+from typing import Optional, Tuple
+
+from .languages import canonical_language
+from .personas import PERSONA_DEFINITIONS, COMMON_FORBIDDEN_PHRASES
+
+# S1-06 Local QC Gate
+# LLM 監査の前に走らせる決定的ルール。
+#   False -> 明らかな不合格 (LLM 監査なしで再生成)
+#   True  -> 明らかな合格   (LLM 監査をスキップ)
+#   None  -> 判定不能       (LLM 監査に回す)
+# LOCAL_QC_ACCEPT=0 にすると「合格判定」はせず、不合格の足切りだけ行う。
+LOCAL_QC_ACCEPT = os.getenv("LOCAL_QC_ACCEPT", "1") == "1"
+
+# 言語ごとの表は英語名で持つ (日本語名は evaluate() で canonical_language() に通してから引く)
+# 18秒の黙読で読める説明文の文字数 (DEFAULT_QC_RULES: JP ~120 chars, EN ~240 chars)
+READING_BUDGET_CHARS = {
+    "English": 240,
+    "Chinese": 120,
+    "Taiwanese": 120,
+    "Cantonese": 120,
+    "HongKong": 120,
+    "Korean": 150,
+    "Thai": 250,
+}
+DEFAULT_READING_BUDGET_CHARS = 260  # その他ラテン文字言語
+
+# 予算に対する比率: この範囲外は不合格、ACCEPT 範囲内なら合格候補
+LENGTH_REJECT_RANGE = (0.15, 2.0)
+LENGTH_ACCEPT_RANGE = (0.4, 1.3)
+
+# 想定スクリプトの文字が占める割合: REJECT 未満は不合格、ACCEPT 以上なら合格候補
+SCRIPT_REJECT_RATIO = 0.6
+SCRIPT_ACCEPT_RATIO = 0.9
+
+_SCRIPT_PATTERNS = {
+    "hangul": re.compile(r"[\uac00-\ud7af\u1100-\u11ff\u3130-\u318f]"),
+    "thai": re.compile(r"[\u0e00-\u0e7f]"),
+    "han": re.compile(r"[\u4e00-\u9fff\u3400-\u4dbf]"),
+    "latin": re.compile(r"[A-Za-z\u00c0-\u024f\u1e00-\u1eff]"),
+}
+_KANA_PATTERN = re.compile(r"[\u3040-\u30ff]")
+_LETTER_PATTERN = re.compile(r"[^\W\d_]")
+
+LANGUAGE_SCRIPTS = {
+    "Korean": "hangul",
+    "Thai": "thai",
+    "Chinese": "han",
+    "Taiwanese": "han",
+    "Cantonese": "han",
+    "HongKong": "han",
+}
+TRADITIONAL_ONLY_LANGUAGES = {"Taiwanese", "Cantonese", "HongKong"}
+
+# 簡体字にしか現れない頻出字 (繁体字圏の出力に混ざっていたら不合格)
+SIMPLIFIED_ONLY_CHARS = set("这们说为时个国发过还东鱼鸡猪虾汤饭酱烧鲜锅荞浓软热让丝块鳗乌龙凉种样无与适")
+
+_stats_lock = Lock()
+_stats = {"local_reject": 0, "local_accept": 0, "llm_audit": 0}
+
+
+def _script_ratio(text: str, script: str) -> float:
+    letters = _LETTER_PATTERN.findall(text)
+    if not letters:
+        return 0.0
+    matched = len(_SCRIPT_PATTERNS[script].findall(text))
+    return min(1.0, matched / len(letters))
+
+
+def _contains_phrase(text: str, phrase: str) -> bool:
+    # ラテン文字 (アクセント付きを含む) の語句は単語単位で照合する (語の一部には当てない)。
+    # 漢字・タイ文字・ハングルは語の区切りが当てにならないので部分一致
+    if all(_SCRIPT_PATTERNS["latin"].match(ch) for ch in _LETTER_PATTERN.findall(phrase)):
+        return re.search(r"(?<!\w)" + re.escape(phrase) + r"(?!\w)", text, re.IGNORECASE) is not None
+    return phrase in text
+
+
+def evaluate(generated: dict, lang: str) -> Tuple[Optional[bool], str]:
+    """
+    生成結果 (name / description / pairing) をローカルルールで判定する。
+
+    Returns:
+        (False, 理由) : 不合格
+        (True, "")    : 合格 (LLM 監査不要)
+        (None, "")    : 判定不能 (LLM 監査へ)
+    """
+    name = str(generated.get("name") or "").strip()
+    desc = str(generated.get("description") or "").strip()
+    lang_key = canonical_language(lang)
+
+    # 1. JSON field completeness
+    if not name or not desc:
+        return False, "Missing name/description"
+    if "pairing" not in generated:
+        return False, "Missing pairing field"
+
+    confident = True
+
+    # 2. Length budget (~18s silent reading)
+    budget = READING_BUDGET_CHARS.get(lang_key, DEFAULT_READING_BUDGET_CHARS)
+    ratio = len(desc) / budget
+    if not (LENGTH_REJECT_RANGE[0] <= ratio <= LENGTH_REJECT_RANGE[1]):
+        return False, f"Length out of budget ({len(desc)} chars, budget ~{budget})"
+    if not (LENGTH_ACCEPT_RANGE[0] <= ratio <= LENGTH_ACCEPT_RANGE[1]):
+        confident = False
+
+    # 3. Forbidden phrases
+    persona_def = PERSONA_DEFINITIONS.get(lang_key, {})
+    text = f"{name}\n{desc}\n{generated.get('pairing') or ''}"
+    for phrase in COMMON_FORBIDDEN_PHRASES + persona_def.get("forbidden_phrases", []):
+        if _contains_phrase(text, phrase):
+            return False, f"Forbidden phrase: {phrase}"
+
+    # 4. Script checks
+    script = LANGUAGE_SCRIPTS.get(lang_key, "latin")
+    script_ratio = _script_ratio(desc, script)
+    if script_ratio < SCRIPT_REJECT_RATIO:
+        return False, f"Wrong script for {lang} ({script} ratio {script_ratio:.2f})"
+    if script_ratio < SCRIPT_ACCEPT_RATIO:
+        confident = False
+    if script != "han" and _KANA_PATTERN.search(desc):
+        # 説明文に日本語の仮名が残っている = 訳し漏れの可能性
+        confident = False
+    if lang_key in TRADITIONAL_ONLY_LANGUAGES:
+        simplified = sorted({ch for ch in text if ch in SIMPLIFIED_ONLY_CHARS})
+        if simplified:
+            return False, f"Simplified characters in {lang}: {''.join(simplified)}"
+
+    if confident and LOCAL_QC_ACCEPT:
+        return True, ""
+    return None, ""
+
+
+def record(decision: Optional[bool]):
+    """判定結果を集計する (None = LLM 監査に回した)"""
+    key = "llm_audit" if decision is None else ("local_accept" if decision else "local_reject")
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def get_qc_gate_stats() -> dict:
+    """
+    ローカル QC ゲートの集計。audits_avoided_ratio は LLM 監査を省略できた割合。
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    total = sum(stats.values())
+    avoided = stats["local_reject"] + stats["local_accept"]
+    stats["total"] = total
+    stats["audits_avoided_ratio"] = avoided / total if total else 0.0
+    return stats
+
+
+def reset_qc_gate_stats():
+    with _stats_lock:
+        for k in _stats:
+            _stats[k] = 0
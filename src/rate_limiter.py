@@ -0,0 +1,451 @@
+import asyncio
+import importlib
+import json
+import os
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from .token_estimator import estimate_tokens
+
+# --------------------------------------------------------------------
+# Configuration (Gemini quota defaults; override per deployment)
+# --------------------------------------------------------------------
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "300"))
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", "1000000"))
+GEMINI_MIN_CONCURRENCY = int(os.getenv("GEMINI_MIN_CONCURRENCY", "1"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "32"))
+GEMINI_INITIAL_CONCURRENCY = int(os.getenv("GEMINI_INITIAL_CONCURRENCY", "8"))
+# 1回の API 呼び出しの期限 (秒)。超えたら transient として再試行する。0 で無効
+GEMINI_CALL_TIMEOUT = float(os.getenv("GEMINI_CALL_TIMEOUT", "60"))
+
+# 出力トークンの事前見積もり (実績で後から精算する)
+EXPECTED_OUTPUT_TOKENS = 500
+
+_POLL_INTERVAL = 0.02
+
+# 呼び出しの優先度 (小さいほど先、既定 0)。同じ limiter の枠を待っている呼び出しのうち、より優先度の高いものがあれば譲る。
+# asyncio のタスクは作られた時点のコンテキストを引き継ぐので、call_priority() の中で始めた並列処理にも効く
+_call_priority: ContextVar[int] = ContextVar("llm_call_priority", default=0)
+
+
+@contextmanager
+def call_priority(priority: int) -> Iterator[None]:
+    """この中の LLM 呼び出しを priority で limiter に並ばせる (例: 優先言語の後に回す言語は 1)"""
+    token = _call_priority.set(priority)
+    try:
+        yield
+    finally:
+        _call_priority.reset(token)
+
+
+def current_priority() -> int:
+    return _call_priority.get()
+
+# エラー分類
+RATE_LIMIT = "rate_limit"
+TRANSIENT = "transient"
+PARSE = "parse"
+FATAL = "fatal"
+CANCELLED = "cancelled"  # ヘッジ負けなどで呼び出し側が取り消した (エラーではない)
+
+
+def _exception_types(module: str, *names: str) -> Tuple[type, ...]:
+    """module にある例外クラスだけを集める (未インストールのライブラリや、古い版に無いクラスは飛ばす)"""
+    try:
+        mod = importlib.import_module(module)
+    except ImportError:
+        return ()
+    return tuple(cls for cls in (getattr(mod, name, None) for name in names) if isinstance(cls, type))
+
+
+# 例外の型で分類する (メッセージの文字列は見ない: "500" や "internal" を含むだけの無関係なエラーを再試行しないため)
+# google.api_core は旧 SDK (google-generativeai)、google.genai は新 SDK、langchain_core の Model*Error は
+# langchain-google-genai が SDK の例外を分類し直したもの
+_RATE_LIMIT_TYPES = (
+    _exception_types("google.api_core.exceptions", "ResourceExhausted", "TooManyRequests")
+    + _exception_types("langchain_core.exceptions", "ModelRateLimitError")
+)
+_TRANSIENT_TYPES = (
+    (asyncio.TimeoutError, TimeoutError, ConnectionError)
+    + _exception_types(
+        "google.api_core.exceptions",
+        "InternalServerError", "BadGateway", "ServiceUnavailable", "GatewayTimeout", "DeadlineExceeded",
+    )
+    + _exception_types("google.genai.errors", "ServerError")
+    + _exception_types("langchain_core.exceptions", "ModelTimeoutError", "ModelConnectionError")
+    # 接続断・読み取りタイムアウトなど (HTTP ステータスを受け取る前の失敗)
+    + _exception_types("httpx", "TransportError")
+    + _exception_types("aiohttp", "ClientConnectionError")
+)
+# llm_json.LLMJSONError は JSONDecodeError の派生
+_PARSE_TYPES = (json.JSONDecodeError, KeyError) + _exception_types("langchain_core.exceptions", "OutputParserException")
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    """
+    例外が持つ HTTP ステータス。google (api_core / genai) は .code、httpx は .response.status_code、
+    aiohttp は .status (google.genai の .status は "UNAVAILABLE" などの文字列なので int だけを見る)
+    """
+    response = getattr(exc, "response", None)
+    for value in (
+        getattr(exc, "code", None),
+        getattr(exc, "status_code", None),
+        getattr(exc, "status", None),
+        getattr(response, "status_code", None),
+    ):
+        if isinstance(value, int) and not isinstance(value, bool) and 100 <= value < 600:
+            return value
+    return None
+
+
+def _classify_one(exc: BaseException) -> str:
+    if isinstance(exc, _RATE_LIMIT_TYPES):
+        return RATE_LIMIT
+    if isinstance(exc, _TRANSIENT_TYPES):
+        return TRANSIENT
+    if isinstance(exc, _PARSE_TYPES):
+        return PARSE
+    code = _status_code(exc)
+    if code == 429:
+        return RATE_LIMIT
+    if code is not None and (code == 408 or code >= 500):
+        return TRANSIENT
+    return FATAL
+
+
+def classify_error(exc: BaseException) -> str:
+    """
+    例外を rate_limit / transient / parse / fatal に分類する (例外の型と HTTP ステータスで判定)。
+    langchain-google-genai は SDK の例外を `raise ... from e` で包み直すので、決まらなければ __cause__ もたどる
+    """
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        kind = _classify_one(exc)
+        if kind != FATAL:
+            return kind
+        exc = exc.__cause__
+    return FATAL
+
+
+@dataclass
+class RetryPolicy:
+    """指数バックオフ + ジッター (full jitter)"""
+    max_retries: int = 4
+    base_delay: float = 1.0
+    max_delay: float = 30.0
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def should_retry(self, kind: str, attempt: int) -> bool:
+        return kind != FATAL and attempt < self.max_retries
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy(
+    max_retries=int(os.getenv("GEMINI_MAX_RETRIES", "4")),
+    base_delay=float(os.getenv("GEMINI_RETRY_BASE_DELAY", "1.0")),
+)
+
+
+class TokenBucket:
+    """毎分 rate_per_min 補充されるトークンバケット (スレッドセーフ)"""
+
+    def __init__(self, rate_per_min: float, capacity: Optional[float] = None):
+        self.rate_per_sec = rate_per_min / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_min
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_sec)
+        self._updated = now
+
+    def try_take(self, amount: float) -> float:
+        """取れたら 0、取れなければ必要な待ち秒数を返す"""
+        # 1回でバケット容量を超える要求は容量ぶんとして扱う (永久待ち防止)
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self.rate_per_sec
+
+    def adjust(self, delta: float):
+        """見積もりと実績の差分を精算する (負の残高 = 借り越しも許す)"""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens - delta)
+
+    def drain(self):
+        """429 を受けたら溜まっているトークンを捨てて、補充ペースまで落とす"""
+        with self._lock:
+            self._tokens = min(self._tokens, 0.0)
+            self._updated = time.monotonic()
+
+
+class AdaptiveRateLimiter:
+    """
+    クライアント側のレート制御 (requests/min, tokens/min) + AIMD による同時実行数の自動調整。
+
+    - 成功: 同時実行数を加算的に増やす (1 ウィンドウあたり +1 程度)
+    - 429 / 5xx: 同時実行数を半減し、リクエストバケットを空にする
+    同じ limiter を複数のイベントループ / スレッドから使えるよう、待機はポーリングで行う。
+    """
+
+    def __init__(
+        self,
+        rpm: int = GEMINI_RPM,
+        tpm: int = GEMINI_TPM,
+        initial_concurrency: int = GEMINI_INITIAL_CONCURRENCY,
+        min_concurrency: int = GEMINI_MIN_CONCURRENCY,
+        max_concurrency: int = GEMINI_MAX_CONCURRENCY,
+    ):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self._limit = float(max(min_concurrency, min(initial_concurrency, max_concurrency)))
+        self._in_flight = 0
+        self._waiting: Dict[int, int] = {}  # 優先度ごとの枠待ちの数
+        self._lock = Lock()
+        self._stats = {"calls": 0, "successes": 0, RATE_LIMIT: 0, TRANSIENT: 0, PARSE: 0, FATAL: 0, "retries": 0, "timeouts": 0, CANCELLED: 0, "waited_sec": 0.0}
+
+    @property
+    def concurrency_limit(self) -> int:
+        return int(self._limit)
+
+    def has_headroom(self) -> bool:
+        """今すぐ同時実行枠が空いているか (ヘッジのように、待たせてまで出す必要のない呼び出し用)"""
+        with self._lock:
+            return self._in_flight < int(self._limit)
+
+    def _try_acquire(self, est_tokens: int, priority: int = 0) -> float:
+        with self._lock:
+            if self._in_flight >= int(self._limit):
+                return _POLL_INTERVAL
+            if any(n for p, n in self._waiting.items() if p < priority):
+                # より優先度の高い呼び出しが枠を待っている
+                return _POLL_INTERVAL
+            wait = self.requests.try_take(1)
+            if wait:
+                return wait
+            wait = self.tokens.try_take(est_tokens)
+            if wait:
+                self.requests.adjust(-1)  # リクエスト枠は返却
+                return wait
+            self._in_flight += 1
+            self._stats["calls"] += 1
+            return 0.0
+
+    def try_acquire(self, est_tokens: int, priority: int = 0) -> float:
+        """待たずに枠を取る。取れたら 0、取れなければ待つべき秒数 (複数の limiter から空いている方を選ぶ key_pool 用)"""
+        return self._try_acquire(est_tokens, priority)
+
+    def add_waiter(self, priority: int):
+        """priority の呼び出しが枠を待ち始めた (これより優先度の低い呼び出しは枠を譲る)"""
+        with self._lock:
+            self._waiting[priority] = self._waiting.get(priority, 0) + 1
+
+    def remove_waiter(self, priority: int):
+        with self._lock:
+            self._waiting[priority] -= 1
+            if not self._waiting[priority]:
+                del self._waiting[priority]
+
+    def add_wait(self, seconds: float):
+        """try_acquire で外から待った時間を waited_sec に載せる"""
+        self._add_wait(seconds)
+
+    async def acquire(self, est_tokens: int):
+        started = time.monotonic()
+        priority = current_priority()
+        self.add_waiter(priority)
+        try:
+            while True:
+                wait = self._try_acquire(est_tokens, priority)
+                if not wait:
+                    break
+                await asyncio.sleep(min(wait, 1.0))
+        finally:
+            self.remove_waiter(priority)
+        self._add_wait(time.monotonic() - started)
+
+    def acquire_sync(self, est_tokens: int):
+        started = time.monotonic()
+        priority = current_priority()
+        self.add_waiter(priority)
+        try:
+            while True:
+                wait = self._try_acquire(est_tokens, priority)
+                if not wait:
+                    break
+                time.sleep(min(wait, 1.0))
+        finally:
+            self.remove_waiter(priority)
+        self._add_wait(time.monotonic() - started)
+
+    def _add_wait(self, seconds: float):
+        with self._lock:
+            self._stats["waited_sec"] += seconds
+
+    def release(self, kind: Optional[str] = None, est_tokens: int = 0, actual_tokens: int = 0):
+        """呼び出し終了時に必ず呼ぶ。kind=None は成功"""
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - 1)
+            if kind is None:
+                self._stats["successes"] += 1
+                self._limit = min(self.max_concurrency, self._limit + 1.0 / max(self._limit, 1.0))
+            else:
+                self._stats[kind] = self._stats.get(kind, 0) + 1
+                if kind in (RATE_LIMIT, TRANSIENT):
+                    self._limit = max(self.min_concurrency, self._limit / 2)
+        if actual_tokens:
+            self.tokens.adjust(actual_tokens - est_tokens)
+        if kind == RATE_LIMIT:
+            self.requests.drain()
+
+    def record_retry(self):
+        with self._lock:
+            self._stats["retries"] += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self._stats["timeouts"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "concurrency_limit": int(self._limit), "in_flight": self._in_flight}
+
+
+_limiters: Dict[str, AdaptiveRateLimiter] = {}
+_limiters_lock = Lock()
+
+
+def get_limiter(name: str = "default") -> AdaptiveRateLimiter:
+    """プロセス共有の limiter (name ごとに1つ)"""
+    with _limiters_lock:
+        if name not in _limiters:
+            _limiters[name] = AdaptiveRateLimiter()
+        return _limiters[name]
+
+
+def set_limiter(limiter: AdaptiveRateLimiter, name: str = "default"):
+    """共有 limiter を差し替える (ベンチマークで同時実行数を条件ごとに揃える用)"""
+    with _limiters_lock:
+        _limiters[name] = limiter
+
+
+def reset_limiters():
+    """全 limiter を破棄する (次の get_limiter で設定値から作り直す。ベンチマークの条件揃え用)"""
+    with _limiters_lock:
+        _limiters.clear()
+
+
+def _prompt_text(inputs: Any) -> str:
+    if isinstance(inputs, str):
+        return inputs
+    if hasattr(inputs, "to_string"):
+        return inputs.to_string()
+    if isinstance(inputs, (list, tuple)):
+        return "\n".join(_prompt_text(v) for v in inputs)
+    if isinstance(inputs, dict):
+        return str(inputs.get("text", ""))
+    content = getattr(inputs, "content", None)
+    if content is not None:
+        return _prompt_text(content)
+    return str(inputs)
+
+
+def usage_tokens(response: Any) -> int:
+    """応答の実績トークン (入力 + 出力)。TPM バケットの精算に使う"""
+    usage = getattr(response, "usage_metadata", None) or {}
+    return (usage.get("input_tokens", 0) or 0) + (usage.get("output_tokens", 0) or 0)
+
+
+class RateLimitedChatModel:
+    """
+    チャットモデルのラッパー。invoke / ainvoke を共有 limiter + リトライポリシー経由にする。
+    rate_limit / transient は指数バックオフで再試行し、fatal はそのまま送出する。
+    ainvoke は1回ごとに timeout 秒の期限を付け、超えたら transient として再試行する
+    (invoke の期限はクライアント側の timeout 設定 = llm_pool で渡す GEMINI_CALL_TIMEOUT に任せる)。
+    それ以外の属性 (model, temperature など) は元のモデルに委譲する。
+    """
+
+    def __init__(
+        self,
+        llm: Any,
+        limiter: Optional[AdaptiveRateLimiter] = None,
+        policy: RetryPolicy = DEFAULT_RETRY_POLICY,
+        timeout: float = GEMINI_CALL_TIMEOUT,
+    ):
+        self._llm = llm
+        self._limiter = limiter or get_limiter()
+        self._policy = policy
+        self._timeout = timeout
+
+    def __getattr__(self, name):
+        return getattr(self._llm, name)
+
+    @property
+    def limiter(self) -> AdaptiveRateLimiter:
+        return self._limiter
+
+    def _estimate(self, inputs: Any) -> int:
+        return estimate_tokens(_prompt_text(inputs)) + EXPECTED_OUTPUT_TOKENS
+
+    async def ainvoke(self, inputs: Any, *args, **kwargs):
+        est = self._estimate(inputs)
+        attempt = 0
+        while True:
+            await self._limiter.acquire(est)
+            try:
+                call = self._llm.ainvoke(inputs, *args, **kwargs)
+                response = await (asyncio.wait_for(call, self._timeout) if self._timeout else call)
+            except asyncio.CancelledError:
+                self._limiter.release(CANCELLED, est)
+                raise
+            except Exception as e:
+                if isinstance(e, (asyncio.TimeoutError, TimeoutError)):
+                    self._limiter.record_timeout()
+                kind = classify_error(e)
+                self._limiter.release(kind, est)
+                if kind not in (RATE_LIMIT, TRANSIENT) or not self._policy.should_retry(kind, attempt):
+                    raise
+                self._limiter.record_retry()
+                await asyncio.sleep(self._policy.backoff(attempt))
+                attempt += 1
+                continue
+            self._limiter.release(None, est, usage_tokens(response))
+            return response
+
+    def invoke(self, inputs: Any, *args, **kwargs):
+        est = self._estimate(inputs)
+        attempt = 0
+        while True:
+            self._limiter.acquire_sync(est)
+            try:
+                response = self._llm.invoke(inputs, *args, **kwargs)
+            except Exception as e:
+                if isinstance(e, (asyncio.TimeoutError, TimeoutError)):
+                    self._limiter.record_timeout()
+                kind = classify_error(e)
+                self._limiter.release(kind, est)
+                if kind not in (RATE_LIMIT, TRANSIENT) or not self._policy.should_retry(kind, attempt):
+                    raise
+                self._limiter.record_retry()
+                time.sleep(self._policy.backoff(attempt))
+                attempt += 1
+                continue
+            self._limiter.release(None, est, usage_tokens(response))
+            return response
+
+
+def with_rate_limit(llm: Any, limiter: Optional[AdaptiveRateLimiter] = None, timeout: float = GEMINI_CALL_TIMEOUT) -> Any:
+    return RateLimitedChatModel(llm, limiter, timeout=timeout)
@@ -0,0 +1,178 @@
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Sequence, Tuple
+
+# 全タスク (item × 言語) で共有するグローバル同時実行数
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("TRANSLATE_MAX_CONCURRENCY", "8"))
+
+# (key, コルーチン生成関数) のペア。生成関数はワーカーが取り出した時点で呼ばれる
+Job = Tuple[Hashable, Callable[[], Awaitable[Any]]]
+
+# on_complete(key, result, done, total)
+CompletionCallback = Callable[[Hashable, Any, int, int], None]
+
+
+async def iter_bounded(
+    jobs: Iterable[Job],
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+) -> AsyncIterator[Tuple[Hashable, Any, Dict[str, float]]]:
+    """
+    全ジョブを1本のワークキューに積み、max_concurrency 本のワーカーで消化しながら、
+    完了した順に (key, result, timings) を yield する。
+
+    timings:
+        queued_sec: キュー投入からワーカーが取り出すまでの待ち時間
+        run_sec   : 実行時間
+        since_start_sec: 全体の開始から完了までの経過時間
+    例外は result としてそのまま返す。途中で break された場合は残りのワーカーをキャンセルする。
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+
+    total = queue.qsize()
+    if total == 0:
+        return
+
+    started = time.monotonic()
+    done_queue: asyncio.Queue = asyncio.Queue()
+
+    async def worker():
+        while True:
+            try:
+                key, factory = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            picked = time.monotonic()
+            try:
+                result = await factory()
+            except Exception as e:
+                result = e
+            finished = time.monotonic()
+            timings = {
+                "queued_sec": picked - started,
+                "run_sec": finished - picked,
+                "since_start_sec": finished - started,
+            }
+            done_queue.put_nowait((key, result, timings))
+
+    n_workers = max(1, min(max_concurrency, total))
+    workers = [asyncio.ensure_future(worker()) for _ in range(n_workers)]
+    try:
+        for _ in range(total):
+            yield await done_queue.get()
+    finally:
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+async def run_bounded(
+    jobs: Iterable[Job],
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    on_complete: Optional[CompletionCallback] = None,
+) -> Dict[Hashable, Any]:
+    """
+    全ジョブを1本のワークキューに積み、max_concurrency 本のワーカーで消化する。
+
+    言語ごとに gather を直列に回すと「最も遅い1件」を言語数ぶん待つことになるため、
+    全体のスループットで律速されるよう、タスクを平坦化して共有キューから取り出す。
+
+    Args:
+        jobs: (key, factory) のリスト。factory は引数なしでコルーチンを返す関数
+        max_concurrency: 同時に実行するタスク数の上限
+        on_complete: 1タスク完了ごとに呼ばれるコールバック (同じイベントループのスレッドで実行)
+
+    Returns:
+        Dict[key, result]: 各ジョブの結果。例外はそのまま値として格納する
+    """
+    jobs = list(jobs)
+    total = len(jobs)
+    results: Dict[Hashable, Any] = {}
+    done = 0
+    async for key, result, _timings in iter_bounded(jobs, max_concurrency):
+        results[key] = result
+        done += 1
+        if on_complete:
+            try:
+                on_complete(key, result, done, total)
+            except Exception as e:
+                print(f"[Scheduler] on_complete callback failed: {e}")
+    return results
+
+
+@dataclass
+class PipelineStage:
+    """
+    iter_pipeline の1段。run(key, value) は前段の結果 (1段目は入力) を受け取って次段へ渡す値を返す。
+    concurrency: この段で同時に処理する item 数
+    queue_size: この段の入力待ちに積める item 数 (既定は concurrency)。満杯なら前段のワーカーが待つ (背圧)
+    """
+    name: str
+    run: Callable[[Hashable, Any], Awaitable[Any]]
+    concurrency: int = DEFAULT_MAX_CONCURRENCY
+    queue_size: Optional[int] = None
+
+
+async def iter_pipeline(
+    items: Iterable[Tuple[Hashable, Any]],
+    stages: Sequence[PipelineStage],
+) -> AsyncIterator[Tuple[Hashable, str, Any, Dict[str, float]]]:
+    """
+    item ごとのデータフロー実行。各 item は前の段が終わった時点で (他の item を待たずに) 次の段へ進む。
+    段ごとに concurrency 本のワーカーと有限の入力キューを持つので、遅い段の手前に item が溜まりすぎない。
+    全 item が1段ずつ揃うのを待つ (段の間にバリアがある) 実行と比べ、全体の所要時間は
+    「段ごとの所要時間の合計」ではなく「1 item の段の連なりのうち一番長いもの」に近づく。
+
+    (key, stage_name, result, timings) を完了順に yield する。timings は iter_bounded と同じ
+    (queued_sec はその段の入力キューで待った時間)。例外は result としてそのまま返し、その item は次の段へ進めない。
+    途中で break された場合は残りのワーカーをキャンセルする。
+    """
+    items = list(items)
+    if not items or not stages:
+        return
+
+    started = time.monotonic()
+    queues = [asyncio.Queue(maxsize=max(1, stage.queue_size or stage.concurrency)) for stage in stages]
+    done_queue: asyncio.Queue = asyncio.Queue()
+
+    async def feeder():
+        for key, value in items:
+            await queues[0].put((key, value, time.monotonic()))
+
+    async def worker(n: int):
+        stage = stages[n]
+        while True:
+            key, value, enqueued = await queues[n].get()
+            picked = time.monotonic()
+            try:
+                result = await stage.run(key, value)
+            except Exception as e:
+                result = e
+            finished = time.monotonic()
+            timings = {
+                "queued_sec": picked - enqueued,
+                "run_sec": finished - picked,
+                "since_start_sec": finished - started,
+            }
+            last = n + 1 == len(stages) or isinstance(result, Exception)
+            done_queue.put_nowait((key, stage.name, result, timings, last))
+            if not last:
+                # 次の段のキューが満杯ならここで待つ (この段のワーカーが空くまで新しい item を取らない)
+                await queues[n + 1].put((key, result, time.monotonic()))
+
+    tasks = [asyncio.ensure_future(feeder())]
+    for n, stage in enumerate(stages):
+        tasks += [asyncio.ensure_future(worker(n)) for _ in range(max(1, min(stage.concurrency, len(items))))]
+    try:
+        remaining = len(items)
+        while remaining:
+            key, name, result, timings, last = await done_queue.get()
+            remaining -= int(last)
+            yield key, name, result, timings
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
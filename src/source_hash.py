@@ -0,0 +1,64 @@
+import hashlib
+import json
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from .dedup import canonical_key
+from .langchain_utils import PROMPT_VERSION
+from .models import MenuItem
+
+# --------------------------------------------------------------------
+# Source Hash (incremental re-translation)
+# --------------------------------------------------------------------
+# 翻訳元の日本語 (正規化済みの title / content)・ペルソナ・プロンプト版から短いハッシュを作り、
+# 翻訳結果 (MenuItem.source_hash / menu_master の translations) にはそれを作ったときのハッシュを残す。
+# 再実行時はハッシュが今の翻訳元と一致する (item, 言語) を作り直さずに再利用し、変わった分だけ生成する。
+# 150件のメニューで2件の説明を直したら、生成するのはその2件 × 言語数だけになる。
+
+HASH_LENGTH = 16
+
+
+def source_hash(item: MenuItem, persona: str = "標準 (丁寧)", prompt_version: str = PROMPT_VERSION) -> str:
+    """翻訳元 item のハッシュ (表記ゆれ・空白の違いは dedup.canonical_key と同じく無視する)"""
+    payload = json.dumps([*canonical_key(item), persona, prompt_version], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:HASH_LENGTH]
+
+
+def source_hashes(items: Sequence[MenuItem], persona: str = "標準 (丁寧)", prompt_version: str = PROMPT_VERSION) -> List[str]:
+    return [source_hash(item, persona, prompt_version) for item in items]
+
+
+def is_fresh(result: Optional[MenuItem], expected_hash: str) -> bool:
+    """result が今の翻訳元 (expected_hash) から作られた有効な結果か"""
+    return bool(
+        result is not None
+        and result.is_translated
+        and expected_hash
+        and result.source_hash == expected_hash
+    )
+
+
+def fresh_results(
+    hashes: Sequence[str],
+    results: Dict[str, Sequence[Optional[MenuItem]]],
+) -> Dict[Tuple[str, int], MenuItem]:
+    """
+    {key: [MenuItem or None]} (key は言語名、または前段の "cleanup" / "ja_to_en") のうち、
+    ハッシュが今の翻訳元と一致して再利用できる (key, item_index) -> MenuItem
+    """
+    fresh = {}
+    for key, items in results.items():
+        for idx, result in enumerate(list(items)[: len(hashes)]):
+            if is_fresh(result, hashes[idx]):
+                fresh[(key, idx)] = result
+    return fresh
+
+
+def unchanged_items(fresh: Iterable[Tuple[str, int]], keys: Sequence[str], total: int) -> List[int]:
+    """keys (言語・前段) が全部再利用できる = 何も生成しない item の位置"""
+    fresh = set(fresh)
+    return [idx for idx in range(total) if all((key, idx) in fresh for key in keys)]
+
+
+def stale_keys(fresh: Set[Tuple[str, int]], keys: Sequence[str], idx: int) -> List[str]:
+    """item idx で作り直しが必要な keys"""
+    return [key for key in keys if (key, idx) not in fresh]
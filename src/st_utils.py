@@ -1,5 +1,8 @@
 import streamlit as st
 
+from .translation_jobs import JOBS_DIR, jobs_signature, list_jobs
+from .translation_planner import plan_translation
+
 # サイドバーでログイン
 def login():
     supabase = st.session_state["supabase"]
@@ -47,6 +50,21 @@ def get_gemini_api_key():
         st.error(f"APIキーの取得中にエラーが発生しました: {e}")
         return ""
 
+def get_gemini_api_keys():
+    """
+    supabaseからキープール用の追加キー (app_data.gemini_api_keys, カンマ区切り) を取得する
+    列が無い環境では空リスト
+    """
+    supabase = st.session_state["supabase"]
+    try:
+        response = supabase.table("app_data").select("gemini_api_keys").eq("id", 1).execute()
+        if response.data and len(response.data) > 0:
+            raw = response.data[0].get("gemini_api_keys") or ""
+            return [k.strip() for k in raw.split(",") if k.strip()]
+        return []
+    except Exception:
+        return []
+
 def set_gemini_api_key(new_key:str):
     """
     supabaseにgemini_api_keyを設定する
@@ -56,4 +74,26 @@ def set_gemini_api_key(new_key:str):
         supabase.table("app_data").update({"gemini_api_key": new_key}).eq("id", 1).execute()
         st.success("Gemini APIキーを更新しました")
     except Exception as e:
-        st.error(f"Gemini APIキーの更新中にエラーが発生しました: {e}")
\ No newline at end of file
+        st.error(f"Gemini APIキーの更新中にエラーが発生しました: {e}")
+
+
+# --- 再実行 (rerun) ごとに計算し直さない表示用の値 ---
+# Streamlit はウィジェットを触るたびにスクリプト全体を再実行するので、見積もりとジョブ一覧は入力が同じならキャッシュを返す
+
+@st.cache_data(show_spinner=False, ttl=60, max_entries=32)
+def cached_plan_translation(menu_items, languages, api_key=None, **options):
+    """
+    plan_translation の結果を引数 (item・言語・生成方式・skip など) ごとにキャッシュする。
+    LLM キャッシュの中身や QC の監査率は引数に出ないので ttl で作り直す
+    """
+    return plan_translation(menu_items, list(languages), api_key=api_key, **options)
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _list_jobs(signature, jobs_dir, filter_items):
+    return list_jobs(jobs_dir, **dict(filter_items))
+
+
+def cached_list_jobs(jobs_dir: str = JOBS_DIR, **extra_filter):
+    """list_jobs をジャーナルが変わるまで (jobs_signature が同じ間) キャッシュする"""
+    return _list_jobs(jobs_signature(jobs_dir), jobs_dir, tuple(sorted(extra_filter.items())))
@@ -0,0 +1,130 @@
+import json
+import os
+from threading import Lock
+from typing import Any, Dict, Optional
+
+from pydantic import TypeAdapter
+
+from .token_estimator import estimate_tokens
+
+# --------------------------------------------------------------------
+# Structured Output (native JSON schema mode)
+# --------------------------------------------------------------------
+# 従来はプロンプトに出力形式の説明 (get_format_instructions() など) を埋め込んでいた。
+# LLM_STRUCTURED_OUTPUT=1 では代わりに pydantic モデルから作った JSON スキーマを
+# response_mime_type="application/json" + response_json_schema で渡し、プロンプトには短い一文だけ残す。
+# どちらの経路でもステージごとに「送った入力トークン」と「パース失敗」を数え、差を比べられるようにする。
+
+STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "0") == "1"
+
+INSTRUCTIONS = "instructions"
+SCHEMA = "schema"
+# スキーマ経路のプロンプトは prompt_registry に "<name>.schema" で登録する
+SCHEMA_PROMPT_SUFFIX = ".schema"
+
+_stats_lock = Lock()
+_stats: Dict[str, Dict[str, Dict[str, int]]] = {}
+_formats: Dict[str, "OutputFormat"] = {}
+
+
+def _compact(schema: Any, in_properties: bool = False) -> Any:
+    """pydantic が付ける "title" / "default" を落とす (同名のプロパティは残す)。送るトークンを減らすため"""
+    if isinstance(schema, dict):
+        return {
+            key: _compact(value, key == "properties")
+            for key, value in schema.items()
+            if in_properties or key not in ("title", "default")
+        }
+    if isinstance(schema, list):
+        return [_compact(value) for value in schema]
+    return schema
+
+
+def use_schema(structured: Optional[bool] = None) -> bool:
+    """structured を省略したら LLM_STRUCTURED_OUTPUT (呼び出し時のモジュール変数) に従う"""
+    return STRUCTURED_OUTPUT if structured is None else structured
+
+
+class OutputFormat:
+    """
+    1ステージぶんの出力形式。
+    - instructions: 従来経路でプロンプトに埋め込む形式の説明
+    - schema_note: スキーマ経路で instructions の代わりに埋め込む短い指示
+    - shape: 出力の型 (pydantic モデル、List[...] / Dict[str, ...] も可)。JSON スキーマはここから作る
+    """
+
+    def __init__(self, stage: str, shape: Any, instructions: str, schema_note: str = ""):
+        self.stage = stage
+        self.schema = _compact(TypeAdapter(shape).json_schema())
+        self.instructions = instructions.strip()
+        self.schema_note = schema_note.strip()
+        # スキーマはプロンプトとは別に送るが、入力トークンとしては数えられる
+        self.schema_tokens = estimate_tokens(json.dumps(self.schema, ensure_ascii=False, separators=(",", ":")))
+        # スキーマ経路に切り替えたとき1呼び出しで減る入力トークン (負なら増える)
+        self.tokens_saved = estimate_tokens(self.instructions) - estimate_tokens(self.schema_note) - self.schema_tokens
+        _formats[stage] = self
+
+    def prompt_text(self, structured: Optional[bool] = None) -> str:
+        return self.schema_note if use_schema(structured) else self.instructions
+
+    def invoke_kwargs(self, structured: Optional[bool] = None) -> Dict[str, Any]:
+        """ainvoke / invoke に渡す追加引数 (ChatGoogleGenerativeAI が generation_config に載せる)"""
+        if not use_schema(structured):
+            return {}
+        return {"response_mime_type": "application/json", "response_json_schema": self.schema}
+
+    def record(self, structured: Optional[bool], prompt_tokens: int, ok: bool):
+        """
+        1応答ぶんを集計する。prompt_tokens はプロンプト本文の推定トークン (スキーマ経路ならスキーマぶんをここで足す)。
+        ok=False は修復しても期待した形 (キー・件数) で読めなかった応答。
+        """
+        structured = use_schema(structured)
+        sent = prompt_tokens + (self.schema_tokens if structured else 0)
+        baseline = sent + (self.tokens_saved if structured else 0)
+        with _stats_lock:
+            s = _stats.setdefault(self.stage, {}).setdefault(SCHEMA if structured else INSTRUCTIONS, {
+                "calls": 0, "parse_failures": 0, "prompt_tokens": 0, "baseline_tokens": 0,
+            })
+            s["calls"] += 1
+            s["parse_failures"] += int(not ok)
+            s["prompt_tokens"] += sent
+            s["baseline_tokens"] += baseline
+
+
+def schema_tokens(prompt_name: str) -> int:
+    """prompt_registry の名前が "<stage>.schema" なら、一緒に送るスキーマの推定トークン"""
+    if not prompt_name.endswith(SCHEMA_PROMPT_SUFFIX):
+        return 0
+    fmt = _formats.get(prompt_name[: -len(SCHEMA_PROMPT_SUFFIX)])
+    return fmt.schema_tokens if fmt else 0
+
+
+def get_structured_stats() -> Dict[str, dict]:
+    """
+    {stage: {instructions: {...}, schema: {...}, tokens_saved_per_call, token_reduction, parse_failure_rate_delta}}
+    各経路: calls, parse_failures, prompt_tokens (スキーマ込み), baseline_tokens (従来経路なら送っていた量),
+    avg_prompt_tokens, parse_failure_rate。
+    token_reduction は従来経路に対する1呼び出しあたりの入力トークン削減率、
+    parse_failure_rate_delta は (スキーマ経路 - 従来経路) のパース失敗率 (両方の実績があるときだけ)。
+    """
+    with _stats_lock:
+        stats = {stage: {mode: dict(s) for mode, s in modes.items()} for stage, modes in _stats.items()}
+    for stage, modes in stats.items():
+        for s in modes.values():
+            s["avg_prompt_tokens"] = s["prompt_tokens"] / s["calls"] if s["calls"] else 0.0
+            s["parse_failure_rate"] = s["parse_failures"] / s["calls"] if s["calls"] else 0.0
+        fmt = _formats.get(stage)
+        schema, instructions = modes.get(SCHEMA), modes.get(INSTRUCTIONS)
+        modes["tokens_saved_per_call"] = fmt.tokens_saved if fmt else 0
+        modes["token_reduction"] = (
+            1.0 - schema["prompt_tokens"] / schema["baseline_tokens"] if schema and schema["baseline_tokens"] else 0.0
+        )
+        modes["parse_failure_rate_delta"] = (
+            schema["parse_failure_rate"] - instructions["parse_failure_rate"] if schema and instructions else None
+        )
+    return stats
+
+
+def reset_structured_stats():
+    with _stats_lock:
+        _stats.clear()
@@ -0,0 +1,47 @@
+import re
+from typing import Callable, List, Sequence, TypeVar
+
+T = TypeVar("T")
+
+# Gemini系トークナイザのざっくり近似
+# - CJK (かな・漢字・ハングル) : ほぼ 1文字 = 1トークン
+# - それ以外 (英数字・記号)     : 約 4文字 = 1トークン
+_CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff66-\uff9f]")
+ASCII_CHARS_PER_TOKEN = 4.0
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    ローカルでトークン数を概算する (API呼び出しなし)。
+    バッチ分割やコスト見積もりなど、厳密さより速さが必要な用途向け。
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    other = len(text) - cjk
+    return cjk + int(other / ASCII_CHARS_PER_TOKEN + 0.5)
+
+
+def split_by_token_budget(
+    items: Sequence[T],
+    cost_fn: Callable[[T], int],
+    token_budget: int,
+    max_items: int,
+) -> List[List[T]]:
+    """
+    順序を保ったまま、合計コストが token_budget 以内 / 件数が max_items 以内になるよう貪欲に分割する。
+    1件で予算を超えるものは単独のバッチにする。
+    """
+    batches: List[List[T]] = []
+    current: List[T] = []
+    current_cost = 0
+    for item in items:
+        cost = cost_fn(item)
+        if current and (current_cost + cost > token_budget or len(current) >= max_items):
+            batches.append(current)
+            current, current_cost = [], 0
+        current.append(item)
+        current_cost += cost
+    if current:
+        batches.append(current)
+    return batches
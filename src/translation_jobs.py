@@ -0,0 +1,384 @@
+import json
+import os
+import time
+import uuid
+from dataclasses import asdict
+from threading import Lock
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from .langchain_utils import translate_english_to_many_stream
+from .language_priority import publishable_languages
+from .models import MenuItem, TranslationEvent, TRANSLATION_PENDING
+from .observability import flush_key_usage
+from .scheduler import DEFAULT_MAX_CONCURRENCY
+from .translation_pipeline import CLEANUP, CLEANUP_EN, JA_TO_EN, TRANSCREATION, translate_pipeline_stream, validate_stages
+
+# --------------------------------------------------------------------
+# Configuration
+# --------------------------------------------------------------------
+JOBS_DIR = os.getenv("TRANSLATION_JOBS_DIR", os.path.join(".cache", "jobs"))
+
+# ジョブ状態
+RUNNING = "running"
+CANCELLED = "cancelled"
+COMPLETED = "completed"
+
+
+class TranslationJob:
+    """
+    多言語翻訳ジョブ (追記専用 JSONL ジャーナル付き)
+
+    ジャーナル ({JOBS_DIR}/{job_id}.jsonl) の各行:
+        {"type": "job", ...}     : 1行目。入力 item・言語・engine_mode・前段ステージ
+        {"type": "result", ...}  : (item, 言語) が1つ完了するごとに追記 (前段の結果は stage 付き)
+        {"type": "publish", ...} : 言語の全件がエラー無しで揃い、公開できるようになった時点
+        {"type": "status", ...}  : cancelled / completed
+    再開時はジャーナルを読み直し、完了済みの (item, 言語) を飛ばして残りだけ実行する。
+    エラー結果は完了扱いにしない (再開時にやり直す)。
+    キャンセルは別セッションからでも効くよう {job_id}.cancel フラグファイルで伝える。
+
+    stages (前段) を指定したジョブは menu_items を日本語の原文とみなし、校正・英訳から多言語までを
+    item ごとのパイプライン (translation_pipeline) で実行する。前段の結果もジャーナルに残るので再開時は飛ばす。
+    stages が空なら従来どおり menu_items (英語) から多言語だけを実行する。
+
+    source_hashes (item ごとの翻訳元ハッシュ, source_hash.py) を渡すと、全ての結果にその item のハッシュを付ける。
+    reuse に前回の結果 (ハッシュが一致したもの) を渡すと完了済みとしてジャーナルに書き、生成しない。
+
+    language_weights ({言語: 重み}, language_priority.language_weights) の大きい言語から実行し、
+    言語ごとに全件揃った時点で公開可能 (published_languages) として記録する。
+    """
+
+    def __init__(self, job_id: str, jobs_dir: str = JOBS_DIR):
+        self.job_id = job_id
+        self.jobs_dir = jobs_dir
+        self.path = os.path.join(jobs_dir, f"{job_id}.jsonl")
+        self._cancel_path = os.path.join(jobs_dir, f"{job_id}.cancel")
+        self._lock = Lock()
+        self.menu_items: List[MenuItem] = []
+        self.languages: List[str] = []
+        self.engine_mode = "per_item"
+        self.stages: List[str] = []
+        self.transcreation_source = JA_TO_EN
+        self.source_hashes: List[str] = []
+        self.language_weights: Dict[str, float] = {}
+        self.extra: dict = {}
+        self.created_at = 0.0
+        self._status = RUNNING
+        self._results: Dict[Tuple[str, int], MenuItem] = {}
+        self._stage_results: Dict[Tuple[str, int], MenuItem] = {}
+        self._reused: set = set()
+        self._published: Dict[str, float] = {}
+
+    @classmethod
+    def create(
+        cls,
+        menu_items: List[MenuItem],
+        languages: List[str],
+        engine_mode: str = "per_item",
+        extra: Optional[dict] = None,
+        job_id: Optional[str] = None,
+        jobs_dir: str = JOBS_DIR,
+        stages: Sequence[str] = (),
+        source_hashes: Optional[Sequence[str]] = None,
+        reuse: Optional[Dict[Tuple[str, int], MenuItem]] = None,
+        language_weights: Optional[Dict[str, float]] = None,
+        transcreation_source: str = JA_TO_EN,
+    ) -> "TranslationJob":
+        """
+        新しいジョブを作成してジャーナルのヘッダを書く。
+        extra には呼び出し側で再開時に必要な情報 (store_id, DB の行 id など) を入れる。
+        stages: 多言語の前に item ごとに流す段 (例: ("cleanup", "ja_to_en"))。空なら menu_items は英語
+        source_hashes: menu_items と同じ長さの翻訳元ハッシュ
+        reuse: 再利用する結果 {(言語 or "cleanup" / "ja_to_en", item_index): MenuItem}
+        language_weights: 言語の優先度 (省略時は language_priority の既定 + 環境変数)
+        transcreation_source: stages があるときに多言語へ渡す前段の出力 ("ja_to_en" = 英訳 / "cleanup" = 校正済み日本語)
+        """
+        if stages:
+            validate_stages(tuple(stages) + (TRANSCREATION,))
+        os.makedirs(jobs_dir, exist_ok=True)
+        job = cls(job_id or time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6], jobs_dir)
+        if os.path.exists(job.path):
+            raise FileExistsError(f"Job already exists: {job.job_id}")
+        job.menu_items = list(menu_items)
+        job.languages = list(languages)
+        job.engine_mode = engine_mode
+        job.stages = list(stages)
+        job.transcreation_source = transcreation_source
+        job.source_hashes = list(source_hashes or [])
+        job.language_weights = dict(language_weights or {})
+        job.extra = dict(extra or {})
+        job.created_at = time.time()
+        job._append({
+            "type": "job",
+            "job_id": job.job_id,
+            "created_at": job.created_at,
+            "engine_mode": engine_mode,
+            "stages": job.stages,
+            "transcreation_source": job.transcreation_source,
+            "source_hashes": job.source_hashes,
+            "language_weights": job.language_weights,
+            "languages": job.languages,
+            "items": [asdict(item) for item in job.menu_items],
+            "extra": job.extra,
+        })
+        for (key, idx), item in (reuse or {}).items():
+            stage = key if key in (CLEANUP, JA_TO_EN) else TRANSCREATION
+            if stage == TRANSCREATION and key not in job.languages:
+                continue
+            job.record(TranslationEvent(
+                item_index=idx,
+                item_id=job.menu_items[idx].id,
+                lang=key,
+                result=item,
+                timings={},
+                done=0,
+                total=job.total,
+                stage=stage,
+            ), reused=True)
+        # 前回の結果だけで揃った言語は最初から公開できる
+        job._publish_ready()
+        return job
+
+    @classmethod
+    def load(cls, job_id: str, jobs_dir: str = JOBS_DIR) -> "TranslationJob":
+        job = cls(job_id, jobs_dir)
+        if not os.path.exists(job.path):
+            raise FileNotFoundError(f"Job not found: {job_id}")
+        job._replay()
+        return job
+
+    def _replay(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 書き込み途中で落ちた最終行は無視する
+                    continue
+                kind = record.get("type")
+                if kind == "job":
+                    self.menu_items = [MenuItem(**item) for item in record.get("items", [])]
+                    self.languages = record.get("languages", [])
+                    self.engine_mode = record.get("engine_mode", "per_item")
+                    self.stages = record.get("stages", [])
+                    self.transcreation_source = record.get("transcreation_source", JA_TO_EN)
+                    self.source_hashes = record.get("source_hashes", [])
+                    self.language_weights = record.get("language_weights", {})
+                    self.extra = record.get("extra", {})
+                    self.created_at = record.get("created_at", 0.0)
+                elif kind == "result":
+                    stage = record.get("stage", TRANSCREATION)
+                    if record.get("reused"):
+                        self._reused.add((record["lang"] if stage == TRANSCREATION else stage, record["item_index"]))
+                    if stage == TRANSCREATION:
+                        self._results[(record["lang"], record["item_index"])] = MenuItem(**record["result"])
+                    else:
+                        self._stage_results[(stage, record["item_index"])] = MenuItem(**record["result"])
+                elif kind == "publish":
+                    self._published[record["lang"]] = record.get("at", 0.0)
+                elif kind == "status":
+                    self._status = record.get("status", RUNNING)
+
+    def _append(self, record: dict):
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+
+    def _set_status(self, status: str):
+        self._status = status
+        self._append({"type": "status", "status": status, "at": time.time()})
+
+    def record(self, event: TranslationEvent, reused: bool = False):
+        if event.item_index < len(self.source_hashes) and event.result.is_translated:
+            event.result.source_hash = self.source_hashes[event.item_index]
+        if reused:
+            self._reused.add((event.lang if event.stage == TRANSCREATION else event.stage, event.item_index))
+        if event.stage == TRANSCREATION:
+            self._results[(event.lang, event.item_index)] = event.result
+        else:
+            self._stage_results[(event.stage, event.item_index)] = event.result
+        self._append({
+            "type": "result",
+            "stage": event.stage,
+            "lang": event.lang,
+            "item_index": event.item_index,
+            "item_id": event.item_id,
+            "result": asdict(event.result),
+            "timings": event.timings,
+            **({"reused": True} if reused else {}),
+        })
+
+    def _publish_ready(self) -> List[str]:
+        """公開可能になったのにまだ記録していない言語を記録して返す"""
+        newly = [lang for lang in publishable_languages(self.results()) if lang not in self._published]
+        for lang in newly:
+            self._published[lang] = time.time()
+            self._append({"type": "publish", "lang": lang, "at": self._published[lang]})
+        return newly
+
+    def published_languages(self) -> List[str]:
+        """公開可能になった言語 (なった順)"""
+        return sorted(self._published, key=self._published.get)
+
+    @property
+    def total(self) -> int:
+        return len(self.menu_items) * len(self.languages)
+
+    def completed_tasks(self) -> set:
+        """翻訳済みの (lang, item_index)。エラーと翻訳待ち (TRANSLATION_PENDING) は再開時に作り直す"""
+        return {key for key, item in self._results.items() if item.is_translated}
+
+    def unchanged_items(self) -> List[int]:
+        """前回の結果を全言語 (と前段) で再利用した = 今回何も生成しない item の位置"""
+        keys = list(self.languages) + [out for out in (CLEANUP, JA_TO_EN) if out in self._expected_outputs()]
+        return [idx for idx in range(len(self.menu_items)) if all((key, idx) in self._reused for key in keys)]
+
+    def _expected_outputs(self) -> set:
+        if CLEANUP_EN in self.stages:
+            return {CLEANUP, JA_TO_EN}
+        return set(self.stages)
+
+    def stage_results(self, stage: str) -> List[Optional[MenuItem]]:
+        """前段 stage ("cleanup" / "ja_to_en") の結果 (未完了・失敗は None)。前段の無いジョブの ja_to_en は menu_items"""
+        if stage == JA_TO_EN and not self.stages:
+            return list(self.menu_items)
+        out: List[Optional[MenuItem]] = [None] * len(self.menu_items)
+        for (name, idx), item in self._stage_results.items():
+            if name == stage and idx < len(self.menu_items) and item.status != "error":
+                out[idx] = item
+        return out
+
+    def results(self) -> Dict[str, List[Optional[MenuItem]]]:
+        """{lang: [MenuItem or None]} (未完了は None)"""
+        out = {lang: [None] * len(self.menu_items) for lang in self.languages}
+        for (lang, idx), item in self._results.items():
+            if lang in out and idx < len(self.menu_items):
+                out[lang][idx] = item
+        return out
+
+    def status(self) -> dict:
+        done = len(self.completed_tasks())
+        errors = sum(1 for item in self._results.values() if item.status == "error")
+        pending = sum(1 for item in self._results.values() if item.status == TRANSLATION_PENDING)
+        status = self._status
+        if status == RUNNING and self.is_cancel_requested():
+            status = CANCELLED
+        return {
+            "job_id": self.job_id,
+            "status": status,
+            "engine_mode": self.engine_mode,
+            "stages": "+".join(self.stages),
+            "languages": len(self.languages),
+            "items": len(self.menu_items),
+            "done": done,
+            "reused": sum(1 for key in self._reused if key in self._results),
+            "published": len(self._published),
+            "errors": errors,
+            "pending": pending,
+            "total": self.total,
+            "created_at": self.created_at,
+        }
+
+    def cancel(self):
+        """実行中のジョブに停止を要求する (完了済みの結果はジャーナルに残る)"""
+        with open(self._cancel_path, "w", encoding="utf-8") as f:
+            f.write(str(time.time()))
+        if self._status == RUNNING:
+            self._set_status(CANCELLED)
+
+    def is_cancel_requested(self) -> bool:
+        return os.path.exists(self._cancel_path)
+
+    async def run(
+        self,
+        api_key: str,
+        persona: str = "標準 (丁寧)",
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    ) -> AsyncIterator[TranslationEvent]:
+        """
+        未完了の (item, 言語) だけを翻訳し、TranslationEvent を yield しながらジャーナルに追記する。
+        キャンセル要求を検知したらその時点で止める (実行中のリクエストは破棄)。
+        lang_done のイベントでその言語がエラー無しで揃っていれば、yield する前に公開可能として記録する。
+        """
+        if os.path.exists(self._cancel_path):
+            os.remove(self._cancel_path)
+        if self._status != RUNNING:
+            self._set_status(RUNNING)
+        # 前回の実行で揃ったまま記録できなかった言語
+        self._publish_ready()
+
+        if self.stages:
+            known = {key: item for key, item in self._stage_results.items() if item.status != "error"}
+            stream = translate_pipeline_stream(
+                self.menu_items,
+                {lang: [] for lang in self.languages},
+                api_key,
+                persona,
+                stages=tuple(self.stages) + (TRANSCREATION,),
+                engine_mode=self.engine_mode,
+                max_concurrency=max_concurrency,
+                skip=self.completed_tasks(),
+                known=known,
+                language_weights=self.language_weights or None,
+                transcreation_source=self.transcreation_source,
+            )
+        else:
+            stream = translate_english_to_many_stream(
+                self.menu_items,
+                {lang: [] for lang in self.languages},
+                api_key,
+                persona,
+                max_concurrency=max_concurrency,
+                engine_mode=self.engine_mode,
+                skip=self.completed_tasks(),
+                language_weights=self.language_weights or None,
+            )
+        try:
+            async for event in stream:
+                self.record(event)
+                if event.lang_done:
+                    self._publish_ready()
+                yield event
+                if self.is_cancel_requested():
+                    return
+        finally:
+            await stream.aclose()
+            flush_key_usage()
+
+        if len(self.completed_tasks()) == self.total:
+            self._set_status(COMPLETED)
+
+
+def jobs_signature(jobs_dir: str = JOBS_DIR) -> Tuple[Tuple[str, int, int], ...]:
+    """
+    ジャーナル・停止要求ファイルの (名前, 更新時刻, サイズ)。どれかのジョブが進む・止まると変わるので、
+    list_jobs の結果をキャッシュするときのキーにする (ジャーナルを読み直すより安い)
+    """
+    if not os.path.isdir(jobs_dir):
+        return ()
+    return tuple(sorted(
+        (entry.name, entry.stat().st_mtime_ns, entry.stat().st_size)
+        for entry in os.scandir(jobs_dir) if entry.name.endswith((".jsonl", ".cancel"))
+    ))
+
+
+def list_jobs(jobs_dir: str = JOBS_DIR, **extra_filter) -> List[dict]:
+    """
+    ジャーナルのあるジョブの status() 一覧 (新しい順)
+    extra_filter を渡すと extra の値が一致するジョブだけ返す (例: store_id=...)
+    """
+    if not os.path.isdir(jobs_dir):
+        return []
+    jobs = []
+    for name in os.listdir(jobs_dir):
+        if not name.endswith(".jsonl"):
+            continue
+        try:
+            job = TranslationJob.load(name[: -len(".jsonl")], jobs_dir)
+        except Exception as e:
+            print(f"[Jobs] Failed to load {name}: {e}")
+            continue
+        if all(job.extra.get(k) == v for k, v in extra_filter.items()):
+            jobs.append(job.status())
+    return sorted(jobs, key=lambda j: j["created_at"], reverse=True)
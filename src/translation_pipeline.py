@@ -0,0 +1,301 @@
+import json
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Set, Tuple
+
+from .dedup import copy_for_position, dedupe_items, record_dedup
+from .key_pool import shared_concurrency
+from .language_priority import prioritize_languages, priority_tiers, remaining_by_language
+from .langchain_utils import (
+    clean_and_translate_async,
+    dictionary_item,
+    remove_unnecessary_parts_async,
+    transcreation_engine,
+    translate_japanese_to_english_async,
+)
+from .menu_dictionary import record_dictionary_skip
+from .models import MenuItem, TranslationEvent
+from .rate_limiter import call_priority
+from .scheduler import DEFAULT_MAX_CONCURRENCY, PipelineStage, iter_bounded, iter_pipeline
+
+# --------------------------------------------------------------------
+# Pipelined Translation (per-item stage DAG)
+# --------------------------------------------------------------------
+# 校正 → 英訳 → 多言語を「全 item の校正が終わってから英訳、全 item の英訳が終わってから多言語」ではなく、
+# item ごとに前の段が終わった時点で次の段へ流す (scheduler.iter_pipeline)。
+# 1件目の韓国語は1件目の英訳が終わればすぐ始まり、全体の所要時間は段ごとの所要時間の合計ではなく
+# 1 item の段の連なりのうち一番長いものに近づく。
+# 段ごとに同時に処理する item 数の上限と入力キューの上限 (背圧) を持つ。実際の API 同時実行数は
+# 従来どおり rate_limiter の limiter が全段共通で抑える。
+
+CLEANUP = "cleanup"
+JA_TO_EN = "ja_to_en"
+CLEANUP_EN = "cleanup_en"
+TRANSCREATION = "transcreation"
+PIPELINE_STAGES = (CLEANUP, JA_TO_EN, CLEANUP_EN, TRANSCREATION)
+# 優先言語の後に回す残りの言語の段 (内部用。イベントの stage は transcreation)
+TRANSCREATION_REST = "transcreation_rest"
+# 残りの言語の呼び出しの limiter 上の優先度 (rate_limiter.call_priority。他の段は既定の 0)
+REST_PRIORITY = 1
+
+# 前段が出す結果 (TranslationEvent.stage) と、そのイベントの lang
+STAGE_OUTPUTS = {CLEANUP: (CLEANUP,), JA_TO_EN: (JA_TO_EN,), CLEANUP_EN: (CLEANUP, JA_TO_EN)}
+OUTPUT_LANGUAGES = {CLEANUP: "Japanese", JA_TO_EN: "English"}
+
+# 段ごとに同時に処理する item 数は固定の割り振りではなく、実行開始時の共有 limiter の枠 (key_pool.shared_concurrency) を
+# その段の 1 item あたりの呼び出し数で割って決める (stage_limits)。どの段も単独で枠を埋められるだけのワーカーを持ち、
+# 段の間の取り合いは limiter が捌く (transcreation を固定で少なくすると、前段が終わった後に枠が余る)。
+# 1 item で複数の呼び出しを出す段は、一番遅い呼び出しを待つ間に他の枠が空くので倍の item を持たせる
+
+
+def _load_stage_overrides() -> Dict[str, int]:
+    """PIPELINE_STAGE_CONCURRENCY='{"transcreation": 4}' でステージ単位に固定する"""
+    overrides: Dict[str, int] = {}
+    raw = os.getenv("PIPELINE_STAGE_CONCURRENCY")
+    if raw:
+        try:
+            for stage, limit in json.loads(raw).items():
+                overrides[stage] = max(1, int(limit))
+        except (ValueError, AttributeError, TypeError) as e:
+            print(f"[Pipeline] Ignoring invalid PIPELINE_STAGE_CONCURRENCY: {e}")
+    return overrides
+
+
+STAGE_CONCURRENCY_OVERRIDES = _load_stage_overrides()
+
+
+def pipelined_engine_mode(engine_mode: str) -> str:
+    """
+    パイプラインの transcreation 段で実際に使う生成方式。item は1件ずつ流れてくるので、
+    複数 item を1プロンプトに詰める "batched" は組めず per_item で動かす (見積もり (translation_planner) も同じ)
+    """
+    return "per_item" if engine_mode == "batched" else engine_mode
+
+
+def stage_limits(calls_per_item: Dict[str, int], budget: int, overrides: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    """
+    段ごとの同時 item 数 = budget (同時に出せる呼び出し数) / 1 item あたりの呼び出し数 (切り上げ)。
+    呼び出しが複数の段はその倍 (budget まで)。overrides の段はその値
+    """
+    limits = {
+        stage: budget if calls <= 1 else min(budget, -(-2 * budget // calls))
+        for stage, calls in calls_per_item.items()
+    }
+    limits.update({stage: limit for stage, limit in (overrides or {}).items() if stage in limits})
+    return limits
+
+
+def validate_stages(stages: Sequence[str]) -> Tuple[str, ...]:
+    """PIPELINE_STAGES の順で、cleanup_en は cleanup / ja_to_en と併用しない"""
+    stages = tuple(stages)
+    unknown = set(stages) - set(PIPELINE_STAGES)
+    if unknown:
+        raise ValueError(f"Unknown stages: {sorted(unknown)} (expected {PIPELINE_STAGES})")
+    if not stages or len(set(stages)) != len(stages) or list(stages) != sorted(stages, key=PIPELINE_STAGES.index):
+        raise ValueError(f"Stages must be a non-empty subsequence of {PIPELINE_STAGES}: {stages}")
+    if CLEANUP_EN in stages and {CLEANUP, JA_TO_EN} & set(stages):
+        raise ValueError("cleanup_en replaces cleanup + ja_to_en; do not combine them")
+    return stages
+
+
+def _checked(result: MenuItem) -> MenuItem:
+    # 既存のステージ関数は失敗をエラー MenuItem で返すので、ここで例外にして後段へ流さない
+    if result.status == "error":
+        raise RuntimeError(result.menu_content)
+    return result
+
+
+def _next_input(value: Any, prefer: str = JA_TO_EN) -> MenuItem:
+    """前段の結果 ({出力名: MenuItem}) から次段の入力を選ぶ (prefer の出力があればそれ、無ければ英訳 → 校正済み日本語)"""
+    if isinstance(value, dict):
+        return next(value[out] for out in (prefer, JA_TO_EN, CLEANUP) if out in value)
+    return value
+
+
+async def translate_pipeline_stream(
+    menu_items: List[MenuItem],
+    target_languages: Dict[str, List[MenuItem]],
+    api_key: str,
+    persona: str = "標準 (丁寧)",
+    stages: Sequence[str] = (CLEANUP, JA_TO_EN, TRANSCREATION),
+    engine_mode: str = "per_item",
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    stage_concurrency: Optional[Dict[str, int]] = None,
+    skip: Optional[Set[Tuple[str, int]]] = None,
+    known: Optional[Dict[Tuple[str, int], MenuItem]] = None,
+    language_weights: Optional[Dict[str, float]] = None,
+    transcreation_source: str = JA_TO_EN,
+) -> AsyncIterator[TranslationEvent]:
+    """
+    日本語の menu_items を stages の順に item ごとのパイプラインで処理し、完了したものから TranslationEvent を yield する。
+
+    イベント:
+        stage="cleanup" (lang="Japanese") / stage="ja_to_en" (lang="English"): 前段の結果。done / total には数えない
+        stage="transcreation": (item, 言語) の完了。translate_english_to_many_stream と同じく done / total を持つ
+    前段で失敗した item はその段のエラーイベントと、全言語ぶんのエラーイベントを出して打ち切る。
+
+    engine_mode: transcreation 段の生成方式。item が1件ずつ流れてくるので "batched" は per_item で動かす (pipelined_engine_mode)
+    max_concurrency: 全段あわせて同時に出す呼び出し数の上限 (実際は共有 limiter の枠との小さい方)。
+           transcreation 段で1 item の言語を並列に処理する数でもある
+    stage_concurrency: 段ごとに同時に処理する item 数 (省略した段は stage_limits で枠から決める)
+    skip: 実行済みとして飛ばす (lang, item_index) (ジョブ再開用)
+    known: 前段の結果が既にある (出力名, item_index) -> MenuItem。その段は呼ばずにこの値を使う
+           (イベントは同じ内容の item のうち known に無い位置の分だけ出す)
+    language_weights: 言語の優先度 (language_priority)。既定より重い言語があれば transcreation を2段に分け、
+           残りの言語の呼び出しは REST_PRIORITY で limiter に並ぶ (優先言語・前段の呼び出しが枠を待っていれば譲る)。
+           枠が空いていれば待たずに進むので、優先言語が先に全件揃いつつ、item ごとの流れは止めない。
+           multilang は全言語1リクエストが利点なので分けず、重みはプロンプト内の並びにだけ効く
+    transcreation_source: transcreation に渡す前段の出力。JA_TO_EN (英訳, Admin) か CLEANUP (校正済み日本語, main.py。
+           段ごとの実行と同じく「Item name (JP)」のプロンプトに日本語を渡す)。その出力が無い段構成なら残りの方を使う
+    """
+    stages = validate_stages(stages)
+    engine_mode = pipelined_engine_mode(engine_mode)
+    if transcreation_source not in (CLEANUP, JA_TO_EN):
+        raise ValueError(f"transcreation_source must be {CLEANUP!r} or {JA_TO_EN!r}: {transcreation_source!r}")
+    langs = prioritize_languages(target_languages.keys(), language_weights) if TRANSCREATION in stages else []
+    skip = skip or set()
+    known = known or {}
+    outputs = [out for stage in stages for out in STAGE_OUTPUTS.get(stage, ())]
+
+    # 同じ内容の item は1回だけ流し、完了時に全位置へ配る
+    unique_items, positions = dedupe_items(menu_items)
+    record_dedup("pipeline", len(menu_items), len(unique_items), tasks_per_item=len(stages) - 1 + len(langs))
+    known_u = {
+        (out, u): next(known[(out, pos)] for pos in group if (out, pos) in known)
+        for u, group in enumerate(positions) for out in outputs
+        if any((out, pos) in known for pos in group)
+    }
+
+    # 優先言語の段 (TRANSCREATION) と残りの言語の段 (TRANSCREATION_REST)
+    tiers = priority_tiers(langs, language_weights) if engine_mode != "multilang" else [langs]
+    tier_langs = {TRANSCREATION: tiers[0], TRANSCREATION_REST: tiers[1] if len(tiers) > 1 else []}
+
+    # 1 item あたりの呼び出し数 (transcreation は per_item なら言語数、multilang なら1回)
+    calls_per_item = {stage: 1 for stage in stages}
+    for stage, stage_langs in tier_langs.items():
+        if TRANSCREATION in stages and stage_langs:
+            calls_per_item[stage] = 1 if engine_mode == "multilang" else len(stage_langs)
+    limits = stage_limits(
+        calls_per_item, shared_concurrency(api_key, max_concurrency),
+        {**STAGE_CONCURRENCY_OVERRIDES, **(stage_concurrency or {})},
+    )
+
+    def pending_langs(u: int, stage: Optional[str] = None) -> List[str]:
+        """まだ済んでいない言語 (stage を渡すとその段の言語だけ)"""
+        candidates = langs if stage is None else tier_langs[stage]
+        return [lang for lang in candidates if not all((lang, pos) in skip for pos in positions[u])]
+
+    async def run_cleanup(u: int, item: MenuItem) -> Dict[str, MenuItem]:
+        if (CLEANUP, u) in known_u:
+            return {CLEANUP: known_u[(CLEANUP, u)]}
+        cleaned = await remove_unnecessary_parts_async([item], api_key, max_concurrency=1)
+        return {CLEANUP: _checked(cleaned[0])}
+
+    async def run_ja_to_en(u: int, value: Any) -> Dict[str, MenuItem]:
+        previous = value if isinstance(value, dict) else {}
+        if (JA_TO_EN, u) in known_u:
+            return {**previous, JA_TO_EN: known_u[(JA_TO_EN, u)]}
+        english = await translate_japanese_to_english_async([_next_input(value)], api_key, persona, max_concurrency=1)
+        return {**previous, JA_TO_EN: _checked(english[0])}
+
+    async def run_cleanup_en(u: int, item: MenuItem) -> Dict[str, MenuItem]:
+        if (CLEANUP, u) in known_u and (JA_TO_EN, u) in known_u:
+            return {CLEANUP: known_u[(CLEANUP, u)], JA_TO_EN: known_u[(JA_TO_EN, u)]}
+        cleaned, english = await clean_and_translate_async([item], api_key, persona, max_concurrency=1)
+        return {CLEANUP: _checked(cleaned[0]), JA_TO_EN: _checked(english[0])}
+
+    # 生成・QC の LLM ラッパーは実行全体で1組 (item ごとに作り直さない)
+    engine = transcreation_engine(api_key, persona)
+
+    async def _transcreate(u: int, source: MenuItem, stage: str) -> Dict[str, MenuItem]:
+        """1 item の pending な言語を訳す。辞書にある言語は呼ばない (translate_english_to_many_stream と同じ)"""
+        results: Dict[str, MenuItem] = {}
+        item_langs = []
+        for lang in pending_langs(u, stage):
+            hit = dictionary_item(source, lang)
+            if hit is not None:
+                results[lang] = hit
+            else:
+                item_langs.append(lang)
+        if results:
+            record_dictionary_skip(TRANSCREATION, len(results))
+        if not item_langs:
+            return results
+        if engine_mode == "multilang":
+            generated = await engine.multilang(u, source, item_langs)
+            results.update({lang: generated[(lang, u)] for lang in item_langs if (lang, u) in generated})
+            return results
+        jobs = [(lang, (lambda lang=lang: engine.single(source, lang))) for lang in item_langs]
+        async for lang, res, _timings in iter_bounded(jobs, max_concurrency=max_concurrency):
+            results[lang] = MenuItem.create_error(f"{lang} Error: {res}") if isinstance(res, Exception) else res
+        return results
+
+    # transcreation の段は (英訳などの入力, {言語: 結果}) を返し、残りの言語の段は同じ入力を使う
+    async def run_transcreation(u: int, value: Any) -> Tuple[MenuItem, Dict[str, MenuItem]]:
+        source = _next_input(value, transcreation_source)
+        return source, await _transcreate(u, source, TRANSCREATION)
+
+    async def run_transcreation_rest(u: int, value: Tuple[MenuItem, Dict[str, MenuItem]]) -> Tuple[MenuItem, Dict[str, MenuItem]]:
+        source, _ = value
+        with call_priority(REST_PRIORITY):
+            return source, await _transcreate(u, source, TRANSCREATION_REST)
+
+    runners = {CLEANUP: run_cleanup, JA_TO_EN: run_ja_to_en, CLEANUP_EN: run_cleanup_en, TRANSCREATION: run_transcreation}
+    pipeline = [PipelineStage(stage, runners[stage], concurrency=limits[stage]) for stage in stages]
+
+    # 前段の結果も全言語も済んでいる item は流さない
+    work = [
+        (u, item) for u, item in enumerate(unique_items)
+        if pending_langs(u) or any((out, u) not in known_u for out in outputs)
+    ]
+
+    if tier_langs[TRANSCREATION_REST]:
+        # 残りの言語の段は枠を譲って待つことがあるので、優先言語の段がそれを待たずに進めるよう入力キューは全 item ぶん持つ
+        pipeline.append(PipelineStage(
+            TRANSCREATION_REST, run_transcreation_rest, concurrency=limits[TRANSCREATION_REST], queue_size=len(work),
+        ))
+
+    total_tasks = len(menu_items) * len(langs)
+    done_tasks = len({(lang, pos) for lang, pos in skip if lang in langs and pos < len(menu_items)})
+    remaining = remaining_by_language(langs, len(menu_items), skip)
+
+    def _events(stage: str, lang: str, u: int, result: MenuItem, timings: Dict[str, float]) -> List[TranslationEvent]:
+        nonlocal done_tasks
+        events = []
+        done = skip if stage == TRANSCREATION else known
+        group = [pos for pos in positions[u] if ((lang if stage == TRANSCREATION else stage), pos) not in done]
+        for n, pos in enumerate(group):
+            if stage == TRANSCREATION:
+                done_tasks += 1
+                remaining[lang] -= 1
+            events.append(TranslationEvent(
+                item_index=pos,
+                item_id=menu_items[pos].id,
+                lang=lang,
+                result=result if n == 0 else copy_for_position(result),
+                timings=timings,
+                done=done_tasks,
+                total=total_tasks,
+                stage=stage,
+                lang_done=stage == TRANSCREATION and remaining[lang] == 0,
+            ))
+        return events
+
+    async for u, stage, res, timings in iter_pipeline(work, pipeline):
+        if isinstance(res, Exception):
+            error = f"{TRANSCREATION if stage == TRANSCREATION_REST else stage} Error: {str(res)}"
+            for out in STAGE_OUTPUTS.get(stage, ()):
+                for event in _events(out, OUTPUT_LANGUAGES[out], u, MenuItem.create_error(error), timings):
+                    yield event
+            for lang in pending_langs(u, TRANSCREATION_REST if stage == TRANSCREATION_REST else None):
+                for event in _events(TRANSCREATION, lang, u, MenuItem.create_error(f"{lang} {error}"), timings):
+                    yield event
+        elif stage in (TRANSCREATION, TRANSCREATION_REST):
+            _source, results = res
+            for lang in pending_langs(u, stage):
+                result = results.get(lang) or MenuItem.create_error(f"{lang} Error: missing result")
+                for event in _events(TRANSCREATION, lang, u, result, timings):
+                    yield event
+        else:
+            for out in STAGE_OUTPUTS[stage]:
+                for event in _events(out, OUTPUT_LANGUAGES[out], u, res[out], timings):
+                    yield event
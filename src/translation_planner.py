@@ -0,0 +1,394 @@
+import os
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from .dedup import dedupe_items
+from .langchain_utils import (
+    BATCH_OUTPUT_TOKENS_PER_ITEM,
+    DEFAULT_BATCH_TOKEN_BUDGET,
+    ENGINE_MODES,
+    MAX_BATCH_ITEMS,
+    batch_cost,
+    dictionary_source_name,
+    get_llm,
+    qc_batch_prompt,
+    qc_multilang_prompt,
+    qc_prompt,
+    render_cleanup,
+    render_cleanup_en,
+    render_ja_to_en,
+    render_transcreation,
+    render_transcreation_batch,
+    render_transcreation_multilang,
+)
+from .llm_cache import get_default_cache
+from .menu_dictionary import entry_translation, lookup_menu
+from .model_routing import route
+from .models import MenuItem
+from .observability import estimate_cost_jpy
+from .qc_rules import get_qc_gate_stats
+from .rate_limiter import GEMINI_RPM, GEMINI_TPM
+from .key_pool import get_key_pool, shared_concurrency
+from .scheduler import DEFAULT_MAX_CONCURRENCY
+from .structured_output import schema_tokens
+from .token_estimator import estimate_tokens, split_by_token_budget
+from .translation_pipeline import pipelined_engine_mode
+
+# --------------------------------------------------------------------
+# Pre-flight Planner
+# --------------------------------------------------------------------
+# 翻訳ジョブを実行する前に、API 呼び出し回数・入出力トークン・費用 (円)・所要時間を見積もる。
+# 実行時と同じ関数でプロンプトを組み立ててローカルでトークンを数え、
+# 重複まとめ (dedup)・メニュー辞書・LLM キャッシュで LLM に行かない分を差し引く。
+
+# --------------------------------------------------------------------
+# Configuration
+# --------------------------------------------------------------------
+# 1呼び出しの所要時間 = BASE_LATENCY_SEC + 出力トークン / OUTPUT_TOKENS_PER_SEC
+BASE_LATENCY_SEC = float(os.getenv("PLANNER_BASE_LATENCY_SEC", "1.5"))
+OUTPUT_TOKENS_PER_SEC = float(os.getenv("PLANNER_OUTPUT_TOKENS_PER_SEC", "120"))
+# QC ゲートの実績が無いときに想定する LLM 監査率
+QC_AUDIT_RATE = float(os.getenv("PLANNER_QC_AUDIT_RATE", "0.3"))
+# パース失敗・QC 不合格による再生成の想定割合
+RETRY_RATE = float(os.getenv("PLANNER_RETRY_RATE", "0.05"))
+# 受け入れ判定の既定上限 (0 = 上限なし)
+MAX_COST_JPY = float(os.getenv("PLANNER_MAX_COST_JPY", "0"))
+MAX_WALL_SECONDS = float(os.getenv("PLANNER_MAX_WALL_SECONDS", "0"))
+
+QC_OUTPUT_TOKENS = 10  # "PASS" / 短い理由
+JSON_OUTPUT_OVERHEAD = 30
+
+# cleanup_en は cleanup + ja_to_en を1リクエストで行う (JA_EN_MODE="fused")
+STAGES = ("cleanup", "ja_to_en", "cleanup_en", "transcreation")
+
+
+@dataclass
+class StagePlan:
+    """1ステージぶんの見積もり。calls / tokens は期待値 (QC 監査率・再試行率を掛けたもの)"""
+    stage: str
+    model: str = ""             # カスケード1段目のモデル (費用はこのモデルの単価で計算)
+    tasks: int = 0              # item × 言語
+    unique_tasks: int = 0       # 重複まとめ後
+    dictionary_hits: int = 0
+    cache_hits: int = 0         # キャッシュから返るリクエスト数
+    calls: float = 0.0
+    input_tokens: float = 0.0
+    output_tokens: float = 0.0
+    cost_jpy: float = 0.0
+    wall_seconds: float = 0.0
+    bottleneck: str = ""
+    _latency_sum: float = field(default=0.0, repr=False)
+    _latency_max: float = field(default=0.0, repr=False)
+
+    def add_call(self, input_tokens: float, output_tokens: float, weight: float = 1.0):
+        """weight は発生確率 (QC 監査など)"""
+        latency = BASE_LATENCY_SEC + output_tokens / OUTPUT_TOKENS_PER_SEC
+        self.calls += weight
+        self.input_tokens += input_tokens * weight
+        self.output_tokens += output_tokens * weight
+        self._latency_sum += latency * weight
+        self._latency_max = max(self._latency_max, latency)
+
+    def to_dict(self) -> dict:
+        return {k: v for k, v in asdict(self).items() if not k.startswith("_")}
+
+
+@dataclass
+class TranslationPlan:
+    model: str
+    engine_mode: str
+    max_concurrency: int
+    stages: List[StagePlan]
+    pipelined: bool = False     # item ごとに次の段へ流す (translation_pipeline) か、段ごとに全件を待つか
+
+    @property
+    def calls(self) -> float:
+        return sum(s.calls for s in self.stages)
+
+    @property
+    def input_tokens(self) -> float:
+        return sum(s.input_tokens for s in self.stages)
+
+    @property
+    def output_tokens(self) -> float:
+        return sum(s.output_tokens for s in self.stages)
+
+    @property
+    def cost_jpy(self) -> float:
+        return sum(s.cost_jpy for s in self.stages)
+
+    @property
+    def wall_seconds(self) -> float:
+        if not self.pipelined or len(self.stages) < 2:
+            # ステージは直列に実行される
+            return sum(s.wall_seconds for s in self.stages)
+        # パイプラインでは一番遅い段が律速し、他の段は最初の item が通り抜けるぶん (1呼び出しの最大遅延) だけ足される
+        slowest = max(self.stages, key=lambda s: s.wall_seconds)
+        return slowest.wall_seconds + sum(s._latency_max for s in self.stages if s is not slowest and s.calls)
+
+    def admit(
+        self,
+        max_cost_jpy: Optional[float] = None,
+        max_wall_seconds: Optional[float] = None,
+        max_calls: Optional[float] = None,
+    ) -> Tuple[bool, str]:
+        """
+        自動受け入れ判定。上限を超えていれば (False, 理由) を返す。
+        省略時は PLANNER_MAX_COST_JPY / PLANNER_MAX_WALL_SECONDS (0 = 上限なし)。
+        """
+        max_cost_jpy = MAX_COST_JPY if max_cost_jpy is None else max_cost_jpy
+        max_wall_seconds = MAX_WALL_SECONDS if max_wall_seconds is None else max_wall_seconds
+        if max_cost_jpy and self.cost_jpy > max_cost_jpy:
+            return False, f"estimated cost {self.cost_jpy:.1f} JPY exceeds {max_cost_jpy:.1f} JPY"
+        if max_wall_seconds and self.wall_seconds > max_wall_seconds:
+            return False, f"estimated time {self.wall_seconds:.0f}s exceeds {max_wall_seconds:.0f}s"
+        if max_calls and self.calls > max_calls:
+            return False, f"estimated {self.calls:.0f} calls exceeds {max_calls:.0f}"
+        return True, ""
+
+    def to_dict(self) -> dict:
+        return {
+            "model": self.model,
+            "engine_mode": self.engine_mode,
+            "max_concurrency": self.max_concurrency,
+            "pipelined": self.pipelined,
+            "calls": self.calls,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cost_jpy": self.cost_jpy,
+            "wall_seconds": self.wall_seconds,
+            "stages": [s.to_dict() for s in self.stages],
+        }
+
+
+def _item_tokens(item: MenuItem) -> int:
+    return estimate_tokens(item.menu_title) + estimate_tokens(item.menu_content)
+
+
+def _dictionary_hit(item: MenuItem, lang: str) -> bool:
+    match = lookup_menu(dictionary_source_name(item), record=False)
+    return bool(match and entry_translation(match.entry, lang))
+
+
+def _is_cached(llm: Any, text: str) -> bool:
+    # キャッシュ無効時 (素のモデル) は cache_key を持たない
+    cache_key = getattr(llm, "cache_key", None) if llm is not None else None
+    return bool(cache_key and get_default_cache().contains(cache_key(text)))
+
+
+def _qc_audit_rate() -> float:
+    stats = get_qc_gate_stats()
+    return stats["llm_audit"] / stats["total"] if stats["total"] else QC_AUDIT_RATE
+
+
+def _prompt_tokens(rendered) -> int:
+    # JSON スキーマ経路 (LLM_STRUCTURED_OUTPUT=1) ならプロンプトと一緒に送るスキーマぶんも入力に数える
+    return rendered.prefix_tokens + rendered.suffix_tokens + schema_tokens(rendered.name)
+
+
+def _finish(stage: StagePlan, model: str, concurrency: int, rpm: int = GEMINI_RPM, tpm: int = GEMINI_TPM) -> StagePlan:
+    """再試行分を上乗せし、費用と所要時間 (同時実行数 / RPM / TPM のうち一番遅いもの) を出す"""
+    factor = 1.0 + RETRY_RATE
+    stage.calls *= factor
+    stage.input_tokens *= factor
+    stage.output_tokens *= factor
+    stage._latency_sum *= factor
+    stage.model = model
+    stage.cost_jpy = estimate_cost_jpy(model, stage.input_tokens, stage.output_tokens)
+
+    # トークンバケットは1分ぶん満タンで始まるので、超過分だけが待ちになる
+    bounds = {
+        "concurrency": max(stage._latency_sum / max(concurrency, 1), stage._latency_max),
+        "rpm": max(0.0, stage.calls - rpm) / max(rpm, 1) * 60,
+        "tpm": max(0.0, stage.input_tokens + stage.output_tokens - tpm) / max(tpm, 1) * 60,
+    }
+    stage.bottleneck, stage.wall_seconds = max(bounds.items(), key=lambda kv: kv[1])
+    if not stage.calls:
+        stage.bottleneck, stage.wall_seconds = "", 0.0
+    return stage
+
+
+def _plan_single_stage(stage_name: str, menu_items: Sequence[MenuItem], langs: Sequence[str], render, output_tokens, llm: Any) -> StagePlan:
+    """cleanup / ja_to_en / cleanup_en: 1 item = 1 リクエスト。langs の訳が全部辞書にあれば呼ばない"""
+    unique_items, _ = dedupe_items(menu_items)
+    stage = StagePlan(stage_name, tasks=len(menu_items), unique_tasks=len(unique_items))
+    for item in unique_items:
+        if all(_dictionary_hit(item, lang) for lang in langs):
+            stage.dictionary_hits += 1
+            continue
+        rendered = render(item)
+        if _is_cached(llm, rendered.text):
+            stage.cache_hits += 1
+            continue
+        stage.add_call(_prompt_tokens(rendered), output_tokens(item))
+    return stage
+
+
+def plan_cleanup(menu_items: Sequence[MenuItem], llm: Any = None) -> StagePlan:
+    return _plan_single_stage(
+        "cleanup", menu_items, ("Japanese",), render_cleanup,
+        lambda item: _item_tokens(item) + JSON_OUTPUT_OVERHEAD, llm,
+    )
+
+
+def plan_ja_to_en(menu_items: Sequence[MenuItem], persona: str, llm: Any = None) -> StagePlan:
+    # 英語は日本語より 3 割ほどトークンが増える想定
+    return _plan_single_stage(
+        "ja_to_en", menu_items, ("English",), lambda item: render_ja_to_en(item, persona),
+        lambda item: int(_item_tokens(item) * 1.3) + JSON_OUTPUT_OVERHEAD, llm,
+    )
+
+
+def plan_cleanup_en(menu_items: Sequence[MenuItem], persona: str, llm: Any = None) -> StagePlan:
+    # 出力は校正済み日本語 + 英訳 (ja と en の2オブジェクト)
+    return _plan_single_stage(
+        "cleanup_en", menu_items, ("Japanese", "English"), lambda item: render_cleanup_en(item, persona),
+        lambda item: int(_item_tokens(item) * 2.3) + 2 * JSON_OUTPUT_OVERHEAD, llm,
+    )
+
+
+def plan_transcreation(
+    menu_items: Sequence[MenuItem],
+    languages: Sequence[str],
+    persona: str,
+    engine_mode: str = "per_item",
+    batch_token_budget: int = DEFAULT_BATCH_TOKEN_BUDGET,
+    llm: Any = None,
+    skip: Optional[Set[Tuple[str, int]]] = None,
+) -> StagePlan:
+    """
+    translate_english_to_many_stream と同じ単位 (dedup → 辞書 → engine_mode ごとのジョブ分割) で見積もる。
+    QC は生成ごとに「LLM 監査に回る確率」を掛けて加算する (キャッシュヒットは QC もしない)。
+    """
+    if engine_mode not in ENGINE_MODES:
+        raise ValueError(f"Unknown engine_mode: {engine_mode} (expected one of {ENGINE_MODES})")
+    langs = list(languages)
+    skip = skip or set()
+    unique_items, positions = dedupe_items(menu_items)
+    stage = StagePlan("transcreation", tasks=len(menu_items) * len(langs), unique_tasks=len(unique_items) * len(langs))
+    audit = _qc_audit_rate()
+
+    pending: Dict[str, List[Tuple[int, MenuItem]]] = {lang: [] for lang in langs}
+    for u, item in enumerate(unique_items):
+        for lang in langs:
+            if all((lang, pos) in skip for pos in positions[u]):
+                continue
+            if _dictionary_hit(item, lang):
+                stage.dictionary_hits += 1
+                continue
+            pending[lang].append((u, item))
+
+    qc_single = _prompt_tokens(qc_prompt.render(
+        source_name="", source_desc="", target_language=langs[0] if langs else "", name="", description="", pairing="",
+    ))
+
+    def _single(item: MenuItem, lang: str):
+        rendered = render_transcreation(item.menu_title, item.menu_content, lang, persona)
+        if _is_cached(llm, rendered.text):
+            stage.cache_hits += 1
+            return
+        stage.add_call(_prompt_tokens(rendered), BATCH_OUTPUT_TOKENS_PER_ITEM)
+        stage.add_call(qc_single + _item_tokens(item) + BATCH_OUTPUT_TOKENS_PER_ITEM, QC_OUTPUT_TOKENS, weight=audit)
+
+    if engine_mode == "per_item":
+        for lang, entries in pending.items():
+            for _, item in entries:
+                _single(item, lang)
+
+    elif engine_mode == "batched":
+        qc_batch = _prompt_tokens(qc_batch_prompt.render(target_language=langs[0] if langs else "", items_json="[]"))
+        for lang, entries in pending.items():
+            for batch in split_by_token_budget(entries, batch_cost, batch_token_budget, MAX_BATCH_ITEMS):
+                if len(batch) == 1:
+                    _single(batch[0][1], lang)
+                    continue
+                rendered = render_transcreation_batch(batch, lang, persona)
+                if _is_cached(llm, rendered.text):
+                    stage.cache_hits += 1
+                    continue
+                stage.add_call(_prompt_tokens(rendered), BATCH_OUTPUT_TOKENS_PER_ITEM * len(batch))
+                # 1件でも監査に回れば1リクエスト。トークンは監査に回る件数の期待値ぶん
+                p_any = 1.0 - (1.0 - audit) ** len(batch)
+                if p_any:
+                    audited = audit * sum(_item_tokens(item) + BATCH_OUTPUT_TOKENS_PER_ITEM for _, item in batch)
+                    stage.add_call(qc_batch + audited / p_any, QC_OUTPUT_TOKENS * len(batch) * audit / p_any, weight=p_any)
+
+    else:  # multilang
+        qc_multi = _prompt_tokens(qc_multilang_prompt.render(source_name="", source_desc="", generated_json="{}"))
+        by_item: Dict[int, List[str]] = {}
+        for lang, entries in pending.items():
+            for u, _ in entries:
+                by_item.setdefault(u, []).append(lang)
+        for u, item_langs in by_item.items():
+            item = unique_items[u]
+            rendered = render_transcreation_multilang(item, item_langs, persona)
+            if _is_cached(llm, rendered.text):
+                stage.cache_hits += 1
+                continue
+            stage.add_call(_prompt_tokens(rendered), BATCH_OUTPUT_TOKENS_PER_ITEM * len(item_langs))
+            p_any = 1.0 - (1.0 - audit) ** len(item_langs)
+            if p_any:
+                audited = audit * len(item_langs) * BATCH_OUTPUT_TOKENS_PER_ITEM
+                stage.add_call(
+                    qc_multi + _item_tokens(item) + audited / p_any,
+                    QC_OUTPUT_TOKENS * len(item_langs) * audit / p_any,
+                    weight=p_any,
+                )
+    return stage
+
+
+def plan_translation(
+    menu_items: Sequence[MenuItem],
+    languages: Iterable[str],
+    api_key: Optional[str] = None,
+    persona: str = "標準 (丁寧)",
+    engine_mode: str = "per_item",
+    stages: Sequence[str] = ("transcreation",),
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    batch_token_budget: int = DEFAULT_BATCH_TOKEN_BUDGET,
+    skip: Optional[Set[Tuple[str, int]]] = None,
+    pipelined: bool = False,
+) -> TranslationPlan:
+    """
+    翻訳ジョブの事前見積もり (API 呼び出しなし)。
+
+    stages: "cleanup" / "ja_to_en" / "cleanup_en" / "transcreation" を実行順に指定する
+    (cleanup_en は cleanup + ja_to_en の代わりに使う)。
+    api_key を渡すと LLM キャッシュにある応答を呼び出し数から除く (無ければキャッシュは全ミス扱い)。
+    各ステージはモデルカスケード (model_routing) の1段目のモデルで見積もる (QC 不合格時の繰り上げは再試行率に含める)。
+    ja_to_en / cleanup_en の後の transcreation は英訳前の item で代用して見積もる (英文が未確定なのでキャッシュは見ない)。
+    skip は再開ジョブの完了済み (lang, item_index)。
+    pipelined=True は item ごとのパイプライン実行 (translation_pipeline) の所要時間で見積もる。
+    パイプラインでは "batched" を per_item で動かすので、見積もりも per_item になる (pipelined_engine_mode)。
+    """
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise ValueError(f"Unknown stages: {sorted(unknown)} (expected {STAGES})")
+    languages = list(languages)
+    if pipelined:
+        engine_mode = pipelined_engine_mode(engine_mode)
+    model = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+    # 実際の同時実行数は scheduler の上限と limiter の現在値の小さい方
+    # キープール (key_pool) があれば、外れていないキーの枠の合計で見積もる
+    concurrency = shared_concurrency(api_key, max_concurrency)
+    pool = get_key_pool(api_key)
+    rpm, tpm = pool.capacity() if pool is not None else (GEMINI_RPM, GEMINI_TPM)
+
+    planned = []
+    for name in stages:
+        # キャッシュキーはモデルごとなので、実行時と同じモデルのラッパーで引く
+        stage_model = route(name)
+        llm = get_llm(api_key, model=stage_model) if api_key else None
+        if name == "cleanup":
+            stage = plan_cleanup(menu_items, llm)
+        elif name == "ja_to_en":
+            stage = plan_ja_to_en(menu_items, persona, llm)
+        elif name == "cleanup_en":
+            stage = plan_cleanup_en(menu_items, persona, llm)
+        else:
+            stage = plan_transcreation(
+                menu_items, languages, persona, engine_mode, batch_token_budget,
+                llm=None if {"ja_to_en", "cleanup_en"} & set(stages) else llm, skip=skip,
+            )
+        planned.append(_finish(stage, stage_model, concurrency, rpm, tpm))
+    return TranslationPlan(model=model, engine_mode=engine_mode, max_concurrency=concurrency, stages=planned, pipelined=pipelined)
@@ -1,48 +1,117 @@
 import os
-import json
 import base64
-from typing import List, Optional
-from langchain_google_genai import ChatGoogleGenerativeAI
+from typing import Any, Callable, List, Optional
 from langchain_core.messages import HumanMessage
-from langchain_core.output_parsers import JsonOutputParser
-from .models import MenuItem, Price, PreviewItem, GenerateItemContent
+from .models import MenuItem, Price, PreviewItem, GenerateItemContent, ExtractedMenuItem, ExtractedPage, ExtractedPageItem
+from .observability import estimate_cost_jpy
+# LLM plumbing is shared with the Streamlit app (repo-root src/, on PYTHONPATH): one implementation, one set of fixes
+from src.llm_cache import with_cache, invalidate_cached, is_cache_hit
+from src.llm_pool import get_chat_model
+from src.rate_limiter import with_rate_limit
+from src.hedging import with_hedging
+from src.menu_dictionary import lookup_menu, entry_translation, record_dictionary_skip
+from src.model_routing import cascade, record_attempt
+from src.llm_json import parse_json, coerce_list
+from src.structured_output import OutputFormat, use_schema
+from src.token_estimator import estimate_tokens
 
 MODEL_NAME = "gemini-2.0-flash-exp" # Fast & Cheap
+PROMPT_VERSION = "phase1-extract-2" # Bump when prompts change (part of the LLM cache key)
 
-def get_llm():
+def get_llm(model: str = MODEL_NAME):
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
         raise ValueError("GEMINI_API_KEY not set")
-    return ChatGoogleGenerativeAI(
-        model=MODEL_NAME,
-        google_api_key=api_key,
-        temperature=0.2,
-        max_output_tokens=8192,
-    )
+    # Pooled per (key, model, temperature, max_tokens) and event loop: reuses keep-alive connections across requests
+    llm = get_chat_model(api_key, model, temperature=0.2, max_tokens=8192)
+    # Shared client-side rate limit + 429/5xx/deadline backoff, hedged when slow (LLM_HEDGE_ENABLED);
+    # identical image + prompt is served from the persistent cache
+    return with_cache(with_hedging(with_rate_limit(llm)), PROMPT_VERSION)
+
+# Output formats: the hand-written schema goes into the prompt, or (LLM_STRUCTURED_OUTPUT=1)
+# the same shape is sent as response_json_schema and the prompt only keeps a one-line note
+_SCHEMA_NOTE = "Output JSON matching the response schema."
+
+MENU_ITEMS_FORMAT = OutputFormat("extract_menu_items", List[ExtractedMenuItem], """
+JSON Schema:
+[
+  {
+    "name_ja": "string",
+    "price_val": 1000,
+    "price_raw": "1000 yen",
+    "category_ja": "string"
+  }
+]
+""", _SCHEMA_NOTE)
+
+FULL_PAGE_FORMAT = OutputFormat("full_page", ExtractedPage, """
+Output JSON Schema:
+{
+  "items": [
+    {
+      "name_ja_raw": "text",
+      "price_raw": "text",
+      "price_val": number,
+      "category_raw": "header inference",
+      "is_set": boolean,
+      "confidence": number (0.0-1.0)
+    }
+  ],
+  "meta": {
+    "layout_type": "list|grid|mixed",
+    "warnings": []
+  }
+}
+""", _SCHEMA_NOTE)
+
+async def _extract_json(msg: HumanMessage, is_empty: Callable[[Any], bool], fmt: OutputFormat, structured: bool, prompt: str) -> Any:
+    """
+    Vision model cascade (model_routing "vision"): the fast model reads the page first; the next model
+    is only called when the JSON doesn't parse or no items came back. Each attempt is recorded for tuning,
+    and each response against its output format (prompt tokens / parse failures per format, see structured_output).
+    """
+    models = cascade("vision")
+    for tier, model in enumerate(models):
+        llm = get_llm(model)
+        res = await llm.ainvoke([msg], **fmt.invoke_kwargs(structured))
+        usage = getattr(res, "usage_metadata", None) or {}
+        tokens_in, tokens_out = usage.get("input_tokens", 0) or 0, usage.get("output_tokens", 0) or 0
+        cost_jpy = estimate_cost_jpy(model, tokens_in, tokens_out)
+        last_tier = tier == len(models) - 1
+        counted = not is_cache_hit(res)
+        try:
+            data = parse_json(res.content)
+        except Exception:
+            if counted:
+                fmt.record(structured, estimate_tokens(prompt), ok=False)
+            invalidate_cached(llm, [msg])
+            record_attempt("vision", model, 0, 1, tier, tokens_in, tokens_out, cost_jpy)
+            if last_tier:
+                raise
+            continue
+        if counted:
+            fmt.record(structured, estimate_tokens(prompt), ok=not is_empty(data))
+        if is_empty(data) and not last_tier:
+            invalidate_cached(llm, [msg])
+            record_attempt("vision", model, 0, 1, tier, tokens_in, tokens_out, cost_jpy)
+            continue
+        record_attempt("vision", model, 1, 0, tier, tokens_in, tokens_out, cost_jpy)
+        return data
 
 async def extract_menu_items(image_bytes: bytes, mime_type: str) -> List[MenuItem]:
-    llm = get_llm()
-    
     # Base64 encode
     b64_image = base64.b64encode(image_bytes).decode("utf-8")
     
-    prompt = """
+    structured = use_schema()
+    prompt = f"""
     Extract menu items from the image.
     Rules:
     - Extract max 10 items.
     - Name (Japanese), Price (Number JPY), Category.
     - Output JSON list.
     - Ignore sets or drinks if main dishes are available.
-    
-    JSON Schema:
-    [
-      {
-        "name_ja": "string",
-        "price_val": 1000,
-        "price_raw": "1000 yen",
-        "category_ja": "string"
-      }
-    ]
+
+{MENU_ITEMS_FORMAT.prompt_text(structured)}
     """
     
     msg = HumanMessage(content=[
@@ -51,27 +120,18 @@ async def extract_menu_items(image_bytes: bytes, mime_type: str) -> List[MenuIte
     ])
     
     try:
-        res = await llm.ainvoke([msg])
-        # Simple parsing logic
-        content = res.content
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0]
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0]
-            
-        data = json.loads(content)
+        data = await _extract_json(msg, lambda data: not data, MENU_ITEMS_FORMAT, structured, prompt)
         
         items = []
-        for i, d in enumerate(data):
-            if i >= 10: break
+        for i, d in enumerate(coerce_list(data, ExtractedMenuItem)[:10]):
             items.append(MenuItem(
                 tmp_item_id=f"it_{i:02d}",
-                name_ja=d.get("name_ja", "Unknown"),
+                name_ja=d.name_ja,
                 price=Price(
-                    amount=d.get("price_val"),
-                    raw=d.get("price_raw", str(d.get("price_val", "")))
+                    amount=d.price_val,
+                    raw=d.price_raw if d.price_raw is not None else ("" if d.price_val is None else str(d.price_val))
                 ),
-                category_ja=d.get("category_ja", "Other")
+                category_ja=d.category_ja
             ))
         return items
     except Exception as e:
@@ -84,6 +144,21 @@ async def generate_preview_content(items: List[MenuItem], langs: List[str]) -> L
     results = []
     
     for item in items:
+        # Menu dictionary hit: use the curated English instead of generating it
+        match = lookup_menu(item.name_ja)
+        dict_en = entry_translation(match.entry, "English") if match else None
+        if dict_en:
+            record_dictionary_skip("preview_en")
+            name_en, review_en, pairing_en = dict_en
+            en = GenerateItemContent(name=name_en, review_18s=review_en, how_to_eat=None, pairing=pairing_en or None)
+        else:
+            en = GenerateItemContent(
+                name=item.name_ja, # Transliteration ideally
+                review_18s="[AI Sample] This dish maximizes the flavor of the ingredients. Provides great aroma and savory taste.",
+                how_to_eat="Eat while hot.",
+                pairing="Dry Sake"
+            )
+
         # Dummy content for demo stability
         results.append(PreviewItem(
             tmp_item_id=item.tmp_item_id,
@@ -93,12 +168,7 @@ async def generate_preview_content(items: List[MenuItem], langs: List[str]) -> L
                 how_to_eat="まずはそのまま、温かいうちにお召し上がりください。",
                 pairing="辛口の日本酒"
             ),
-            en=GenerateItemContent(
-                name=item.name_ja, # Transliteration ideally
-                review_18s="[AI Sample] This dish maximizes the flavor of the ingredients. Provides great aroma and savory taste.",
-                how_to_eat="Eat while hot.",
-                pairing="Dry Sake"
-            )
+            en=en
             # Add other langs as needed
         ))
     return results
@@ -110,30 +180,14 @@ async def extract_full_page(image_bytes: bytes, mime_type: str, page_no: int = 1
     """
     from .models import IntakeItem, PageMeta
     
-    llm = get_llm()
     b64_image = base64.b64encode(image_bytes).decode("utf-8")
     
-    prompt = """
+    structured = use_schema()
+    prompt = f"""
     Analyze this menu page fully.
     Task: Extract ALL food/drink items.
-    
-    Output JSON Schema:
-    {
-      "items": [
-        {
-          "name_ja_raw": "text",
-          "price_raw": "text",
-          "price_val": number,
-          "category_raw": "header inference",
-          "is_set": boolean,
-          "confidence": number (0.0-1.0)
-        }
-      ],
-      "meta": {
-        "layout_type": "list|grid|mixed",
-        "warnings": []
-      }
-    }
+
+{FULL_PAGE_FORMAT.prompt_text(structured)}
     Rules:
     - If price is ambiguous, set confidence lower.
     - Extract section headers as category_raw.
@@ -145,25 +199,18 @@ async def extract_full_page(image_bytes: bytes, mime_type: str, page_no: int = 1
     ])
     
     try:
-        res = await llm.ainvoke([msg])
-        content = res.content
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0]
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0]
-            
-        data = json.loads(content)
+        data = await _extract_json(msg, lambda data: not data.get("items"), FULL_PAGE_FORMAT, structured, prompt)
         
         items = []
-        for i, d in enumerate(data.get("items", [])):
+        for i, d in enumerate(coerce_list(data.get("items", []), ExtractedPageItem)):
             items.append(IntakeItem(
                 tmp_item_id=f"p{page_no}_i{i:03d}",
-                name_ja_raw=d.get("name_ja_raw", "Unknown"),
-                price_val=d.get("price_val"),
-                price_raw=d.get("price_raw", str(d.get("price_val", ""))),
-                category_raw=d.get("category_raw", "Uncategorized"),
-                is_set=d.get("is_set", False),
-                confidence=d.get("confidence", 0.9),
+                name_ja_raw=d.name_ja_raw,
+                price_val=d.price_val,
+                price_raw=d.price_raw if d.price_raw is not None else ("" if d.price_val is None else str(d.price_val)),
+                category_raw=d.category_raw,
+                is_set=d.is_set,
+                confidence=d.confidence,
                 source_page=page_no
             ))
             
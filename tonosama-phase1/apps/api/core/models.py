@@ -1,4 +1,5 @@
-from pydantic import BaseModel, Field
+import re
+from pydantic import BaseModel, Field, field_validator
 from typing import List, Optional, Dict, Literal, Any
 
 # --- Common ---
@@ -89,6 +90,47 @@ class IntakeItem(BaseModel):
     source_page: int = 1
     bbox: Optional[List[float]] = None # [ymin, xmin, ymax, xmax]
 
+# --- LLM Extraction (raw vision output, coerced leniently via llm_json.coerce_list) ---
+def _lenient_price(value: Any) -> Optional[int]:
+    """1000 / 1000.0 / "1,000円" / "¥1,000" -> 1000. Unreadable -> None"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    digits = re.sub(r"[^\d]", "", str(value).split(".")[0])
+    return int(digits) if digits else None
+
+def _lenient_text(value: Any) -> Optional[str]:
+    return None if value is None else str(value)
+
+class ExtractedMenuItem(BaseModel):
+    name_ja: str = "Unknown"
+    price_val: Optional[int] = None
+    price_raw: Optional[str] = None
+    category_ja: Optional[str] = "Other"
+
+    _parse_price = field_validator("price_val", mode="before")(_lenient_price)
+    _price_text = field_validator("price_raw", mode="before")(_lenient_text)
+
+class ExtractedPageItem(BaseModel):
+    name_ja_raw: str = "Unknown"
+    price_raw: Optional[str] = None
+    price_val: Optional[int] = None
+    category_raw: str = "Uncategorized"
+    is_set: bool = False
+    confidence: float = 0.9
+
+    _parse_price = field_validator("price_val", mode="before")(_lenient_price)
+    _price_text = field_validator("price_raw", mode="before")(_lenient_text)
+
+class ExtractedPageMeta(BaseModel):
+    layout_type: str = "unknown"
+    warnings: List[str] = []
+
+class ExtractedPage(BaseModel):
+    items: List[ExtractedPageItem] = []
+    meta: ExtractedPageMeta = ExtractedPageMeta()
+
 class PageMeta(BaseModel):
     page_no: int
     layout_type: str = "unknown" # list, grid, mixed
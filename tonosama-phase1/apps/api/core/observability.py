@@ -15,6 +15,12 @@ def ensure_log_dir():
         except:
             pass
 
+def estimate_cost_jpy(model: str, tokens_in: int, tokens_out: int) -> float:
+    # Simple cost calc (Flash approx: Input $0.10/1M, Output $0.40/1M) -> JPY
+    # $1 = 150 JPY
+    cost_usd = (tokens_in / 1_000_000 * 0.10) + (tokens_out / 1_000_000 * 0.40)
+    return cost_usd * 150
+
 def log_api_usage(
     tenant_id: str = "default",
     store_id: str = "unknown",
@@ -33,10 +39,7 @@ def log_api_usage(
     """
     ensure_log_dir()
     
-    # Simple cost calc (Flash approx: Input $0.10/1M, Output $0.40/1M) -> JPY
-    # $1 = 150 JPY
-    cost_usd = (tokens_in / 1_000_000 * 0.10) + (tokens_out / 1_000_000 * 0.40)
-    cost_jpy = cost_usd * 150
+    cost_jpy = estimate_cost_jpy(model, tokens_in, tokens_out)
     
     entry = {
         "timestamp": datetime.datetime.now().isoformat(),
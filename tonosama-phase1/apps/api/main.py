@@ -23,3 +23,38 @@ app.include_router(phase3.router)
 @app.get("/")
 def health_check():
     return {"status": "ok", "version": "2025.12.19"}
+
+from src.llm_pool import get_pool_stats, close_pool
+from src.menu_dictionary import get_dictionary_stats
+from src.hedging import get_hedge_stats
+from src.model_routing import get_routing_stats
+from src.llm_json import get_json_stats
+from src.structured_output import get_structured_stats
+
+@app.get("/metrics/llm-pool")
+def llm_pool_metrics():
+    return get_pool_stats()
+
+@app.get("/metrics/hedging")
+def hedging_metrics():
+    return get_hedge_stats()
+
+@app.get("/metrics/model-routing")
+def model_routing_metrics():
+    return get_routing_stats()
+
+@app.get("/metrics/json-repair")
+def json_repair_metrics():
+    return get_json_stats()
+
+@app.get("/metrics/structured-output")
+def structured_output_metrics():
+    return get_structured_stats()
+
+@app.get("/metrics/menu-dictionary")
+def menu_dictionary_metrics():
+    return get_dictionary_stats()
+
+@app.on_event("shutdown")
+def shutdown_llm_pool():
+    close_pool()